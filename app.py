@@ -1,6 +1,15 @@
 from flask import Flask, render_template, send_from_directory
 from database import init_database
+from services.search_index import ensure_search_index
+from services.data_version import ensure_data_version
+from services.suggestion_index import build_suggestion_index
+from services.similarity_service import refresh_dirty
+from services.person_bitmaps import ensure_video_changes, build_person_bitmaps
+from services.dashboard_cache import start_dashboard_refresh
+from services.analytics_engine import ensure_change_log, build_analytics_engine
+from services.face_registry import ensure_gallery_version
 from utils import ensure_instance_folders
+from http_cache import compress_response
 from services.task_queue import start_task_queue
 import os
 import atexit
@@ -14,13 +23,42 @@ ensure_instance_folders()
 if not os.path.exists(os.path.join('instance', 'database.db')):
     init_database()
 
+# Índice de texto completo (si SQLite incluye FTS5)
+ensure_search_index()
+
+# Versión de datos para los ETag de la API
+ensure_data_version()
+
+# Versión de la galería de rostros conocidos (invalida el registro de los workers)
+ensure_gallery_version()
+
+# Registro de cambios y columnas en memoria para la analítica
+ensure_change_log()
+build_analytics_engine()
+
+# Índice en memoria para las sugerencias de búsqueda
+build_suggestion_index()
+
+# Bitmaps de videos por persona para los filtros de personas (video_changes
+# les avisa de las escrituras de otros procesos)
+ensure_video_changes()
+build_person_bitmaps()
+
+# Completar videos similares pendientes (por ejemplo tras un cierre inesperado)
+refresh_dirty()
+
 # Inicializar cola de tareas
 start_task_queue()
 
+# Mantener actualizado en segundo plano el snapshot del dashboard
+start_dashboard_refresh()
+
 # Registrar función de limpieza al cerrar
 def cleanup():
     from services.task_queue import stop_task_queue
+    from services.dashboard_cache import stop_dashboard_refresh
     stop_task_queue()
+    stop_dashboard_refresh()
 
 atexit.register(cleanup)
 
@@ -41,6 +79,9 @@ app.register_blueprint(search_bp, url_prefix='/api/search')
 app.register_blueprint(reports_bp, url_prefix='/api/reports')
 app.register_blueprint(processing_bp, url_prefix='/api/processing')
 
+# Compresión gzip de las respuestas JSON grandes
+app.after_request(compress_response)
+
 @app.route('/')
 def index():
     return render_template('private/index.html')
@@ -0,0 +1,94 @@
+"""
+Benchmark del motor de analítica en memoria
+Compara las consultas SQL de AnalyticsService con las agregaciones
+vectorizadas sobre columnas NumPy, y mide la carga inicial y el refresco
+incremental después de reprocesar videos.
+
+Uso: python benchmarks/benchmark_analytics_engine.py [num_videos]
+(cada video sintético tiene 3 apariciones; el valor por defecto da ~1M)
+"""
+
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark_text_search import build_library
+
+REPEAT = 5
+
+def timed(function, *args):
+    t0 = time.perf_counter()
+    for _ in range(REPEAT):
+        result = function(*args)
+    return (time.perf_counter() - t0) / REPEAT * 1000, result
+
+def main():
+    num_videos = int(sys.argv[1]) if len(sys.argv) > 1 else 350_000
+    random.seed(7)
+
+    print(f"📊 Benchmark de analítica en memoria ({num_videos * 3} apariciones)")
+    print("=" * 90)
+
+    t0 = time.perf_counter()
+    build_library(num_videos)
+    print(f"Biblioteca sintética creada en {time.perf_counter() - t0:.1f}s")
+
+    from services.data_version import ensure_data_version
+    from services import analytics_engine
+    from services.analytics_service import AnalyticsService
+    from services.appearance_store import store_video_analysis
+
+    ensure_data_version()
+    analytics_engine.ensure_change_log()
+    if not analytics_engine.NUMPY_AVAILABLE:
+        print("NumPy no está instalado: no hay motor en memoria que comparar")
+        return
+
+    engine = analytics_engine.get_analytics_engine()
+    t0 = time.perf_counter()
+    engine.load()
+    print(f"Carga inicial en {time.perf_counter() - t0:.2f}s\n")
+
+    cases = [
+        ('total de apariciones', AnalyticsService._get_total_appearances),
+        ('top 5 personas', lambda: AnalyticsService._get_top_persons(5)),
+        ('patrón por hora', AnalyticsService.get_hourly_appearance_pattern),
+        ('métricas de procesamiento', AnalyticsService.get_processing_metrics),
+    ]
+
+    print(f"{'consulta':<28} | {'SQL (ms)':>10} | {'memoria (ms)':>12} | {'x':>7}")
+    for name, function in cases:
+        engine.loaded = False
+        sql_ms, _ = timed(function)
+        engine.loaded = True
+        memory_ms, _ = timed(function)
+        print(f"{name:<28} | {sql_ms:10.2f} | {memory_ms:12.3f} | {sql_ms / memory_ms:7.1f}")
+
+    memory_ms, _ = timed(engine.person_percentiles)
+    print(f"{'percentiles por persona':<28} | {'-':>10} | {memory_ms:12.3f} |")
+    memory_ms, _ = timed(engine.screen_time_distribution)
+    print(f"{'distribución de duración':<28} | {'-':>10} | {memory_ms:12.3f} |")
+
+    print("\nRefresco incremental tras reprocesar videos")
+    print(f"{'videos':>8} | {'escritura (ms)':>14} | {'refresco (ms)':>13} | {'recarga (ms)':>12}")
+    for count in (1, 10, 100):
+        t0 = time.perf_counter()
+        for video_id in random.sample(range(1, num_videos + 1), count):
+            segments = {random.randint(1, 50): [(0.0, random.uniform(1, 30))] for _ in range(3)}
+            store_video_analysis(video_id, segments, '{}')
+        write_ms = (time.perf_counter() - t0) * 1000
+
+        t0 = time.perf_counter()
+        engine.refresh()
+        refresh_ms = (time.perf_counter() - t0) * 1000
+
+        t0 = time.perf_counter()
+        engine.load()
+        load_ms = (time.perf_counter() - t0) * 1000
+        print(f"{count:>8} | {write_ms:14.1f} | {refresh_ms:13.1f} | {load_ms:12.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Benchmark de filtros y agrupaciones por fecha de subida
+Compara las consultas con funciones sobre uploaded_at (DATE, strftime) contra
+los rangos sobre uploaded_epoch y las claves de día/semana/mes indexadas,
+mostrando el plan de cada una.
+
+Uso: python benchmarks/benchmark_date_filters.py [num_videos]
+"""
+
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark_text_search import build_library
+from database import execute_query
+
+REPEAT = 5
+
+CASES = [
+    (
+        'rango de un mes',
+        """
+            SELECT id FROM videos
+            WHERE DATE(uploaded_at) >= '2020-03-01' AND DATE(uploaded_at) <= '2020-03-31'
+        """,
+        """
+            SELECT id FROM videos
+            WHERE uploaded_epoch >= CAST(strftime('%s', '2020-03-01') AS INTEGER)
+              AND uploaded_epoch < CAST(strftime('%s', '2020-03-31', '+1 day') AS INTEGER)
+        """
+    ),
+    (
+        'subidas por mes (12)',
+        """
+            SELECT strftime('%Y-%m', uploaded_at) as month, COUNT(*) as count
+            FROM videos
+            WHERE strftime('%Y-%m', uploaded_at) >= strftime('%Y-%m', '2024-12-31', '-12 months')
+            GROUP BY strftime('%Y-%m', uploaded_at)
+            ORDER BY month
+        """,
+        """
+            SELECT upload_month as month, COUNT(*) as count
+            FROM videos
+            WHERE upload_month >= strftime('%Y-%m', '2024-12-31', '-12 months')
+            GROUP BY upload_month
+            ORDER BY month
+        """
+    ),
+    (
+        'apariciones por semana',
+        """
+            SELECT strftime('%Y-%W', v.uploaded_at) as week, COUNT(va.id) as appearances
+            FROM video_appearances va
+            JOIN videos v ON va.video_id = v.id
+            WHERE strftime('%Y-%W', v.uploaded_at) >= strftime('%Y-%W', '2024-12-31', '-84 days')
+            GROUP BY strftime('%Y-%W', v.uploaded_at)
+            ORDER BY week
+        """,
+        """
+            SELECT v.upload_week as week, COUNT(va.id) as appearances
+            FROM videos v
+            JOIN video_appearances va ON va.video_id = v.id
+            WHERE v.upload_week >= strftime('%Y-%W', '2024-12-31', '-84 days')
+            GROUP BY v.upload_week
+            ORDER BY week
+        """
+    ),
+    (
+        'patrón diario',
+        """
+            SELECT DATE(uploaded_at) as period, COUNT(*) as video_count
+            FROM videos
+            GROUP BY DATE(uploaded_at)
+            ORDER BY period DESC
+        """,
+        """
+            SELECT upload_day as period, COUNT(*) as video_count
+            FROM videos
+            GROUP BY upload_day
+            ORDER BY period DESC
+        """
+    ),
+]
+
+def timed(query):
+    t0 = time.perf_counter()
+    for _ in range(REPEAT):
+        rows = execute_query(query, fetch_all=True)
+    return (time.perf_counter() - t0) / REPEAT * 1000, [tuple(row) for row in rows]
+
+def plan(query):
+    rows = execute_query("EXPLAIN QUERY PLAN " + query, fetch_all=True)
+    return ' / '.join(row['detail'] for row in rows)
+
+def main():
+    num_videos = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    random.seed(7)
+
+    print(f"📅 Benchmark de filtros por fecha ({num_videos} videos)")
+    print("=" * 90)
+
+    t0 = time.perf_counter()
+    build_library(num_videos)
+    print(f"Biblioteca sintética creada en {time.perf_counter() - t0:.1f}s\n")
+
+    for name, old_query, new_query in CASES:
+        old_ms, old_rows = timed(old_query)
+        new_ms, new_rows = timed(new_query)
+        same = '✓' if old_rows == new_rows else '✗'
+        print(f"{name:<24} | funciones {old_ms:9.2f} ms | indexado {new_ms:9.2f} ms | x{old_ms / new_ms:6.1f} | {same}")
+        print(f"    antes:   {plan(old_query)}")
+        print(f"    después: {plan(new_query)}")
+
+if __name__ == "__main__":
+    main()
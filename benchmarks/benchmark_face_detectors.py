@@ -0,0 +1,141 @@
+"""
+Benchmark de los detectores de rostros (services/face_detectors.py)
+Compara velocidad por frame y recall de cada perfil:
+
+- Clips sintéticos: las fotos de instance/faces pegadas a distintas escalas
+  sobre fondos con ruido; se conoce la caja real de cada rostro.
+- Clips grabados (rutas como argumentos): sin etiquetas, el recall se mide
+  contra el detector de referencia (HOG con upsample=1) en los mismos frames.
+
+Uso: python benchmarks/benchmark_face_detectors.py [video1.mp4 video2.mp4 ...]
+"""
+
+import os
+import sys
+import glob
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+import numpy as np
+
+from services.face_detectors import DETECTOR_PROFILES, FACE_RECOGNITION_AVAILABLE, get_detector
+
+FACES_FOLDER = os.path.join('instance', 'faces')
+SYNTHETIC_FRAMES = 60
+FRAME_SIZE = (800, 450)
+SAMPLE_EVERY = 15
+MAX_RECORDED_FRAMES = 120
+MIN_IOU = 0.3
+
+def iou(a, b):
+    top, right = max(a[0], b[0]), min(a[1], b[1])
+    bottom, left = min(a[2], b[2]), max(a[3], b[3])
+    if right <= left or bottom <= top:
+        return 0.0
+    inter = (right - left) * (bottom - top)
+    area = lambda box: (box[1] - box[3]) * (box[2] - box[0])
+    return inter / float(area(a) + area(b) - inter)
+
+def synthetic_frames(photos):
+    """[(frame_rgb, [cajas reales])] con 1-3 rostros por frame"""
+    width, height = FRAME_SIZE
+    frames = []
+    for _ in range(SYNTHETIC_FRAMES):
+        frame = np.random.randint(0, 255, (height, width, 3), dtype=np.uint8)
+        frame = cv2.GaussianBlur(frame, (0, 0), 6)
+        truth = []
+        for photo in random.sample(photos, min(len(photos), random.randint(1, 3))):
+            size = random.randint(60, 200)
+            face = cv2.resize(photo, (size, int(size * photo.shape[0] / photo.shape[1])))
+            h, w = face.shape[:2]
+            if h >= height or w >= width:
+                continue
+            top, left = random.randint(0, height - h), random.randint(0, width - w)
+            if any(iou((top, left + w, top + h, left), box) > 0 for box in truth):
+                continue
+            frame[top:top + h, left:left + w] = face
+            truth.append((top, left + w, top + h, left))
+        frames.append((frame, truth))
+    return frames
+
+def recorded_frames(path):
+    video = cv2.VideoCapture(path)
+    frames = []
+    frame_number = 0
+    while len(frames) < MAX_RECORDED_FRAMES:
+        ret, frame = video.read()
+        if not ret:
+            break
+        if frame_number % SAMPLE_EVERY == 0:
+            height, width = frame.shape[:2]
+            if width > FRAME_SIZE[0]:
+                frame = cv2.resize(frame, (FRAME_SIZE[0], int(height * FRAME_SIZE[0] / width)))
+            frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+        frame_number += 1
+    video.release()
+    return frames
+
+def run(detector, frames):
+    t0 = time.perf_counter()
+    detections = [detector.detect(frame) for frame in frames]
+    return (time.perf_counter() - t0) / max(len(frames), 1) * 1000, detections
+
+def recall(detections, truths):
+    found = total = 0
+    for boxes, truth in zip(detections, truths):
+        total += len(truth)
+        found += sum(1 for box in truth if any(iou(box, other) >= MIN_IOU for other in boxes))
+    return found / total if total else 1.0
+
+def compare(title, frames, truths=None):
+    print(f"\n{title} ({len(frames)} frames)")
+    print(f"{'perfil':<10} | {'backend':<9} | {'ms/frame':>9} | {'rostros':>7} | {'recall':>7}")
+
+    results = {}
+    for profile, options in DETECTOR_PROFILES.items():
+        try:
+            detector = get_detector(profile)
+        except RuntimeError as e:
+            print(f"{profile:<10} | {options['backend']:<9} | {e}")
+            continue
+        results[profile] = (options['backend'],) + run(detector, frames)
+
+    if truths is None:
+        # Sin etiquetas: la referencia es HOG con upsample=1
+        reference = results.get('accurate')
+        truths = reference[2] if reference else None
+
+    for profile, (backend, ms, detections) in results.items():
+        faces = sum(len(d) for d in detections)
+        rate = f"{recall(detections, truths):7.1%}" if truths is not None else f"{'-':>7}"
+        print(f"{profile:<10} | {backend:<9} | {ms:9.2f} | {faces:7d} | {rate}")
+
+def main():
+    random.seed(7)
+    np.random.seed(7)
+
+    print("🔍 Benchmark de detectores de rostros")
+    print("=" * 60)
+    if not FACE_RECOGNITION_AVAILABLE:
+        print("face_recognition no está instalado: solo se mide la cascada Haar")
+
+    photos = []
+    for path in glob.glob(os.path.join(FACES_FOLDER, '*')):
+        image = cv2.imread(path)
+        if image is not None:
+            photos.append(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+
+    if photos:
+        frames = synthetic_frames(photos)
+        compare("Clips sintéticos", [f for f, _ in frames], [t for _, t in frames])
+    else:
+        print(f"No hay fotos en {FACES_FOLDER}: se omiten los clips sintéticos")
+
+    for path in sys.argv[1:]:
+        compare(f"Clip grabado: {os.path.basename(path)} (referencia: HOG)", recorded_frames(path))
+
+if __name__ == "__main__":
+    main()
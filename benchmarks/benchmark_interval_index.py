@@ -0,0 +1,78 @@
+"""
+Benchmark del índice de intervalos para consultas "¿quién está en pantalla?"
+Compara el índice contra el filtrado lineal de todos los segmentos del video.
+
+Uso: python benchmarks/benchmark_interval_index.py
+"""
+
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.interval_index import VideoIntervalIndex
+
+QUERIES = 2000
+
+def generate_segments(count, duration):
+    segments = []
+    for i in range(count):
+        start = random.uniform(0, duration)
+        # La mayoría de segmentos son cortos, unos pocos muy largos
+        length = random.expovariate(1 / 4.0) if random.random() < 0.98 else random.uniform(60, 900)
+        segments.append({
+            'id': i,
+            'person_id': random.randint(1, 200),
+            'person_name': f'Persona {i % 200}',
+            'start_time': start,
+            'end_time': min(start + length, duration)
+        })
+    return segments
+
+def linear_query(segments, start, end):
+    return [s for s in segments if s['start_time'] <= end and s['end_time'] >= start]
+
+def bench(segment_count):
+    duration = 4 * 3600
+    segments = generate_segments(segment_count, duration)
+    
+    t0 = time.perf_counter()
+    index = VideoIntervalIndex(segments)
+    build_ms = (time.perf_counter() - t0) * 1000
+    
+    queries = []
+    for _ in range(QUERIES):
+        start = random.uniform(0, duration)
+        end = start if random.random() < 0.5 else start + random.uniform(1, 120)
+        queries.append((start, end))
+    
+    matches = 0
+    t0 = time.perf_counter()
+    for start, end in queries:
+        matches += len(index.query(start, end))
+    index_us = (time.perf_counter() - t0) / QUERIES * 1e6
+    
+    t0 = time.perf_counter()
+    for start, end in queries[:200]:
+        linear_query(segments, start, end)
+    linear_us = (time.perf_counter() - t0) / 200 * 1e6
+    
+    for start, end in queries[:50]:
+        expected = sorted(s['id'] for s in linear_query(segments, start, end))
+        assert sorted(s['id'] for s in index.query(start, end)) == expected
+    
+    print(f"{segment_count:>8} segmentos | construcción {build_ms:8.1f} ms | "
+          f"índice {index_us:8.1f} µs/consulta | lineal {linear_us:10.1f} µs/consulta | "
+          f"x{linear_us / index_us:6.1f} | {matches / QUERIES:6.1f} resultados/consulta")
+
+def main():
+    random.seed(42)
+    print("⏱️  Benchmark de índice de intervalos")
+    print("=" * 100)
+    for count in (1_000, 10_000, 50_000, 200_000):
+        bench(count)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Benchmark de búsqueda de videos por varias personas
+Compara la consulta SQL (IN + GROUP BY ... HAVING) con los bitmaps en memoria.
+
+Uso: python benchmarks/benchmark_person_bitmaps.py [num_videos]
+"""
+
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark_text_search import build_library
+
+REPEAT = 5
+
+def timed(function, *args):
+    t0 = time.perf_counter()
+    for _ in range(REPEAT):
+        result = function(*args)
+    return (time.perf_counter() - t0) / REPEAT * 1000, result
+
+def main():
+    num_videos = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    random.seed(7)
+
+    print(f"🧮 Benchmark de bitmaps por persona ({num_videos} videos)")
+    print("=" * 90)
+
+    t0 = time.perf_counter()
+    build_library(num_videos)
+    print(f"Biblioteca sintética creada en {time.perf_counter() - t0:.1f}s")
+
+    from database import execute_query
+    from services.person_bitmaps import get_person_bitmaps
+
+    t0 = time.perf_counter()
+    bitmaps = get_person_bitmaps()
+    bitmaps.build()
+    print(f"Bitmaps construidos en {(time.perf_counter() - t0) * 1000:.0f} ms\n")
+
+    # Las personas con más apariciones son el peor caso para la consulta SQL
+    popular = [row['person_id'] for row in execute_query("""
+        SELECT person_id FROM video_appearances GROUP BY person_id ORDER BY COUNT(*) DESC LIMIT 50
+    """, fetch_all=True)]
+
+    def sql_query(person_ids, mode):
+        placeholders = ','.join('?' * len(person_ids))
+        having = f"HAVING COUNT(DISTINCT person_id) = {len(person_ids)}" if mode == 'AND' else ''
+        rows = execute_query(f"""
+            SELECT video_id FROM video_appearances
+            WHERE person_id IN ({placeholders})
+            GROUP BY video_id {having}
+        """, person_ids, fetch_all=True)
+        return sorted(row['video_id'] for row in rows)
+
+    def bitmap_query(person_ids, mode):
+        if mode == 'AND':
+            return bitmaps.query(all_of=person_ids)
+        return bitmaps.query(any_of=person_ids)
+
+    print(f"{'personas':>8} | {'modo':<4} | {'SQL (ms)':>9} | {'bitmaps (ms)':>12} | {'x':>6} | resultados")
+    for count in (2, 5, 20, 50):
+        for mode in ('AND', 'OR'):
+            person_ids = popular[:count]
+            sql_ms, expected = timed(sql_query, person_ids, mode)
+            bitmap_ms, found = timed(bitmap_query, person_ids, mode)
+            assert sorted(found) == expected
+            print(f"{count:>8} | {mode:<4} | {sql_ms:9.2f} | {bitmap_ms:12.3f} | {sql_ms / bitmap_ms:6.1f} | {len(found)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Benchmark de búsqueda por texto: consultas LIKE frente al índice FTS5,
+y sugerencias frente al índice de prefijos en memoria.
+Crea una biblioteca sintética en una base de datos temporal.
+
+Uso: python benchmarks/benchmark_text_search.py [num_videos]
+"""
+
+import os
+import sys
+import time
+import random
+import sqlite3
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+
+WORDS = ['boda', 'cumpleaños', 'viaje', 'playa', 'montaña', 'reunion', 'familia', 'trabajo',
+         'navidad', 'fiesta', 'graduacion', 'concierto', 'partido', 'escuela', 'vacaciones',
+         'abuela', 'perro', 'gato', 'cena', 'parque', 'museo', 'lago', 'nieve', 'ciudad']
+FIRST_NAMES = ['Juan', 'María', 'Pedro', 'Lucía', 'Carlos', 'Ana', 'José', 'Sofía', 'Diego', 'Elena',
+               'Miguel', 'Paula', 'Andrés', 'Rosa', 'Jorge', 'Carmen', 'Luis', 'Valeria']
+LAST_NAMES = ['García', 'Pérez', 'López', 'Sánchez', 'Ramírez', 'Torres', 'Flores', 'Rivera',
+              'Gómez', 'Díaz', 'Castro', 'Vargas', 'Rojas', 'Mendoza', 'Ortiz', 'Silva']
+QUERIES = ['playa', 'garcía', 'boda familia', 'zzz', 'sofía', 'navidad', 'concierto 2021']
+REPEAT = 5
+
+def build_library(num_videos):
+    tmp = tempfile.mkdtemp()
+    database.DATABASE_PATH = os.path.join(tmp, 'benchmark.db')
+    
+    conn = sqlite3.connect(database.DATABASE_PATH)
+    with open(os.path.join('setup', 'schema_database.sql'), encoding='utf-8') as f:
+        conn.executescript(f.read())
+    
+    persons = [(f"{random.choice(FIRST_NAMES)} {random.choice(LAST_NAMES)} {i}", 'x.jpg')
+               for i in range(max(50, num_videos // 50))]
+    conn.executemany("INSERT INTO persons (name, photo_path) VALUES (?, ?)", persons)
+    
+    videos = []
+    for i in range(num_videos):
+        name = '_'.join(random.sample(WORDS, 2)) + f"_{random.randint(2015, 2024)}_{i}.mp4"
+        videos.append((f"{i}.mp4", name, f"/videos/{i}.mp4", random.uniform(30, 3600), 1,
+                       f"{random.randint(2015, 2024)}-{random.randint(1, 12):02d}-{random.randint(1, 28):02d} 12:00:00"))
+    conn.executemany("""
+        INSERT INTO videos (filename, original_filename, file_path, duration, processed, uploaded_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, videos)
+    
+    appearances = []
+    for video_id in range(1, num_videos + 1):
+        for person_id in random.sample(range(1, len(persons) + 1), 3):
+            start = random.uniform(0, 1000)
+            appearances.append((video_id, person_id, start, start + random.uniform(1, 30)))
+    conn.executemany("INSERT INTO video_appearances (video_id, person_id, start_time, end_time) VALUES (?, ?, ?, ?)",
+                     appearances)
+    
+    tags = [(random.randint(1, num_videos), random.choice(WORDS)) for _ in range(num_videos // 2)]
+    conn.executemany("INSERT INTO video_tags (video_id, tag) VALUES (?, ?)", tags)
+    conn.commit()
+    conn.close()
+
+def timed(function, *args):
+    t0 = time.perf_counter()
+    for _ in range(REPEAT):
+        result = function(*args)
+    return (time.perf_counter() - t0) / REPEAT * 1000, len(result)
+
+def main():
+    num_videos = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    random.seed(7)
+    
+    print(f"🔍 Benchmark de búsqueda por texto ({num_videos} videos)")
+    print("=" * 90)
+    
+    t0 = time.perf_counter()
+    build_library(num_videos)
+    print(f"Biblioteca sintética creada en {time.perf_counter() - t0:.1f}s")
+    
+    from services import search_index
+    from services.advanced_search_service import AdvancedSearchService
+    
+    t0 = time.perf_counter()
+    if not search_index.ensure_search_index():
+        print("❌ Esta instalación de SQLite no incluye FTS5")
+        return
+    print(f"Índice FTS5 construido en {time.perf_counter() - t0:.1f}s\n")
+    
+    print(f"{'consulta':<18} | {'LIKE (ms)':>10} | {'FTS5 (ms)':>10} | {'x':>7} | resultados LIKE/FTS")
+    for query in QUERIES:
+        like_ms, like_count = timed(AdvancedSearchService._search_by_text_like, query)
+        fts_ms, fts_count = timed(AdvancedSearchService.search_by_text, query)
+        print(f"{query:<18} | {like_ms:10.2f} | {fts_ms:10.2f} | {like_ms / fts_ms:7.1f} | {like_count}/{fts_count}")
+    
+    # Primero LIKE y FTS5: una vez construido el índice en memoria, get_search_suggestions lo usa
+    prefixes = ('pl', 'gar', 'so', 'con')
+    timings = {prefix: (timed(AdvancedSearchService._get_search_suggestions_like, prefix, 10)[0],
+                        timed(AdvancedSearchService.get_search_suggestions, prefix, 10)[0])
+               for prefix in prefixes}
+    
+    from services.suggestion_index import get_suggestion_index
+    index = get_suggestion_index()
+    index.build()
+    
+    print(f"\n{'sugerencias':<18} | {'LIKE (ms)':>10} | {'FTS5 (ms)':>10} | {'memoria (ms)':>12} | {'x':>7}")
+    for prefix in prefixes:
+        like_ms, fts_ms = timings[prefix]
+        memory_ms, _ = timed(index.suggest, prefix, 10)
+        print(f"{prefix:<18} | {like_ms:10.2f} | {fts_ms:10.2f} | {memory_ms:12.3f} | {like_ms / memory_ms:7.1f}")
+    
+    stats = index.get_stats()
+    print(f"\nÍndice en memoria: {stats['memory_bytes'] / 1024 / 1024:.1f} MB, construido en {stats['build_ms']:.0f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify
 from werkzeug.utils import secure_filename
 from models import Person, Notification
+from http_cache import versioned
 import os
 import uuid
 
@@ -13,6 +14,7 @@ def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 @faces_bp.route('/', methods=['GET'])
+@versioned
 def get_all_faces():
     persons = Person.get_all()
     result = []
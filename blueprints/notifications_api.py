@@ -1,28 +1,32 @@
 from flask import Blueprint, request, jsonify
 from models import Notification
+from streaming import stream_json_array, parse_fields
+from http_cache import versioned
 
 notifications_bp = Blueprint('notifications', __name__)
 
 @notifications_bp.route('/', methods=['GET'])
+@versioned
 def get_notifications():
     unread_only = request.args.get('unread_only', 'false').lower() == 'true'
-    notifications = Notification.get_all(unread_only=unread_only)
+    fields = parse_fields(request.args.get('fields'))
     
-    result = []
-    for notif in notifications:
-        result.append({
-            'id': notif['id'],
-            'type': notif['type'],
-            'title': notif['title'],
-            'message': notif['message'],
-            'icon': notif['icon'],
-            'read': bool(notif['read']),
-            'created_at': notif['created_at']
-        })
+    def generate():
+        for notif in Notification.iter_all(unread_only=unread_only):
+            yield {
+                'id': notif['id'],
+                'type': notif['type'],
+                'title': notif['title'],
+                'message': notif['message'],
+                'icon': notif['icon'],
+                'read': bool(notif['read']),
+                'created_at': notif['created_at']
+            }
     
-    return jsonify(result)
+    return stream_json_array(generate(), fields)
 
 @notifications_bp.route('/unread-count', methods=['GET'])
+@versioned
 def get_unread_count():
     count = Notification.get_unread_count()
     return jsonify({'count': count})
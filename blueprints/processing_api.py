@@ -1,8 +1,11 @@
 from flask import Blueprint, request, jsonify
 from services.task_queue import get_task_queue
 from services.emotion_detection_service import get_emotion_service
+from services.detection_store import face_detections_from_analysis, get_quality_totals
+from services.face_detectors import is_valid_detector, list_detectors
 from models import Video, Notification
 from datetime import datetime
+from http_cache import versioned
 import json
 
 processing_bp = Blueprint('processing', __name__)
@@ -18,8 +21,12 @@ def process_video_async(video_id):
     if not video:
         return jsonify({'error': 'Video no encontrado'}), 404
     
+    detector = (request.get_json(silent=True) or {}).get('detector')
+    if not is_valid_detector(detector):
+        return jsonify({'error': f'Detector desconocido: {detector}'}), 400
+    
     # Agregar tarea a la cola
-    task_id = queue.add_video_processing_task(video_id)
+    task_id = queue.add_video_processing_task(video_id, detector)
     
     return jsonify({
         'message': 'Video agregado a la cola de procesamiento',
@@ -37,6 +44,10 @@ def process_batch_async():
     if not video_ids:
         return jsonify({'error': 'Lista de video_ids requerida'}), 400
     
+    detector = data.get('detector')
+    if not is_valid_detector(detector):
+        return jsonify({'error': f'Detector desconocido: {detector}'}), 400
+    
     # Verificar que todos los videos existen
     valid_videos = []
     for video_id in video_ids:
@@ -48,7 +59,7 @@ def process_batch_async():
         return jsonify({'error': 'Ningún video válido encontrado'}), 400
     
     queue = get_task_queue()
-    task_id = queue.add_batch_processing_task(valid_videos)
+    task_id = queue.add_batch_processing_task(valid_videos, detector)
     
     return jsonify({
         'message': f'Lote de {len(valid_videos)} videos agregado a la cola',
@@ -86,6 +97,25 @@ def get_processing_status():
     
     return jsonify(status)
 
+@processing_bp.route('/detectors', methods=['GET'])
+def get_face_detectors():
+    """Perfiles y backends de detección de rostros disponibles"""
+    return jsonify(list_detectors())
+
+@processing_bp.route('/quality-stats', methods=['GET'])
+@versioned
+def get_face_quality_stats():
+    """Totales del filtro de calidad sobre todos los videos procesados"""
+    return jsonify(get_quality_totals())
+
+@processing_bp.route('/tasks/<task_id>', methods=['GET'])
+def get_processing_task(task_id):
+    """Estado, intentos y resultado de una tarea"""
+    task = get_task_queue().get_task(task_id)
+    if not task:
+        return jsonify({'error': 'Tarea no encontrada'}), 404
+    return jsonify(task)
+
 @processing_bp.route('/queue/results', methods=['GET'])
 def get_processing_results():
     """Obtener resultados de tareas completadas"""
@@ -121,16 +151,17 @@ def analyze_video_emotions(video_id):
         return jsonify({'error': 'Video no encontrado'}), 404
     
     # Verificar que el video esté procesado
-    if not video.get('processed'):
+    if not video['processed']:
         return jsonify({'error': 'Video debe estar procesado primero'}), 400
     
     try:
         emotion_service = get_emotion_service()
         
-        # Obtener detecciones faciales del análisis previo
-        analysis_result = video.get('analysis_result')
+        # Obtener detecciones faciales del análisis previo: cada segmento
+        # trae el frame y la caja de su detección representativa
+        analysis_result = video['analysis_result']
         if analysis_result:
-            face_detections = json.loads(analysis_result).get('faces', [])
+            face_detections = face_detections_from_analysis(json.loads(analysis_result))
         else:
             face_detections = []
         
@@ -153,6 +184,7 @@ def analyze_video_emotions(video_id):
         return jsonify({'error': f'Error analizando emociones: {str(e)}'}), 500
 
 @processing_bp.route('/emotions/person/<int:person_id>/stats', methods=['GET'])
+@versioned
 def get_person_emotion_stats(person_id):
     """Obtener estadísticas de emociones para una persona"""
     try:
@@ -165,6 +197,7 @@ def get_person_emotion_stats(person_id):
         return jsonify({'error': f'Error obteniendo estadísticas: {str(e)}'}), 500
 
 @processing_bp.route('/emotions/video/<int:video_id>', methods=['GET'])
+@versioned
 def get_video_emotions(video_id):
     """Obtener datos de emociones de un video específico"""
     from database import execute_query
@@ -203,7 +236,7 @@ def health_check():
     return jsonify({
         'queue_running': queue.running,
         'queue_workers': len(queue.workers),
-        'pending_tasks': queue.task_queue.qsize(),
+        'pending_tasks': queue.pending_count(),
         'emotion_model_loaded': emotion_service.model_loaded,
         'timestamp': datetime.now().isoformat()
     })
\ No newline at end of file
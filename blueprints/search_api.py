@@ -1,8 +1,9 @@
 from flask import Blueprint, request, jsonify, send_file
 from services.search_service import (
     search_videos_by_person, 
+    parse_cursor,
     get_person_statistics, 
-    get_all_persons_statistics,
+    iter_all_persons_statistics,
     get_co_appearance_matrix
 )
 from services.report_service import (
@@ -14,6 +15,11 @@ from services.analytics_service import AnalyticsService
 from services.advanced_search_service import AdvancedSearchService
 from services.task_queue import get_task_queue
 from services.emotion_detection_service import get_emotion_service
+from services.suggestion_index import get_suggestion_index
+from services.dashboard_cache import get_dashboard_cache
+from services.analytics_engine import get_analytics_engine
+from streaming import stream_json_array, parse_fields
+from http_cache import versioned
 import os
 import uuid
 
@@ -21,11 +27,18 @@ search_bp = Blueprint('search', __name__)
 reports_bp = Blueprint('reports', __name__)
 
 @search_bp.route('/person/<int:person_id>', methods=['GET'])
+@versioned
 def search_by_person(person_id):
-    result = search_videos_by_person(person_id)
+    after = parse_cursor(request.args.get('after'))
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 200)
+    
+    result = search_videos_by_person(person_id, after, limit)
+    if not result:
+        return jsonify({'error': 'Persona no encontrada'}), 404
     return jsonify(result)
 
 @search_bp.route('/statistics/person/<int:person_id>', methods=['GET'])
+@versioned
 def get_person_stats(person_id):
     stats = get_person_statistics(person_id)
     if not stats:
@@ -33,64 +46,117 @@ def get_person_stats(person_id):
     return jsonify(stats)
 
 @search_bp.route('/statistics/all', methods=['GET'])
+@versioned
 def get_all_stats():
-    stats = get_all_persons_statistics()
-    return jsonify(stats)
+    fields = parse_fields(request.args.get('fields'))
+    return stream_json_array(iter_all_persons_statistics(), fields)
 
 @search_bp.route('/co-appearances', methods=['GET'])
+@versioned
 def get_co_appearances():
-    matrix = get_co_appearance_matrix()
+    format_type = request.args.get('format', 'dense')
+    top_k = request.args.get('top_k', type=int)
+    matrix = get_co_appearance_matrix(format_type, top_k)
     return jsonify(matrix)
 
 # Nuevos endpoints de Analytics
 @search_bp.route('/dashboard/stats', methods=['GET'])
+@versioned
 def get_dashboard_stats():
     stats = AnalyticsService.get_dashboard_stats()
     return jsonify(stats)
 
+@search_bp.route('/dashboard/cache', methods=['GET'])
+def get_dashboard_cache_stats():
+    stats = get_dashboard_cache().get_stats()
+    return jsonify(stats)
+
 @search_bp.route('/analytics/person/<int:person_id>/timeline', methods=['GET'])
+@versioned
 def get_person_timeline(person_id):
     days = request.args.get('days', 30, type=int)
     timeline = AnalyticsService.get_person_timeline(person_id, days)
     return jsonify(timeline)
 
 @search_bp.route('/analytics/co-appearances', methods=['GET'])
+@versioned
 def get_co_appearance_analytics():
-    stats = AnalyticsService.get_co_appearance_stats()
+    limit = request.args.get('limit', 20, type=int)
+    stats = AnalyticsService.get_co_appearance_stats(limit)
+    return jsonify(stats)
+
+@search_bp.route('/analytics/co-appearances/video/<int:video_id>', methods=['GET'])
+@versioned
+def get_video_co_appearance_analytics(video_id):
+    stats = AnalyticsService.get_video_co_appearances(video_id)
     return jsonify(stats)
 
 @search_bp.route('/analytics/processing', methods=['GET'])
+@versioned
 def get_processing_metrics():
     metrics = AnalyticsService.get_processing_metrics()
     return jsonify(metrics)
 
 @search_bp.route('/analytics/patterns/hourly', methods=['GET'])
+@versioned
 def get_hourly_patterns():
     patterns = AnalyticsService.get_hourly_appearance_pattern()
     return jsonify(patterns)
 
+@search_bp.route('/analytics/screen-time', methods=['GET'])
+@versioned
+def get_screen_time_distribution():
+    bins = min(max(request.args.get('bins', 20, type=int), 1), 200)
+    person_id = request.args.get('person_id', type=int)
+    distribution = AnalyticsService.get_screen_time_distribution(bins, person_id)
+    if distribution is None:
+        return jsonify({'error': 'Analítica en memoria no disponible'}), 503
+    return jsonify(distribution)
+
+@search_bp.route('/analytics/persons/percentiles', methods=['GET'])
+@versioned
+def get_person_percentiles():
+    percentiles = AnalyticsService.get_person_percentiles()
+    if percentiles is None:
+        return jsonify({'error': 'Analítica en memoria no disponible'}), 503
+    return jsonify(percentiles)
+
+@search_bp.route('/analytics/engine', methods=['GET'])
+def get_analytics_engine_stats():
+    stats = get_analytics_engine().get_stats()
+    return jsonify(stats)
+
 # Endpoints de Búsqueda Avanzada
+def _search_results_response(rows):
+    """Resultados de búsqueda en streaming; analysis_result sólo con ?include=analysis o en fields"""
+    fields = parse_fields(request.args.get('fields'))
+    include = parse_fields(request.args.get('include')) or set()
+    omit = () if 'analysis' in include else ('analysis_result',)
+    return stream_json_array((dict(row) for row in rows), fields, omit)
+
 @search_bp.route('/advanced', methods=['POST'])
 def advanced_search():
     filters = request.get_json() or {}
-    results = AdvancedSearchService.advanced_search(filters)
-    return jsonify(results)
+    return _search_results_response(AdvancedSearchService.iter_advanced_search(filters))
 
 @search_bp.route('/text', methods=['GET'])
+@versioned
 def search_by_text():
     query = request.args.get('q', '')
     if not query:
         return jsonify({'error': 'Query parameter required'}), 400
     
     results = AdvancedSearchService.search_by_text(query)
-    return jsonify(results)
+    return _search_results_response(results)
 
 @search_bp.route('/similar/<int:video_id>', methods=['GET'])
+@versioned
 def search_similar_videos(video_id):
     results = AdvancedSearchService.search_similar_videos(video_id)
-    return jsonify(results)
+    return _search_results_response(results)
 
 @search_bp.route('/suggestions', methods=['GET'])
+@versioned
 def get_search_suggestions():
     partial_text = request.args.get('text', '')
     limit = request.args.get('limit', 10, type=int)
@@ -98,13 +164,20 @@ def get_search_suggestions():
     suggestions = AdvancedSearchService.get_search_suggestions(partial_text, limit)
     return jsonify(suggestions)
 
+@search_bp.route('/suggestions/stats', methods=['GET'])
+def get_search_suggestions_stats():
+    stats = get_suggestion_index().get_stats()
+    return jsonify(stats)
+
 @search_bp.route('/tags/popular', methods=['GET'])
+@versioned
 def get_popular_tags():
     limit = request.args.get('limit', 20, type=int)
     tags = AdvancedSearchService.get_popular_tags(limit)
     return jsonify(tags)
 
 @search_bp.route('/date-range', methods=['GET'])
+@versioned
 def get_date_range_info():
     stats = AdvancedSearchService.get_date_range_stats()
     return jsonify(stats)
@@ -2,7 +2,13 @@ from flask import Blueprint, request, jsonify, send_file
 from werkzeug.utils import secure_filename
 from models import Video, VideoAppearance, Notification
 from services.video_processor import process_video
-from utils import get_video_duration
+from services.appearance_store import remove_video, resmooth_video
+from services.interval_index import get_interval_index_cache
+from services import presence_service, detection_store
+from services.face_detectors import is_valid_detector
+from utils import get_video_duration, parse_time, format_time
+from streaming import stream_json_array, parse_fields
+from http_cache import versioned
 import os
 import uuid
 import json
@@ -16,26 +22,32 @@ def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 @videos_bp.route('/', methods=['GET'])
+@versioned
 def get_all_videos():
-    videos = Video.get_all()
-    result = []
-    for video in videos:
-        video_data = {
-            'id': video['id'],
-            'filename': video['filename'],
-            'original_filename': video['original_filename'],
-            'duration': video['duration'],
-            'processed': bool(video['processed']),
-            'uploaded_at': video['uploaded_at'],
-            'processed_at': video['processed_at']
-        }
-        
-        if video['processed'] and video['analysis_result']:
-            video_data['analysis'] = json.loads(video['analysis_result'])
-        
-        result.append(video_data)
+    # ?fields=id,original_filename proyecta los campos; el análisis sólo se
+    # lee y se envía si se pide (?include=analysis o 'analysis' en fields)
+    fields = parse_fields(request.args.get('fields'))
+    include = parse_fields(request.args.get('include')) or set()
+    with_analysis = 'analysis' in include or (fields is not None and 'analysis' in fields)
     
-    return jsonify(result)
+    def generate():
+        for video in Video.iter_all(with_analysis=with_analysis):
+            video_data = {
+                'id': video['id'],
+                'filename': video['filename'],
+                'original_filename': video['original_filename'],
+                'duration': video['duration'],
+                'processed': bool(video['processed']),
+                'uploaded_at': video['uploaded_at'],
+                'processed_at': video['processed_at']
+            }
+            
+            if with_analysis and video['processed'] and video['analysis_result']:
+                video_data['analysis'] = json.loads(video['analysis_result'])
+            
+            yield video_data
+    
+    return stream_json_array(generate(), fields)
 
 @videos_bp.route('/', methods=['POST'])
 def upload_video():
@@ -79,11 +91,15 @@ def process_video_route(video_id):
     if video['processed']:
         return jsonify({'error': 'El video ya fue procesado'}), 400
     
+    detector = (request.get_json(silent=True) or {}).get('detector')
+    if not is_valid_detector(detector):
+        return jsonify({'error': f'Detector desconocido: {detector}'}), 400
+    
     print(f"\n🎬 Solicitud de procesamiento recibida para video ID: {video_id}")
     print(f"   Nombre archivo: {video['original_filename']}")
     
     try:
-        result = process_video(video_id, video['file_path'])
+        result = process_video(video_id, video['file_path'], detector=detector)
         print(f"✓ Procesamiento completado exitosamente\n")
         
         person_count = len(result)
@@ -98,6 +114,36 @@ def process_video_route(video_id):
         Notification.create('error', 'Error de Procesamiento', f'Falló el procesamiento de {video["original_filename"]}', '❌')
         return jsonify({'error': f'Error al procesar video: {str(e)}'}), 500
 
+@videos_bp.route('/<int:video_id>/resmooth', methods=['POST'])
+def resmooth_video_route(video_id):
+    """
+    Recalcular los segmentos desde las detecciones guardadas, sin decodificar el video
+    JSON: threshold, min_length, max_distance (false la quita), preview (no guarda)
+    """
+    data = request.get_json(silent=True) or {}
+    parameters = {}
+    for name in ('threshold', 'min_length', 'max_distance'):
+        value = data.get(name)
+        if value is None or (name == 'max_distance' and value is False):
+            parameters[name] = value
+            continue
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            return jsonify({'error': f'"{name}" debe ser numérico'}), 400
+        if value < 0:
+            return jsonify({'error': f'"{name}" no puede ser negativo'}), 400
+        parameters[name] = value
+    
+    video = Video.get_by_id(video_id)
+    if not video:
+        return jsonify({'error': 'Video no encontrado'}), 404
+    
+    result = resmooth_video(video_id, save=not data.get('preview', False), **parameters)
+    if result is None:
+        return jsonify({'error': 'El video no tiene detecciones guardadas; procéselo de nuevo'}), 409
+    return jsonify(result)
+
 @videos_bp.route('/<int:video_id>', methods=['DELETE'])
 def delete_video(video_id):
     video = Video.get_by_id(video_id)
@@ -109,13 +155,13 @@ def delete_video(video_id):
     if os.path.exists(video_path):
         os.remove(video_path)
     
-    VideoAppearance.delete_by_video(video_id)
-    Video.delete(video_id)
+    remove_video(video_id)
     Notification.create('warning', 'Video Eliminado', f'Se eliminó {video_name}', '🗑️')
     
     return jsonify({'message': 'Video eliminado correctamente'})
 
 @videos_bp.route('/<int:video_id>/appearances', methods=['GET'])
+@versioned
 def get_video_appearances(video_id):
     appearances = VideoAppearance.get_by_video(video_id)
     result = []
@@ -128,3 +174,109 @@ def get_video_appearances(video_id):
             'end_time': appearance['end_time']
         })
     return jsonify(result)
+
+@videos_bp.route('/<int:video_id>/appearances/<int:appearance_id>/detections', methods=['GET'])
+@versioned
+def get_appearance_detections(video_id, appearance_id):
+    """Detecciones (frame, caja, distancia) que forman un segmento, para recortar sin redetectar"""
+    appearance = next((a for a in VideoAppearance.get_by_video(video_id) if a['id'] == appearance_id), None)
+    if not appearance:
+        return jsonify({'error': 'Aparición no encontrada'}), 404
+    
+    stored = detection_store.load_detections(video_id)
+    if stored is None:
+        return jsonify({'error': 'El video no tiene detecciones guardadas; procéselo de nuevo'}), 409
+    
+    detections = detection_store.segment_detections(
+        stored, appearance['person_id'], appearance['start_time'], appearance['end_time']
+    )
+    return jsonify({
+        'appearance_id': appearance_id,
+        'person_id': appearance['person_id'],
+        'start_time': appearance['start_time'],
+        'end_time': appearance['end_time'],
+        'detections': detections
+    })
+
+@videos_bp.route('/<int:video_id>/processing-stats', methods=['GET'])
+@versioned
+def get_video_processing_stats(video_id):
+    """Rostros detectados, codificados, descartados y diferidos en el último procesamiento"""
+    stats = detection_store.get_processing_stats(video_id)
+    if stats is None:
+        return jsonify({'error': 'El video no tiene estadísticas de procesamiento'}), 404
+    return jsonify(stats)
+
+@videos_bp.route('/<int:video_id>/on-screen', methods=['GET'])
+@versioned
+def get_persons_on_screen(video_id):
+    """
+    Personas visibles en un instante (?at=00:10:00) o en un rango
+    (?start=00:10:00&end=00:12:00). Acepta HH:MM:SS o segundos.
+    """
+    at = parse_time(request.args.get('at'))
+    start = parse_time(request.args.get('start'))
+    end = parse_time(request.args.get('end'))
+    
+    if at is not None:
+        start = end = at
+    elif start is None or end is None:
+        return jsonify({'error': 'Se requiere "at" o "start" y "end"'}), 400
+    
+    if start > end:
+        return jsonify({'error': '"start" debe ser menor o igual que "end"'}), 400
+    
+    index = get_interval_index_cache().get(video_id)
+    if index is None:
+        return jsonify({'error': 'Video no encontrado'}), 404
+    
+    segments = index.query(start, end)
+    
+    persons = {}
+    for segment in segments:
+        person = persons.setdefault(segment['person_id'], {
+            'person_id': segment['person_id'],
+            'person_name': segment['person_name'],
+            'segments': []
+        })
+        person['segments'].append({
+            'id': segment['id'],
+            'start_time': segment['start_time'],
+            'end_time': segment['end_time']
+        })
+    
+    return jsonify({
+        'video_id': video_id,
+        'start': start,
+        'end': end,
+        'start_formatted': format_time(start),
+        'end_formatted': format_time(end),
+        'persons': list(persons.values()),
+        'total_segments': len(segments)
+    })
+
+@videos_bp.route('/<int:video_id>/heatmap', methods=['GET'])
+@versioned
+def get_video_heatmap(video_id):
+    """Segundos en pantalla por persona en bloques de ?bucket= segundos (10 por defecto)"""
+    bucket = min(max(request.args.get('bucket', 10, type=int), 1), 3600)
+    heatmap = presence_service.get_heatmap(video_id, bucket)
+    if heatmap is None:
+        return jsonify({'error': 'Video sin apariciones'}), 404
+    return jsonify(heatmap)
+
+@videos_bp.route('/<int:video_id>/presence', methods=['GET'])
+@versioned
+def get_video_presence(video_id):
+    """Cobertura de ?persons=1,2 y segundos en que coinciden en pantalla"""
+    try:
+        person_ids = [int(value) for value in request.args.get('persons', '').split(',') if value.strip()]
+    except ValueError:
+        return jsonify({'error': '"persons" debe ser una lista de ids'}), 400
+    if not person_ids:
+        return jsonify({'error': 'Se requiere "persons"'}), 400
+    
+    presence = presence_service.get_presence(video_id, person_ids)
+    if presence is None:
+        return jsonify({'error': 'Video sin apariciones'}), 404
+    return jsonify(presence)
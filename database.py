@@ -3,6 +3,8 @@ import os
 from contextlib import contextmanager
 
 DATABASE_PATH = os.path.join('instance', 'database.db')
+# Segundos que una conexión espera a que se libere un bloqueo de escritura
+BUSY_TIMEOUT = 5.0
 
 def init_database():
     os.makedirs('instance', exist_ok=True)
@@ -18,7 +20,7 @@ def init_database():
 
 @contextmanager
 def get_db():
-    conn = sqlite3.connect(DATABASE_PATH)
+    conn = sqlite3.connect(DATABASE_PATH, timeout=BUSY_TIMEOUT)
     conn.row_factory = sqlite3.Row
     try:
         yield conn
@@ -41,3 +43,17 @@ def execute_query(query, params=(), fetch_one=False, fetch_all=False, commit=Fal
             return cursor.fetchall()
         
         return None
+
+def iter_query(query, params=(), batch_size=500):
+    """
+    Generador de filas leídas por lotes con fetchmany; la conexión se cierra
+    al agotarlo o al cerrarse el generador (por ejemplo si el cliente corta)
+    """
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
@@ -0,0 +1,74 @@
+"""
+Caché HTTP de la API: ETag por versión de datos y compresión gzip.
+
+@versioned responde 304 sin ejecutar la vista si el cliente ya tiene la
+versión actual (If-None-Match). Como las respuestas llevan
+Cache-Control: no-cache, el navegador revalida solo en cada sondeo y el
+JavaScript recibe el cuerpo guardado sin cambios.
+
+compress_response comprime con gzip los cuerpos JSON grandes, también los
+que se envían en streaming.
+"""
+from flask import request, make_response
+from functools import wraps
+from datetime import date
+from services.data_version import get_data_version
+import zlib
+import gzip
+
+MIN_GZIP_SIZE = 2048
+GZIP_LEVEL = 6
+
+def current_etag():
+    # El día forma parte de la etiqueta porque algunas respuestas dependen
+    # de ventanas relativas a la fecha actual (últimos 7 días, 12 meses...)
+    return f"{get_data_version()}-{date.today().isoformat()}"
+
+def versioned(view):
+    """Decorador para vistas GET cuyo resultado sólo depende de la base de datos"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        etag = current_etag()
+        if request.if_none_match.contains_weak(etag):
+            response = make_response('', 304)
+        else:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+        
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    
+    return wrapper
+
+def _gzip_stream(chunks):
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def compress_response(response):
+    """after_request: gzip para respuestas JSON grandes si el cliente lo acepta"""
+    if (response.status_code != 200
+            or response.mimetype != 'application/json'
+            or 'Content-Encoding' in response.headers
+            or 'gzip' not in request.headers.get('Accept-Encoding', '').lower()):
+        return response
+    
+    if response.is_streamed:
+        response.response = _gzip_stream(response.response)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < MIN_GZIP_SIZE:
+            return response
+        response.set_data(gzip.compress(data, GZIP_LEVEL))
+    
+    response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    return response
@@ -1,9 +1,29 @@
 """
 Script de migración para agregar nuevas funcionalidades
 - Columna emotion_analysis en la tabla videos
+- Tabla person_stats con estadísticas por persona mantenidas incrementalmente
+- Tabla co_appearances con la matriz de co-apariciones materializada
+- Tabla co_appearance_overlaps con el solapamiento temporal por video
+- Índices para paginar por fecha de subida los videos de una persona
+- Índice FTS5 search_index para búsqueda por texto y sugerencias
+- Columnas resumen de apariciones en videos para la búsqueda avanzada
+- Fecha de subida como epoch y claves de día/semana/mes con sus índices
+- Tabla video_neighbors con los videos similares precalculados
+- Tabla data_version con triggers para los ETag de la API
+- Tablas daily_uploads y daily_person_stats con los totales por día
+- Tabla analytics_changes con el registro de cambios de la analítica en memoria
+- Tabla presence_bitmaps con la presencia por persona y segundo de cada video
+- Tabla video_detections con las detecciones, frames, cajas y estadísticas
+  de calidad de cada video
+- Tabla gallery_version con triggers sobre persons para la galería de rostros
+- Tabla tasks para la cola de tareas durable (con tareas hijas de los lotes)
+- Tabla video_changes con triggers para los bitmaps de personas en memoria
+- Tabla person_videos con los videos de cada persona ordenados por fecha de subida
 """
 
 from database import execute_query
+from models import Video, DailyStats, PersonVideos
+from services import overlap_service, search_index, similarity_service, data_version, analytics_engine, presence_service, face_registry, task_store, person_bitmaps
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -16,6 +36,370 @@ def migrate_database():
             'description': 'Agregar columna emotion_analysis a videos',
             'sql': 'ALTER TABLE videos ADD COLUMN emotion_analysis TEXT',
             'check': "PRAGMA table_info(videos)"
+        },
+        {
+            'description': 'Crear tabla person_stats',
+            'sql': """
+                CREATE TABLE IF NOT EXISTS person_stats (
+                    person_id INTEGER PRIMARY KEY,
+                    total_videos INTEGER NOT NULL DEFAULT 0,
+                    total_appearances INTEGER NOT NULL DEFAULT 0,
+                    total_screen_time REAL NOT NULL DEFAULT 0,
+                    last_seen TIMESTAMP,
+                    FOREIGN KEY (person_id) REFERENCES persons(id) ON DELETE CASCADE
+                )
+            """
+        },
+        {
+            'description': 'Crear índice de person_stats por tiempo en pantalla',
+            'sql': 'CREATE INDEX IF NOT EXISTS idx_person_stats_screen_time ON person_stats(total_screen_time)'
+        },
+        {
+            'description': 'Poblar person_stats desde video_appearances',
+            'sql': """
+                INSERT OR REPLACE INTO person_stats
+                    (person_id, total_videos, total_appearances, total_screen_time, last_seen)
+                SELECT va.person_id, COUNT(DISTINCT va.video_id), COUNT(*),
+                       SUM(va.end_time - va.start_time), MAX(v.uploaded_at)
+                FROM video_appearances va
+                JOIN videos v ON va.video_id = v.id
+                GROUP BY va.person_id
+            """
+        },
+        {
+            'description': 'Crear tabla co_appearances',
+            'sql': """
+                CREATE TABLE IF NOT EXISTS co_appearances (
+                    person_a INTEGER NOT NULL,
+                    person_b INTEGER NOT NULL,
+                    video_count INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (person_a, person_b),
+                    FOREIGN KEY (person_a) REFERENCES persons(id) ON DELETE CASCADE,
+                    FOREIGN KEY (person_b) REFERENCES persons(id) ON DELETE CASCADE
+                )
+            """
+        },
+        {
+            'description': 'Crear índice de co_appearances por segunda persona',
+            'sql': 'CREATE INDEX IF NOT EXISTS idx_co_appearances_b ON co_appearances(person_b)'
+        },
+        {
+            'description': 'Poblar co_appearances con un único self-join agrupado',
+            'sql': """
+                INSERT OR REPLACE INTO co_appearances (person_a, person_b, video_count)
+                SELECT a.person_id, b.person_id, COUNT(*)
+                FROM (SELECT DISTINCT video_id, person_id FROM video_appearances) a
+                JOIN (SELECT DISTINCT video_id, person_id FROM video_appearances) b
+                    ON a.video_id = b.video_id AND a.person_id < b.person_id
+                GROUP BY a.person_id, b.person_id
+            """
+        },
+        {
+            'description': 'Crear tabla co_appearance_overlaps',
+            'sql': """
+                CREATE TABLE IF NOT EXISTS co_appearance_overlaps (
+                    video_id INTEGER NOT NULL,
+                    person_a INTEGER NOT NULL,
+                    person_b INTEGER NOT NULL,
+                    overlap_seconds REAL NOT NULL DEFAULT 0,
+                    shared_segments INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (video_id, person_a, person_b),
+                    FOREIGN KEY (video_id) REFERENCES videos(id) ON DELETE CASCADE
+                )
+            """
+        },
+        {
+            'description': 'Crear índice de co_appearance_overlaps por pareja',
+            'sql': 'CREATE INDEX IF NOT EXISTS idx_co_appearance_overlaps_pair ON co_appearance_overlaps(person_a, person_b)'
+        },
+        {
+            'description': 'Calcular solapamientos de los videos existentes',
+            'function': overlap_service.rebuild_all
+        },
+        {
+            'description': 'Crear índice de apariciones por video y persona',
+            'sql': 'CREATE INDEX IF NOT EXISTS idx_video_appearances_video_person ON video_appearances(video_id, person_id)'
+        },
+        {
+            'description': 'Crear índice de videos por fecha de subida',
+            'sql': 'CREATE INDEX IF NOT EXISTS idx_videos_uploaded ON videos(uploaded_at, id)'
+        },
+        {
+            'description': 'Crear índice de texto completo search_index',
+            'function': search_index.ensure_search_index
+        },
+        {
+            'description': 'Agregar columna appearance_count a videos',
+            'sql': 'ALTER TABLE videos ADD COLUMN appearance_count INTEGER NOT NULL DEFAULT 0'
+        },
+        {
+            'description': 'Agregar columna unique_persons a videos',
+            'sql': 'ALTER TABLE videos ADD COLUMN unique_persons INTEGER NOT NULL DEFAULT 0'
+        },
+        {
+            'description': 'Agregar columna persons_list a videos',
+            'sql': 'ALTER TABLE videos ADD COLUMN persons_list TEXT'
+        },
+        {
+            'description': 'Calcular columnas resumen de los videos existentes',
+            'function': Video.refresh_all_summaries
+        },
+        {
+            'description': 'Crear índice de videos por número de apariciones',
+            'sql': 'CREATE INDEX IF NOT EXISTS idx_videos_appearance_count ON videos(appearance_count)'
+        },
+        {
+            'description': 'Crear índice de videos por personas distintas',
+            'sql': 'CREATE INDEX IF NOT EXISTS idx_videos_unique_persons ON videos(unique_persons)'
+        },
+        {
+            'description': 'Agregar columna uploaded_epoch a videos',
+            'sql': 'ALTER TABLE videos ADD COLUMN uploaded_epoch INTEGER'
+        },
+        {
+            'description': 'Agregar columna upload_day a videos',
+            'sql': 'ALTER TABLE videos ADD COLUMN upload_day TEXT'
+        },
+        {
+            'description': 'Agregar columna upload_week a videos',
+            'sql': 'ALTER TABLE videos ADD COLUMN upload_week TEXT'
+        },
+        {
+            'description': 'Agregar columna upload_month a videos',
+            'sql': 'ALTER TABLE videos ADD COLUMN upload_month TEXT'
+        },
+        {
+            'description': 'Calcular epoch y claves de fecha de los videos existentes',
+            'sql': """
+                UPDATE videos SET
+                    uploaded_epoch = CAST(strftime('%s', uploaded_at) AS INTEGER),
+                    upload_day = DATE(uploaded_at),
+                    upload_week = strftime('%Y-%W', uploaded_at),
+                    upload_month = strftime('%Y-%m', uploaded_at)
+            """
+        },
+        {
+            'description': 'Crear trigger de claves de fecha al insertar videos',
+            'sql': """
+                CREATE TRIGGER IF NOT EXISTS videos_upload_buckets_insert AFTER INSERT ON videos
+                BEGIN
+                    UPDATE videos SET
+                        uploaded_epoch = CAST(strftime('%s', new.uploaded_at) AS INTEGER),
+                        upload_day = DATE(new.uploaded_at),
+                        upload_week = strftime('%Y-%W', new.uploaded_at),
+                        upload_month = strftime('%Y-%m', new.uploaded_at)
+                    WHERE id = new.id;
+                END
+            """
+        },
+        {
+            'description': 'Crear trigger de claves de fecha al cambiar uploaded_at',
+            'sql': """
+                CREATE TRIGGER IF NOT EXISTS videos_upload_buckets_update AFTER UPDATE OF uploaded_at ON videos
+                BEGIN
+                    UPDATE videos SET
+                        uploaded_epoch = CAST(strftime('%s', new.uploaded_at) AS INTEGER),
+                        upload_day = DATE(new.uploaded_at),
+                        upload_week = strftime('%Y-%W', new.uploaded_at),
+                        upload_month = strftime('%Y-%m', new.uploaded_at)
+                    WHERE id = new.id;
+                END
+            """
+        },
+        {
+            'description': 'Crear índice de videos por epoch de subida',
+            'sql': 'CREATE INDEX IF NOT EXISTS idx_videos_uploaded_epoch ON videos(uploaded_epoch)'
+        },
+        {
+            'description': 'Crear índice de videos por día de subida',
+            'sql': 'CREATE INDEX IF NOT EXISTS idx_videos_upload_day ON videos(upload_day)'
+        },
+        {
+            'description': 'Crear índice de videos por semana de subida',
+            'sql': 'CREATE INDEX IF NOT EXISTS idx_videos_upload_week ON videos(upload_week)'
+        },
+        {
+            'description': 'Crear índice de videos por mes de subida',
+            'sql': 'CREATE INDEX IF NOT EXISTS idx_videos_upload_month ON videos(upload_month)'
+        },
+        {
+            'description': 'Crear tabla video_neighbors',
+            'sql': """
+                CREATE TABLE IF NOT EXISTS video_neighbors (
+                    video_id INTEGER NOT NULL,
+                    rank INTEGER NOT NULL,
+                    neighbor_id INTEGER NOT NULL,
+                    cosine REAL NOT NULL,
+                    jaccard REAL NOT NULL,
+                    common_persons INTEGER NOT NULL,
+                    PRIMARY KEY (video_id, rank),
+                    FOREIGN KEY (video_id) REFERENCES videos(id) ON DELETE CASCADE,
+                    FOREIGN KEY (neighbor_id) REFERENCES videos(id) ON DELETE CASCADE
+                )
+            """
+        },
+        {
+            'description': 'Crear tabla similarity_dirty',
+            'sql': """
+                CREATE TABLE IF NOT EXISTS similarity_dirty (
+                    video_id INTEGER PRIMARY KEY,
+                    version INTEGER NOT NULL DEFAULT 1
+                )
+            """
+        },
+        {
+            'description': 'Crear índice de video_neighbors por vecino',
+            'sql': 'CREATE INDEX IF NOT EXISTS idx_video_neighbors_neighbor ON video_neighbors(neighbor_id)'
+        },
+        {
+            'description': 'Calcular videos similares de los videos existentes',
+            'function': similarity_service.rebuild_all
+        },
+        {
+            'description': 'Crear tabla data_version y sus triggers',
+            'function': data_version.ensure_data_version
+        },
+        {
+            'description': 'Crear tabla daily_uploads',
+            'sql': """
+                CREATE TABLE IF NOT EXISTS daily_uploads (
+                    day TEXT PRIMARY KEY,
+                    video_count INTEGER NOT NULL DEFAULT 0,
+                    appearance_count INTEGER NOT NULL DEFAULT 0,
+                    screen_time REAL NOT NULL DEFAULT 0
+                )
+            """
+        },
+        {
+            'description': 'Crear tabla daily_person_stats',
+            'sql': """
+                CREATE TABLE IF NOT EXISTS daily_person_stats (
+                    person_id INTEGER NOT NULL,
+                    day TEXT NOT NULL,
+                    video_count INTEGER NOT NULL DEFAULT 0,
+                    appearance_count INTEGER NOT NULL DEFAULT 0,
+                    screen_time REAL NOT NULL DEFAULT 0,
+                    PRIMARY KEY (person_id, day),
+                    FOREIGN KEY (person_id) REFERENCES persons(id) ON DELETE CASCADE
+                )
+            """
+        },
+        {
+            'description': 'Crear trigger de videos subidos por día',
+            'sql': """
+                CREATE TRIGGER IF NOT EXISTS videos_daily_uploads_day AFTER UPDATE OF upload_day ON videos
+                WHEN old.upload_day IS NOT new.upload_day
+                BEGIN
+                    UPDATE daily_uploads SET video_count = video_count - 1 WHERE day = old.upload_day;
+                    DELETE FROM daily_uploads WHERE day = old.upload_day AND video_count <= 0 AND appearance_count <= 0;
+                    INSERT INTO daily_uploads (day, video_count) SELECT new.upload_day, 1 WHERE new.upload_day IS NOT NULL
+                    ON CONFLICT(day) DO UPDATE SET video_count = video_count + 1;
+                END
+            """
+        },
+        {
+            'description': 'Crear trigger de videos eliminados por día',
+            'sql': """
+                CREATE TRIGGER IF NOT EXISTS videos_daily_uploads_delete AFTER DELETE ON videos
+                BEGIN
+                    UPDATE daily_uploads SET video_count = video_count - 1 WHERE day = old.upload_day;
+                    DELETE FROM daily_uploads WHERE day = old.upload_day AND video_count <= 0 AND appearance_count <= 0;
+                END
+            """
+        },
+        {
+            'description': 'Calcular totales diarios de los videos existentes',
+            'function': DailyStats.rebuild
+        },
+        {
+            'description': 'Crear registro de cambios para la analítica en memoria',
+            'function': analytics_engine.ensure_change_log
+        },
+        {
+            'description': 'Crear tabla presence_bitmaps',
+            'sql': """
+                CREATE TABLE IF NOT EXISTS presence_bitmaps (
+                    video_id INTEGER NOT NULL,
+                    person_id INTEGER NOT NULL,
+                    seconds INTEGER NOT NULL,
+                    bitmap BLOB NOT NULL,
+                    PRIMARY KEY (video_id, person_id),
+                    FOREIGN KEY (video_id) REFERENCES videos(id) ON DELETE CASCADE
+                )
+            """
+        },
+        {
+            'description': 'Calcular bitmaps de presencia de los videos existentes',
+            'function': presence_service.rebuild_all
+        },
+        {
+            'description': 'Crear tabla video_detections',
+            'sql': """
+                CREATE TABLE IF NOT EXISTS video_detections (
+                    video_id INTEGER PRIMARY KEY,
+                    detection_count INTEGER NOT NULL DEFAULT 0,
+                    timestamps BLOB NOT NULL,
+                    person_ids BLOB NOT NULL,
+                    distances BLOB NOT NULL,
+                    threshold REAL NOT NULL DEFAULT 3.0,
+                    min_length REAL NOT NULL DEFAULT 0,
+                    max_distance REAL,
+                    FOREIGN KEY (video_id) REFERENCES videos(id) ON DELETE CASCADE
+                )
+            """
+        },
+        {
+            'description': 'Agregar columna frame_numbers a video_detections',
+            'sql': 'ALTER TABLE video_detections ADD COLUMN frame_numbers BLOB'
+        },
+        {
+            'description': 'Agregar columna boxes a video_detections',
+            'sql': 'ALTER TABLE video_detections ADD COLUMN boxes BLOB'
+        },
+        {
+            'description': 'Crear tabla gallery_version y sus triggers sobre persons',
+            'function': face_registry.ensure_gallery_version
+        },
+        {
+            'description': 'Agregar columna stats a video_detections',
+            'sql': 'ALTER TABLE video_detections ADD COLUMN stats TEXT'
+        },
+        {
+            'description': 'Crear tabla tasks para la cola de tareas durable',
+            'function': task_store.ensure_task_table
+        },
+        {
+            'description': 'Crear tabla video_changes para los bitmaps de personas',
+            'function': person_bitmaps.ensure_video_changes
+        },
+        {
+            'description': 'Crear tabla person_videos',
+            'sql': """
+                CREATE TABLE IF NOT EXISTS person_videos (
+                    video_id INTEGER NOT NULL,
+                    person_id INTEGER NOT NULL,
+                    uploaded_at TIMESTAMP,
+                    PRIMARY KEY (video_id, person_id),
+                    FOREIGN KEY (video_id) REFERENCES videos(id) ON DELETE CASCADE
+                )
+            """
+        },
+        {
+            'description': 'Crear índice de videos por persona y fecha de subida',
+            'sql': 'CREATE INDEX IF NOT EXISTS idx_person_videos_recent ON person_videos(person_id, uploaded_at, video_id)'
+        },
+        {
+            'description': 'Crear trigger de fecha de subida en person_videos',
+            'sql': """
+                CREATE TRIGGER IF NOT EXISTS videos_person_videos_uploaded AFTER UPDATE OF uploaded_at ON videos
+                BEGIN
+                    UPDATE person_videos SET uploaded_at = new.uploaded_at WHERE video_id = new.id;
+                END
+            """
+        },
+        {
+            'description': 'Calcular person_videos de los videos existentes',
+            'function': PersonVideos.rebuild
         }
     ]
     
@@ -34,7 +418,10 @@ def migrate_database():
                     continue
             
             # Ejecutar migración
-            execute_query(migration['sql'], commit=True)
+            if 'function' in migration:
+                migration['function']()
+            else:
+                execute_query(migration['sql'], commit=True)
             logger.info(f"Migración completada: {migration['description']}")
             
         except Exception as e:
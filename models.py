@@ -1,11 +1,24 @@
-from database import execute_query
+from database import execute_query, get_db, iter_query
 from datetime import datetime
 
+# Funciones listener(table, action, record_id, text, old_text) que se llaman
+# después de cada escritura, para mantener índices en memoria al día
+_change_listeners = []
+
+def on_change(listener):
+    _change_listeners.append(listener)
+
+def notify_change(table, action, record_id, text=None, old_text=None):
+    for listener in _change_listeners:
+        listener(table, action, record_id, text, old_text)
+
 class Person:
     @staticmethod
     def create(name, photo_path):
         query = "INSERT INTO persons (name, photo_path) VALUES (?, ?)"
-        return execute_query(query, (name, photo_path), commit=True)
+        person_id = execute_query(query, (name, photo_path), commit=True)
+        notify_change('persons', 'insert', person_id, name)
+        return person_id
     
     @staticmethod
     def get_all():
@@ -19,25 +32,62 @@ class Person:
     
     @staticmethod
     def update_name(person_id, new_name):
-        query = "UPDATE persons SET name = ? WHERE id = ?"
-        execute_query(query, (new_name, person_id), commit=True)
+        person = Person.get_by_id(person_id)
+        with get_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute("UPDATE persons SET name = ? WHERE id = ?", (new_name, person_id))
+            Video.refresh_summaries_for_person(cursor, person_id)
+            conn.commit()
+        if person:
+            notify_change('persons', 'update', person_id, new_name, person['name'])
     
     @staticmethod
     def delete(person_id):
-        query = "DELETE FROM persons WHERE id = ?"
-        execute_query(query, (person_id,), commit=True)
+        person = Person.get_by_id(person_id)
+        with get_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM persons WHERE id = ?", (person_id,))
+            Video.refresh_summaries_for_person(cursor, person_id)
+            conn.commit()
+        if person:
+            notify_change('persons', 'delete', person_id, old_text=person['name'])
+
+SUMMARY_UPDATE = """
+    UPDATE videos SET
+        appearance_count = (SELECT COUNT(*) FROM video_appearances va WHERE va.video_id = videos.id),
+        unique_persons = (SELECT COUNT(DISTINCT va.person_id) FROM video_appearances va WHERE va.video_id = videos.id),
+        persons_list = (
+            SELECT GROUP_CONCAT(name) FROM (
+                SELECT DISTINCT p.name FROM video_appearances va
+                JOIN persons p ON va.person_id = p.id
+                WHERE va.video_id = videos.id
+                ORDER BY p.name
+            )
+        )
+"""
 
 class Video:
     @staticmethod
     def create(filename, original_filename, file_path, duration=None):
         query = "INSERT INTO videos (filename, original_filename, file_path, duration) VALUES (?, ?, ?, ?)"
-        return execute_query(query, (filename, original_filename, file_path, duration), commit=True)
+        video_id = execute_query(query, (filename, original_filename, file_path, duration), commit=True)
+        notify_change('videos', 'insert', video_id, original_filename)
+        return video_id
     
     @staticmethod
     def get_all():
         query = "SELECT * FROM videos ORDER BY uploaded_at DESC"
         return execute_query(query, fetch_all=True)
     
+    @staticmethod
+    def iter_all(with_analysis=False):
+        """Iterar los videos sin cargarlos todos; analysis_result sólo si se pide"""
+        columns = "id, filename, original_filename, duration, processed, uploaded_at, processed_at"
+        if with_analysis:
+            columns += ", analysis_result"
+        query = f"SELECT {columns} FROM videos ORDER BY uploaded_at DESC"
+        return iter_query(query)
+    
     @staticmethod
     def get_by_id(video_id):
         query = "SELECT * FROM videos WHERE id = ?"
@@ -50,8 +100,30 @@ class Video:
     
     @staticmethod
     def delete(video_id):
+        video = Video.get_by_id(video_id)
         query = "DELETE FROM videos WHERE id = ?"
         execute_query(query, (video_id,), commit=True)
+        if video:
+            notify_change('videos', 'delete', video_id, old_text=video['original_filename'])
+    
+    @staticmethod
+    def refresh_summary(cursor, video_id):
+        """
+        Recalcula las columnas resumen (appearance_count, unique_persons,
+        persons_list) a partir de las apariciones actuales del video
+        """
+        cursor.execute(SUMMARY_UPDATE + " WHERE id = ?", (video_id,))
+    
+    @staticmethod
+    def refresh_summaries_for_person(cursor, person_id):
+        """Recalcula el resumen de los videos donde aparece la persona (renombrada o eliminada)"""
+        cursor.execute(SUMMARY_UPDATE + """
+            WHERE id IN (SELECT DISTINCT video_id FROM video_appearances WHERE person_id = ?)
+        """, (person_id,))
+    
+    @staticmethod
+    def refresh_all_summaries():
+        execute_query(SUMMARY_UPDATE, commit=True)
 
 class VideoAppearance:
     @staticmethod
@@ -79,7 +151,9 @@ class VideoTag:
     @staticmethod
     def create(video_id, tag):
         query = "INSERT INTO video_tags (video_id, tag) VALUES (?, ?)"
-        return execute_query(query, (video_id, tag), commit=True)
+        tag_id = execute_query(query, (video_id, tag), commit=True)
+        notify_change('video_tags', 'insert', tag_id, tag)
+        return tag_id
     
     @staticmethod
     def get_by_video(video_id):
@@ -88,8 +162,11 @@ class VideoTag:
     
     @staticmethod
     def delete_by_video(video_id):
+        tags = VideoTag.get_by_video(video_id)
         query = "DELETE FROM video_tags WHERE video_id = ?"
         execute_query(query, (video_id,), commit=True)
+        for tag in tags:
+            notify_change('video_tags', 'delete', tag['id'], old_text=tag['tag'])
 
 class Notification:
     @staticmethod
@@ -99,11 +176,17 @@ class Notification:
     
     @staticmethod
     def get_all(unread_only=False):
+        return execute_query(Notification._list_query(unread_only), fetch_all=True)
+    
+    @staticmethod
+    def iter_all(unread_only=False):
+        return iter_query(Notification._list_query(unread_only))
+    
+    @staticmethod
+    def _list_query(unread_only):
         if unread_only:
-            query = "SELECT * FROM notifications WHERE read = 0 ORDER BY created_at DESC"
-        else:
-            query = "SELECT * FROM notifications ORDER BY created_at DESC LIMIT 50"
-        return execute_query(query, fetch_all=True)
+            return "SELECT * FROM notifications WHERE read = 0 ORDER BY created_at DESC"
+        return "SELECT * FROM notifications ORDER BY created_at DESC LIMIT 50"
     
     @staticmethod
     def mark_read(notification_id):
@@ -125,3 +208,252 @@ class Notification:
         query = "SELECT COUNT(*) as count FROM notifications WHERE read = 0"
         result = execute_query(query, fetch_one=True)
         return result['count'] if result else 0
+
+class PersonStats:
+    ALL_QUERY = """
+        SELECT p.id as person_id, p.name as person_name, p.photo_path,
+               COALESCE(ps.total_videos, 0) as total_videos,
+               COALESCE(ps.total_appearances, 0) as total_appearances,
+               COALESCE(ps.total_screen_time, 0) as total_screen_time,
+               ps.last_seen
+        FROM persons p
+        LEFT JOIN person_stats ps ON ps.person_id = p.id
+        ORDER BY total_screen_time DESC
+    """
+    
+    @staticmethod
+    def get_all():
+        return execute_query(PersonStats.ALL_QUERY, fetch_all=True)
+    
+    @staticmethod
+    def iter_all():
+        return iter_query(PersonStats.ALL_QUERY)
+    
+    @staticmethod
+    def get_by_person(person_id):
+        query = """
+            SELECT p.id as person_id, p.name as person_name, p.photo_path,
+                   COALESCE(ps.total_videos, 0) as total_videos,
+                   COALESCE(ps.total_appearances, 0) as total_appearances,
+                   COALESCE(ps.total_screen_time, 0) as total_screen_time,
+                   ps.last_seen
+            FROM persons p
+            LEFT JOIN person_stats ps ON ps.person_id = p.id
+            WHERE p.id = ?
+        """
+        return execute_query(query, (person_id,), fetch_one=True)
+    
+    @staticmethod
+    def apply_video(cursor, video_id, sign):
+        """
+        Suma (sign=1) o resta (sign=-1) la contribución de un video a person_stats.
+        Debe llamarse con las apariciones del video presentes en la tabla y
+        dentro de la misma transacción que las escribe o elimina.
+        """
+        cursor.execute("""
+            SELECT va.person_id, COUNT(*) as appearances,
+                   SUM(va.end_time - va.start_time) as screen_time,
+                   v.uploaded_at
+            FROM video_appearances va
+            JOIN videos v ON va.video_id = v.id
+            WHERE va.video_id = ?
+            GROUP BY va.person_id
+        """, (video_id,))
+        rows = cursor.fetchall()
+        if not rows:
+            return
+        
+        if sign > 0:
+            cursor.executemany("""
+                INSERT INTO person_stats (person_id, total_videos, total_appearances, total_screen_time, last_seen)
+                VALUES (?, 1, ?, ?, ?)
+                ON CONFLICT(person_id) DO UPDATE SET
+                    total_videos = total_videos + 1,
+                    total_appearances = total_appearances + excluded.total_appearances,
+                    total_screen_time = total_screen_time + excluded.total_screen_time,
+                    last_seen = NULLIF(MAX(COALESCE(last_seen, ''), COALESCE(excluded.last_seen, '')), '')
+            """, [(r['person_id'], r['appearances'], r['screen_time'], r['uploaded_at']) for r in rows])
+            return
+        
+        cursor.executemany("""
+            UPDATE person_stats SET
+                total_videos = total_videos - 1,
+                total_appearances = total_appearances - ?,
+                total_screen_time = MAX(total_screen_time - ?, 0)
+            WHERE person_id = ?
+        """, [(r['appearances'], r['screen_time'], r['person_id']) for r in rows])
+        
+        # last_seen solo se recalcula si el video eliminado era el más reciente
+        cursor.executemany("""
+            UPDATE person_stats SET last_seen = (
+                SELECT MAX(v.uploaded_at)
+                FROM video_appearances va
+                JOIN videos v ON va.video_id = v.id
+                WHERE va.person_id = person_stats.person_id AND va.video_id != ?
+            )
+            WHERE person_id = ? AND last_seen = ?
+        """, [(video_id, r['person_id'], r['uploaded_at']) for r in rows])
+        
+        cursor.execute("DELETE FROM person_stats WHERE total_videos <= 0")
+
+class DailyStats:
+    """
+    Totales por día de subida: daily_uploads (videos, apariciones y tiempo en
+    pantalla de los videos subidos ese día) y daily_person_stats (lo mismo por
+    persona). Las series semanales y mensuales se agrupan a partir de estas filas.
+    video_count de daily_uploads lo mantienen los triggers sobre videos.
+    """
+    @staticmethod
+    def apply_video(cursor, video_id, sign):
+        """
+        Suma (sign=1) o resta (sign=-1) las apariciones de un video en el día
+        en que se subió, con las mismas condiciones que PersonStats.apply_video
+        """
+        cursor.execute("""
+            SELECT va.person_id, COUNT(*) as appearances,
+                   SUM(va.end_time - va.start_time) as screen_time,
+                   v.upload_day as day
+            FROM video_appearances va
+            JOIN videos v ON va.video_id = v.id
+            WHERE va.video_id = ? AND v.upload_day IS NOT NULL
+            GROUP BY va.person_id
+        """, (video_id,))
+        rows = cursor.fetchall()
+        if not rows:
+            return
+
+        day = rows[0]['day']
+        appearances = sum(r['appearances'] for r in rows) * sign
+        screen_time = sum(r['screen_time'] for r in rows) * sign
+
+        cursor.execute("""
+            INSERT INTO daily_uploads (day, video_count, appearance_count, screen_time)
+            VALUES (?, 0, ?, ?)
+            ON CONFLICT(day) DO UPDATE SET
+                appearance_count = appearance_count + excluded.appearance_count,
+                screen_time = MAX(screen_time + excluded.screen_time, 0)
+        """, (day, appearances, screen_time))
+        cursor.executemany("""
+            INSERT INTO daily_person_stats (person_id, day, video_count, appearance_count, screen_time)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(person_id, day) DO UPDATE SET
+                video_count = video_count + excluded.video_count,
+                appearance_count = appearance_count + excluded.appearance_count,
+                screen_time = MAX(screen_time + excluded.screen_time, 0)
+        """, [(r['person_id'], day, sign, r['appearances'] * sign, r['screen_time'] * sign) for r in rows])
+
+        if sign < 0:
+            cursor.execute(
+                "DELETE FROM daily_person_stats WHERE day = ? AND video_count <= 0", (day,)
+            )
+            cursor.execute(
+                "DELETE FROM daily_uploads WHERE day = ? AND video_count <= 0 AND appearance_count <= 0", (day,)
+            )
+
+    @staticmethod
+    def rebuild():
+        """Recalcular ambas tablas desde videos y video_appearances"""
+        with get_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM daily_uploads")
+            cursor.execute("DELETE FROM daily_person_stats")
+            cursor.execute("""
+                INSERT INTO daily_uploads (day, video_count, appearance_count, screen_time)
+                SELECT v.upload_day, COUNT(*),
+                       COALESCE(SUM(a.appearances), 0), COALESCE(SUM(a.screen_time), 0)
+                FROM videos v
+                LEFT JOIN (
+                    SELECT video_id, COUNT(*) as appearances, SUM(end_time - start_time) as screen_time
+                    FROM video_appearances
+                    GROUP BY video_id
+                ) a ON a.video_id = v.id
+                WHERE v.upload_day IS NOT NULL
+                GROUP BY v.upload_day
+            """)
+            cursor.execute("""
+                INSERT INTO daily_person_stats (person_id, day, video_count, appearance_count, screen_time)
+                SELECT va.person_id, v.upload_day, COUNT(DISTINCT va.video_id), COUNT(*),
+                       SUM(va.end_time - va.start_time)
+                FROM video_appearances va
+                JOIN videos v ON va.video_id = v.id
+                WHERE v.upload_day IS NOT NULL
+                GROUP BY va.person_id, v.upload_day
+            """)
+            conn.commit()
+
+class PersonVideos:
+    """
+    Una fila por (persona, video) con la fecha de subida copiada del video.
+    El índice (person_id, uploaded_at, video_id) guarda los videos de cada
+    persona ya ordenados: la página por keyset se lee directo del índice.
+    uploaded_at lo sincroniza un trigger sobre videos.
+    """
+    @staticmethod
+    def apply_video(cursor, video_id, sign):
+        """Quitar (sign=-1) o agregar (sign=1) las personas de un video"""
+        if sign < 0:
+            cursor.execute("DELETE FROM person_videos WHERE video_id = ?", (video_id,))
+            return
+
+        cursor.execute("""
+            INSERT OR REPLACE INTO person_videos (video_id, person_id, uploaded_at)
+            SELECT DISTINCT va.video_id, va.person_id, v.uploaded_at
+            FROM video_appearances va
+            JOIN videos v ON va.video_id = v.id
+            WHERE va.video_id = ?
+        """, (video_id,))
+
+    @staticmethod
+    def rebuild():
+        """Recalcular la tabla desde videos y video_appearances"""
+        with get_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM person_videos")
+            cursor.execute("""
+                INSERT INTO person_videos (video_id, person_id, uploaded_at)
+                SELECT DISTINCT va.video_id, va.person_id, v.uploaded_at
+                FROM video_appearances va
+                JOIN videos v ON va.video_id = v.id
+            """)
+            conn.commit()
+
+class CoAppearance:
+    @staticmethod
+    def get_all():
+        query = """
+            SELECT ca.person_a, ca.person_b, ca.video_count
+            FROM co_appearances ca
+            WHERE ca.video_count > 0
+            ORDER BY ca.video_count DESC
+        """
+        return execute_query(query, fetch_all=True)
+    
+    @staticmethod
+    def apply_video(cursor, video_id, sign):
+        """Suma (sign=1) o resta (sign=-1) los pares de personas que comparten el video"""
+        cursor.execute("""
+            SELECT DISTINCT va1.person_id as person_a, va2.person_id as person_b
+            FROM video_appearances va1
+            JOIN video_appearances va2 ON va1.video_id = va2.video_id
+            WHERE va1.video_id = ? AND va1.person_id < va2.person_id
+        """, (video_id,))
+        pairs = [(r['person_a'], r['person_b']) for r in cursor.fetchall()]
+        if not pairs:
+            return
+        
+        if sign > 0:
+            cursor.executemany("""
+                INSERT INTO co_appearances (person_a, person_b, video_count)
+                VALUES (?, ?, 1)
+                ON CONFLICT(person_a, person_b) DO UPDATE SET video_count = video_count + 1
+            """, pairs)
+            return
+        
+        cursor.executemany("""
+            UPDATE co_appearances SET video_count = video_count - 1
+            WHERE person_a = ? AND person_b = ?
+        """, pairs)
+        cursor.executemany("""
+            DELETE FROM co_appearances
+            WHERE person_a = ? AND person_b = ? AND video_count <= 0
+        """, pairs)
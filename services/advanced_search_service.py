@@ -1,14 +1,32 @@
-from database import execute_query
+from database import execute_query, iter_query
+from services import search_index
+from services.suggestion_index import get_suggestion_index
+from services.person_bitmaps import get_person_bitmaps
 from datetime import datetime, timedelta
+import json
 import re
 
 class AdvancedSearchService:
     @staticmethod
     def advanced_search(filters):
+        """Búsqueda avanzada con múltiples filtros (ver _advanced_search_query)"""
+        query, params = AdvancedSearchService._advanced_search_query(filters)
+        return execute_query(query, params, fetch_all=True)
+    
+    @staticmethod
+    def iter_advanced_search(filters):
+        """Como advanced_search, pero iterando las filas desde el cursor"""
+        query, params = AdvancedSearchService._advanced_search_query(filters)
+        return iter_query(query, params)
+    
+    @staticmethod
+    def _advanced_search_query(filters):
         """
-        Búsqueda avanzada con múltiples filtros
+        Consulta y parámetros de la búsqueda avanzada con múltiples filtros
         filters = {
-            'persons': [1, 2, 3],  # IDs de personas
+            'persons': [1, 2, 3],  # IDs de personas (aparece al menos una)
+            'persons_all': [1, 2],  # aparecen todas
+            'persons_exclude': [4],  # no aparece ninguna
             'date_from': '2023-01-01',
             'date_to': '2023-12-31',
             'duration_min': 30,  # segundos
@@ -24,26 +42,38 @@ class AdvancedSearchService:
         where_conditions = []
         params = []
         
-        # Filtros de personas
-        if filters.get('persons'):
-            person_ids = filters['persons']
-            placeholders = ','.join(['?' for _ in person_ids])
-            where_conditions.append(f"""
-                v.id IN (
-                    SELECT DISTINCT video_id 
-                    FROM video_appearances 
-                    WHERE person_id IN ({placeholders})
-                )
-            """)
-            params.extend(person_ids)
+        # Filtros de personas, resueltos con los bitmaps en memoria
+        any_of = filters.get('persons') or []
+        all_of = filters.get('persons_all') or []
+        none_of = filters.get('persons_exclude') or []
+        if any_of or all_of or none_of:
+            bitmaps = get_person_bitmaps()
+            if bitmaps.built:
+                where_conditions.append("v.id IN (SELECT value FROM json_each(?))")
+                params.append(json.dumps(bitmaps.query(all_of=all_of, any_of=any_of, none_of=none_of)))
+            else:
+                for person_ids, operator in ((any_of, 'IN'), (none_of, 'NOT IN')):
+                    if person_ids:
+                        placeholders = ','.join(['?' for _ in person_ids])
+                        where_conditions.append(f"""
+                            v.id {operator} (
+                                SELECT DISTINCT video_id 
+                                FROM video_appearances 
+                                WHERE person_id IN ({placeholders})
+                            )
+                        """)
+                        params.extend(person_ids)
+                for person_id in all_of:
+                    where_conditions.append("v.id IN (SELECT video_id FROM video_appearances WHERE person_id = ?)")
+                    params.append(person_id)
         
-        # Filtro de rango de fechas
+        # Filtro de rango de fechas, como rango sobre el epoch indexado
         if filters.get('date_from'):
-            where_conditions.append("DATE(v.uploaded_at) >= ?")
+            where_conditions.append("v.uploaded_epoch >= CAST(strftime('%s', ?) AS INTEGER)")
             params.append(filters['date_from'])
         
         if filters.get('date_to'):
-            where_conditions.append("DATE(v.uploaded_at) <= ?")
+            where_conditions.append("v.uploaded_epoch < CAST(strftime('%s', ?, '+1 day') AS INTEGER)")
             params.append(filters['date_to'])
         
         # Filtro de duración
@@ -77,30 +107,18 @@ class AdvancedSearchService:
         # Filtro de múltiples personas
         if filters.get('has_multiple_persons') is not None:
             if filters['has_multiple_persons']:
-                where_conditions.append("""
-                    (SELECT COUNT(DISTINCT person_id) 
-                     FROM video_appearances 
-                     WHERE video_id = v.id) > 1
-                """)
+                where_conditions.append("v.unique_persons > 1")
             else:
-                where_conditions.append("""
-                    (SELECT COUNT(DISTINCT person_id) 
-                     FROM video_appearances 
-                     WHERE video_id = v.id) <= 1
-                """)
+                where_conditions.append("v.unique_persons <= 1")
         
         # Filtro de videos procesados
         if filters.get('processed_only'):
             where_conditions.append("v.processed = 1")
         
-        # Construir query base
+        # Construir query base; appearance_count, unique_persons y persons_list
+        # son columnas de videos que se actualizan al guardar las apariciones
         base_query = """
-            SELECT DISTINCT v.*,
-                   (SELECT COUNT(*) FROM video_appearances va WHERE va.video_id = v.id) as appearance_count,
-                   (SELECT COUNT(DISTINCT person_id) FROM video_appearances va WHERE va.video_id = v.id) as unique_persons,
-                   (SELECT GROUP_CONCAT(p.name) FROM video_appearances va 
-                    JOIN persons p ON va.person_id = p.id 
-                    WHERE va.video_id = v.id) as persons_list
+            SELECT v.*
             FROM videos v
         """
         
@@ -116,7 +134,7 @@ class AdvancedSearchService:
             elif filters['sort_by'] == 'duration':
                 order_by = f"v.duration {sort_order}"
             elif filters['sort_by'] == 'appearances':
-                order_by = f"appearance_count {sort_order}"
+                order_by = f"v.appearance_count {sort_order}"
         
         base_query += f" ORDER BY {order_by}"
         
@@ -124,11 +142,60 @@ class AdvancedSearchService:
         limit = filters.get('limit', 100)
         base_query += f" LIMIT {limit}"
         
-        return execute_query(base_query, params, fetch_all=True)
+        return base_query, params
     
     @staticmethod
-    def search_by_text(query_text):
-        """Búsqueda por texto en nombres de personas, archivos y tags"""
+    def search_by_text(query_text, limit=50):
+        """Búsqueda por texto en nombres de personas, archivos y tags, ordenada por relevancia"""
+        if not search_index.FTS_AVAILABLE:
+            return AdvancedSearchService._search_by_text_like(query_text)
+        
+        match_query = search_index.build_match_query(query_text)
+        if not match_query:
+            return []
+        
+        query = """
+            WITH matches AS (
+                SELECT rowid, rowid % 4 as kind_code, text, rank
+                FROM search_index
+                WHERE search_index MATCH ?
+                ORDER BY rank
+                LIMIT ?
+            ),
+            hits AS (
+                SELECT m.rowid / 4 as video_id, 'video' as match_type, m.text as match_text, m.rank
+                FROM matches m
+                WHERE m.kind_code = 1
+                
+                UNION ALL
+                
+                SELECT va.video_id, 'person', m.text, m.rank
+                FROM matches m
+                JOIN video_appearances va ON va.person_id = m.rowid / 4
+                WHERE m.kind_code = 2
+                
+                UNION ALL
+                
+                SELECT vt.video_id, 'tag', m.text, m.rank
+                FROM matches m
+                JOIN video_tags vt ON vt.id = m.rowid / 4
+                WHERE m.kind_code = 3
+            )
+            SELECT v.*, h.match_type, h.match_text, MIN(h.rank) as relevance
+            FROM hits h
+            JOIN videos v ON v.id = h.video_id
+            GROUP BY v.id, h.match_type, h.match_text
+            ORDER BY relevance, v.uploaded_at DESC
+            LIMIT ?
+        """
+        
+        # Las `limit` coincidencias mejor puntuadas bastan para llenar la página,
+        # porque los resultados se ordenan por la puntuación de su coincidencia
+        return execute_query(query, (match_query, limit, limit), fetch_all=True)
+    
+    @staticmethod
+    def _search_by_text_like(query_text):
+        """Búsqueda por texto con LIKE, usada cuando FTS5 no está disponible"""
         search_term = f"%{query_text}%"
         
         query = """
@@ -160,28 +227,62 @@ class AdvancedSearchService:
     
     @staticmethod
     def search_similar_videos(video_id):
-        """Encontrar videos similares basado en personas que aparecen"""
+        """Encontrar videos similares basado en personas que aparecen (tabla video_neighbors)"""
         query = """
-            SELECT v2.*, COUNT(DISTINCT va2.person_id) as common_persons,
-                   GROUP_CONCAT(DISTINCT p.name) as shared_persons
-            FROM videos v1
-            JOIN video_appearances va1 ON v1.id = va1.video_id
-            JOIN video_appearances va2 ON va1.person_id = va2.person_id
-            JOIN videos v2 ON va2.video_id = v2.id
-            JOIN persons p ON va1.person_id = p.id
-            WHERE v1.id = ? AND v2.id != ?
-            GROUP BY v2.id, v2.filename, v2.original_filename, v2.file_path, 
-                     v2.duration, v2.uploaded_at, v2.processed, v2.processed_at, v2.analysis_result
-            HAVING COUNT(DISTINCT va2.person_id) >= 1
-            ORDER BY common_persons DESC, v2.uploaded_at DESC
-            LIMIT 20
+            SELECT v.*, vn.common_persons, vn.cosine as similarity, vn.jaccard,
+                   (SELECT GROUP_CONCAT(p.name) FROM persons p
+                    WHERE p.id IN (
+                        SELECT person_id FROM video_appearances WHERE video_id = vn.video_id
+                        INTERSECT
+                        SELECT person_id FROM video_appearances WHERE video_id = vn.neighbor_id
+                    )) as shared_persons
+            FROM video_neighbors vn
+            JOIN videos v ON v.id = vn.neighbor_id
+            WHERE vn.video_id = ?
+            ORDER BY vn.rank
         """
         
-        return execute_query(query, (video_id, video_id), fetch_all=True)
+        return execute_query(query, (video_id,), fetch_all=True)
     
     @staticmethod
     def get_search_suggestions(partial_text, limit=10):
         """Obtener sugerencias de búsqueda basadas en texto parcial"""
+        index = get_suggestion_index()
+        if index.built:
+            return index.suggest(partial_text, limit)
+        
+        if not search_index.FTS_AVAILABLE:
+            return AdvancedSearchService._get_search_suggestions_like(partial_text, limit)
+        
+        suggestions = {
+            'persons': [],
+            'tags': [],
+            'filenames': []
+        }
+        
+        match_query = search_index.build_match_query(partial_text, prefix_last_only=True)
+        if not match_query:
+            return suggestions
+        
+        # Sin ORDER BY, SQLite puede detenerse en cuanto reúne suficientes coincidencias
+        query = """
+            SELECT text
+            FROM search_index
+            WHERE search_index MATCH ? AND rowid % 4 = ?
+            LIMIT ?
+        """
+        
+        for key, kind in (('persons', 'person'), ('tags', 'tag'), ('filenames', 'video')):
+            code = search_index.KIND_CODES[kind]
+            rows = execute_query(query, (match_query, code, limit * 4), fetch_all=True)
+            unique = list(dict.fromkeys(row['text'] for row in rows)) if rows else []
+            suggestions[key] = sorted(unique[:limit])
+        
+        return suggestions
+    
+    @staticmethod
+    def _get_search_suggestions_like(partial_text, limit=10):
+        """Sugerencias con LIKE, usadas cuando FTS5 no está disponible"""
         search_term = f"{partial_text}%"
         
         suggestions = {
@@ -224,45 +325,52 @@ class AdvancedSearchService:
         """Obtener estadísticas de rango de fechas disponibles"""
         query = """
             SELECT 
-                MIN(DATE(uploaded_at)) as earliest_date,
-                MAX(DATE(uploaded_at)) as latest_date,
-                COUNT(*) as total_videos
-            FROM videos
+                (SELECT MIN(upload_day) FROM videos) as earliest_date,
+                (SELECT MAX(upload_day) FROM videos) as latest_date,
+                (SELECT COUNT(*) FROM videos) as total_videos
         """
         result = execute_query(query, fetch_one=True)
         return result if result else {}
     
     @staticmethod
-    def search_by_date_pattern(pattern_type='weekly'):
-        """Buscar videos por patrones de fecha (semanal, mensual, etc.)"""
-        if pattern_type == 'weekly':
-            query = """
-                SELECT strftime('%Y-%W', uploaded_at) as period,
-                       COUNT(*) as video_count,
-                       GROUP_CONCAT(id) as video_ids
-                FROM videos
-                GROUP BY strftime('%Y-%W', uploaded_at)
-                ORDER BY period DESC
-            """
-        elif pattern_type == 'monthly':
-            query = """
-                SELECT strftime('%Y-%m', uploaded_at) as period,
-                       COUNT(*) as video_count,
-                       GROUP_CONCAT(id) as video_ids
-                FROM videos
-                GROUP BY strftime('%Y-%m', uploaded_at)
-                ORDER BY period DESC
-            """
-        elif pattern_type == 'daily':
-            query = """
-                SELECT DATE(uploaded_at) as period,
-                       COUNT(*) as video_count,
-                       GROUP_CONCAT(id) as video_ids
-                FROM videos
-                GROUP BY DATE(uploaded_at)
-                ORDER BY period DESC
-            """
-        else:
+    def search_by_date_pattern(pattern_type='weekly', limit=None):
+        """
+        Buscar videos por patrones de fecha (semanal, mensual, etc.)
+        Los conteos salen de daily_uploads; los ids se leen con el índice de la
+        clave de fecha a partir del período más antiguo devuelto
+        """
+        periods = {
+            'daily': ('day', 'upload_day'),
+            'weekly': ("strftime('%Y-%W', day)", 'upload_week'),
+            'monthly': ('substr(day, 1, 7)', 'upload_month')
+        }
+        if pattern_type not in periods:
+            return []
+        period_expr, column = periods[pattern_type]
+        
+        query = f"""
+            SELECT {period_expr} as period,
+                   SUM(video_count) as video_count
+            FROM daily_uploads
+            GROUP BY period
+            HAVING video_count > 0
+            ORDER BY period DESC
+        """
+        params = ()
+        if limit:
+            query += " LIMIT ?"
+            params = (limit,)
+        results = [dict(row) for row in execute_query(query, params, fetch_all=True)]
+        if not results:
             return []
         
-        return execute_query(query, fetch_all=True)
\ No newline at end of file
+        rows = execute_query(
+            f"SELECT {column} as period, id FROM videos WHERE {column} >= ? ORDER BY {column}, id",
+            (results[-1]['period'],), fetch_all=True
+        )
+        video_ids = {}
+        for row in rows:
+            video_ids.setdefault(row['period'], []).append(str(row['id']))
+        for result in results:
+            result['video_ids'] = ','.join(video_ids.get(result['period'], []))
+        return results
\ No newline at end of file
@@ -0,0 +1,421 @@
+"""
+Motor de analítica en memoria sobre video_appearances.
+
+Las apariciones y los metadatos de los videos se cargan en arreglos NumPy
+por columna y las agregaciones (top de personas, patrón por hora, métricas
+de procesamiento, percentiles y distribuciones de tiempo en pantalla) se
+resuelven con operaciones vectorizadas en vez de recorrer las tablas con SQL.
+
+La carga es incremental: las filas nuevas se leen por id mayor que el último
+visto y las eliminadas o modificadas se toman del registro analytics_changes,
+que llenan triggers sobre videos y video_appearances (así también se ven las
+escrituras de otros procesos). Sólo se consulta la base de datos cuando cambia
+data_version. Si NumPy no está disponible el motor no se carga y
+AnalyticsService usa las consultas SQL.
+"""
+from database import get_db
+from services.data_version import get_data_version
+import sqlite3
+import threading
+import logging
+import time
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+FETCH_SIZE = 50000
+# Antigüedad máxima de las entradas del registro; un proceso que se atrase
+# más que esto recarga todo
+LOG_RETENTION_SECONDS = 24 * 3600
+# La depuración del registro escribe: se intenta como mucho cada tanto
+PRUNE_INTERVAL = 60.0
+
+APPEARANCE_COLUMNS = "id, video_id, person_id, start_time, end_time"
+VIDEO_COLUMNS = """
+    id, duration, COALESCE(processed, -1),
+    CASE WHEN processed_at IS NOT NULL AND uploaded_at IS NOT NULL
+         THEN julianday(processed_at) - julianday(uploaded_at) END as processing_days
+"""
+
+def ensure_change_log():
+    """Crear la tabla analytics_changes y sus triggers si no existen"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS analytics_changes (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                table_name TEXT NOT NULL,
+                record_id INTEGER NOT NULL,
+                changed_at INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER))
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_analytics_changes_changed ON analytics_changes(changed_at)")
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS video_appearances_analytics_delete AFTER DELETE ON video_appearances
+            BEGIN
+                INSERT INTO analytics_changes (table_name, record_id) VALUES ('video_appearances', old.id);
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS video_appearances_analytics_update AFTER UPDATE ON video_appearances
+            BEGIN
+                INSERT INTO analytics_changes (table_name, record_id) VALUES ('video_appearances', old.id);
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS videos_analytics_delete AFTER DELETE ON videos
+            BEGIN
+                INSERT INTO analytics_changes (table_name, record_id) VALUES ('videos', old.id);
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS videos_analytics_update AFTER UPDATE OF duration, processed, processed_at, uploaded_at ON videos
+            BEGIN
+                INSERT INTO analytics_changes (table_name, record_id) VALUES ('videos', old.id);
+            END
+        """)
+        conn.commit()
+
+def _chunks(items, size=BATCH_SIZE):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def _fetch(cursor, query, params=()):
+    """Filas como tuplas (sin sqlite3.Row, que es más lento de convertir)"""
+    cursor = cursor.connection.cursor()
+    cursor.row_factory = None
+    cursor.execute(query, params)
+    rows = []
+    while True:
+        batch = cursor.fetchmany(FETCH_SIZE)
+        if not batch:
+            return rows
+        rows.extend(batch)
+
+def _read_state(cursor):
+    """Versión de datos y último número del registro de cambios"""
+    cursor.execute("SELECT version FROM data_version WHERE id = 1")
+    row = cursor.fetchone()
+    cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'analytics_changes'")
+    sequence = cursor.fetchone()
+    return (row[0] if row else 0), (sequence[0] if sequence else 0)
+
+class _Table:
+    """Columnas NumPy de una tabla; se reemplazan completas en cada refresco"""
+    def __init__(self, dtypes, rows=()):
+        self.dtypes = dtypes
+        self.columns = self._to_columns(rows)
+
+    def _to_columns(self, rows):
+        # Todas las columnas son numéricas: una sola conversión a float64
+        # (NULL -> NaN) y luego cada columna a su tipo
+        matrix = np.array(rows, dtype=np.float64).reshape(len(rows), len(self.dtypes))
+        return {name: matrix[:, i].astype(dtype) for i, (name, dtype) in enumerate(self.dtypes)}
+
+    def __len__(self):
+        return len(self.columns['id'])
+
+    def replace(self, removed_ids, rows):
+        """Quitar las filas de removed_ids y agregar rows"""
+        columns = self.columns
+        if len(removed_ids):
+            keep = ~np.isin(columns['id'], np.fromiter(removed_ids, dtype=np.int64))
+            columns = {name: values[keep] for name, values in columns.items()}
+        if rows:
+            added = self._to_columns(rows)
+            columns = {name: np.concatenate([columns[name], added[name]]) for name in columns}
+        self.columns = columns
+
+    def max_id(self):
+        return int(self.columns['id'].max()) if len(self) else 0
+
+APPEARANCE_DTYPES = [('id', np.int64), ('video_id', np.int64), ('person_id', np.int64),
+                     ('start_time', np.float64), ('end_time', np.float64)] if NUMPY_AVAILABLE else []
+VIDEO_DTYPES = [('id', np.int64), ('duration', np.float64), ('processed', np.int8),
+                ('processing_days', np.float64)] if NUMPY_AVAILABLE else []
+
+class AnalyticsEngine:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.loaded = False
+        self._version = None
+        self._last_seq = 0
+        self._persons = {}
+        self._pruned_at = 0.0
+
+    def load(self):
+        """Cargar todas las columnas desde la base de datos"""
+        if not NUMPY_AVAILABLE:
+            logger.info("NumPy no disponible: la analítica se resuelve con SQL")
+            return
+
+        with self._lock:
+            t0 = time.perf_counter()
+            with get_db() as conn:
+                cursor = conn.cursor()
+                # Una sola transacción de lectura: versión, registro y filas coherentes
+                cursor.execute("BEGIN")
+                version, last_seq = _read_state(cursor)
+                appearances = _Table(APPEARANCE_DTYPES, _fetch(cursor, f"SELECT {APPEARANCE_COLUMNS} FROM video_appearances"))
+                videos = _Table(VIDEO_DTYPES, _fetch(cursor, f"SELECT {VIDEO_COLUMNS} FROM videos"))
+                persons = self._load_persons(cursor)
+                conn.rollback()
+
+            self._appearances, self._videos, self._persons = appearances, videos, persons
+            self._version, self._last_seq = version, last_seq
+            self.loaded = True
+            logger.info(f"Analítica en memoria: {len(appearances)} apariciones cargadas en "
+                        f"{time.perf_counter() - t0:.2f}s")
+
+    def _load_persons(self, cursor):
+        cursor.execute("SELECT id, name FROM persons")
+        return {row['id']: row['name'] for row in cursor.fetchall()}
+
+    def _changed_ids(self, cursor, sequence):
+        """
+        {tabla: ids} registrados después del último refresco; None si el
+        registro ya se depuró más allá de ese punto
+        """
+        changed = {'videos': set(), 'video_appearances': set()}
+        if sequence <= self._last_seq:
+            return changed
+
+        cursor.execute(
+            "SELECT seq, table_name, record_id FROM analytics_changes WHERE seq > ? ORDER BY seq",
+            (self._last_seq,)
+        )
+        rows = cursor.fetchall()
+        if not rows or rows[0]['seq'] > self._last_seq + 1:
+            return None
+        for row in rows:
+            changed.setdefault(row['table_name'], set()).add(row['record_id'])
+        return changed
+
+    def _load_rows(self, cursor, table, columns, ids, after_id):
+        rows = _fetch(cursor, f"SELECT {columns} FROM {table} WHERE id > ?", (after_id,))
+        for batch in _chunks(sorted(i for i in ids if i <= after_id)):
+            placeholders = ','.join('?' for _ in batch)
+            rows.extend(_fetch(cursor, f"SELECT {columns} FROM {table} WHERE id IN ({placeholders})", batch))
+        return rows
+
+    def refresh(self):
+        """Aplicar los cambios desde el último refresco; retorna False si no había"""
+        if not self.loaded:
+            return False
+
+        version = get_data_version()
+        if version == self._version:
+            return False
+
+        with self._lock:
+            if version == self._version:
+                return False
+
+            with get_db() as conn:
+                cursor = conn.cursor()
+                # Transacción solo de lectura: nunca pide el bloqueo de escritura
+                cursor.execute("BEGIN")
+                try:
+                    version, last_seq = _read_state(cursor)
+                    changed = self._changed_ids(cursor, last_seq)
+                    if changed is not None:
+                        updates = []
+                        for table, columns, store in (
+                            ('video_appearances', APPEARANCE_COLUMNS, self._appearances),
+                            ('videos', VIDEO_COLUMNS, self._videos)
+                        ):
+                            ids = changed.get(table, set())
+                            updates.append((store, ids, self._load_rows(cursor, table, columns, ids, store.max_id())))
+                        persons = self._load_persons(cursor)
+                finally:
+                    conn.rollback()
+
+            # Se aplica solo lo leído completo: un error deja el snapshot anterior
+            if changed is not None:
+                for store, ids, rows in updates:
+                    store.replace(ids, rows)
+                self._persons = persons
+                self._version, self._last_seq = version, last_seq
+
+        if changed is None:
+            logger.info("Registro de cambios depurado: recargando la analítica en memoria")
+            self.load()
+        else:
+            self._prune()
+        return True
+
+    def _prune(self):
+        """Borrar entradas viejas del registro, sin esperar si la base está ocupada"""
+        now = time.monotonic()
+        if now - self._pruned_at < PRUNE_INTERVAL:
+            return
+        self._pruned_at = now
+
+        try:
+            with get_db() as conn:
+                conn.isolation_level = None
+                cursor = conn.cursor()
+                cursor.execute("PRAGMA busy_timeout = 0")
+                cursor.execute("BEGIN IMMEDIATE")
+                try:
+                    cursor.execute(
+                        "DELETE FROM analytics_changes WHERE changed_at < CAST(strftime('%s', 'now') AS INTEGER) - ?",
+                        (LOG_RETENTION_SECONDS,)
+                    )
+                    cursor.execute("COMMIT")
+                except Exception:
+                    cursor.execute("ROLLBACK")
+                    raise
+        except sqlite3.OperationalError as e:
+            # Otro proceso está escribiendo: se depura en el siguiente intento
+            logger.debug(f"Depuración del registro de cambios omitida: {e}")
+
+    # Consultas
+
+    def _screen_times(self):
+        columns = self._appearances.columns
+        return columns['person_id'], columns['end_time'] - columns['start_time']
+
+    def totals(self):
+        videos = self._videos.columns
+        processed = videos['processed'] == 1
+        return {
+            'total_videos': len(self._videos),
+            'total_appearances': len(self._appearances),
+            'total_processing_time': float(np.nansum(videos['duration'][processed]))
+        }
+
+    def top_persons(self, limit=5):
+        """Como AnalyticsService._get_top_persons: incluye personas sin apariciones"""
+        person_ids, durations = self._screen_times()
+        person_list = np.fromiter(self._persons, dtype=np.int64, count=len(self._persons))
+        if not len(person_list):
+            return []
+
+        size = int(max(person_list.max(), person_ids.max() if len(person_ids) else 0)) + 1
+        counts = np.bincount(person_ids, minlength=size)
+        times = np.bincount(person_ids, weights=durations, minlength=size)
+
+        order = person_list[np.argsort(-counts[person_list], kind='stable')][:limit]
+        return [{
+            'id': int(person_id),
+            'name': self._persons[person_id],
+            'appearance_count': int(counts[person_id]),
+            'total_time': float(times[person_id]) if counts[person_id] else None
+        } for person_id in order.tolist()]
+
+    def hourly_pattern(self):
+        hours = (self._appearances.columns['start_time'] // 3600).astype(np.int64)
+        if not len(hours):
+            return []
+        offset = int(hours.min())
+        counts = np.bincount(hours - offset)
+        return [{'hour': int(hour) + offset, 'appearances': int(count)}
+                for hour, count in enumerate(counts.tolist()) if count]
+
+    def processing_metrics(self):
+        videos = self._videos.columns
+        durations = videos['duration'][~np.isnan(videos['duration'])]
+        delays = videos['processing_days'][~np.isnan(videos['processing_days'])]
+        return {
+            'avg_video_duration': float(durations.mean()) if len(durations) else None,
+            'min_duration': float(durations.min()) if len(durations) else None,
+            'max_duration': float(durations.max()) if len(durations) else None,
+            'processed_count': int((videos['processed'] == 1).sum()),
+            'pending_count': int((videos['processed'] == 0).sum()),
+            'avg_processing_time_days': float(delays.mean()) if len(delays) else None
+        }
+
+    def screen_time_distribution(self, bins=20, person_id=None):
+        """Histograma y resumen de la duración de las apariciones"""
+        person_ids, durations = self._screen_times()
+        if person_id is not None:
+            durations = durations[person_ids == person_id]
+        if not len(durations):
+            return {'count': 0, 'bins': [], 'counts': []}
+
+        counts, edges = np.histogram(durations, bins=bins)
+        p50, p90, p99 = np.percentile(durations, [50, 90, 99])
+        return {
+            'count': int(len(durations)),
+            'mean': float(durations.mean()),
+            'p50': float(p50),
+            'p90': float(p90),
+            'p99': float(p99),
+            'bins': [float(edge) for edge in edges],
+            'counts': [int(count) for count in counts]
+        }
+
+    def person_percentiles(self, percentiles=(50, 90, 99)):
+        """
+        Percentiles de la duración de las apariciones de cada persona,
+        con la misma interpolación lineal que np.percentile
+        """
+        person_ids, durations = self._screen_times()
+        if not len(person_ids):
+            return []
+
+        order = np.lexsort((durations, person_ids))
+        sorted_persons = person_ids[order]
+        sorted_durations = durations[order]
+        starts = np.flatnonzero(np.r_[True, sorted_persons[1:] != sorted_persons[:-1]])
+        sizes = np.diff(np.r_[starts, len(sorted_persons)])
+
+        results = {}
+        for percentile in percentiles:
+            position = starts + (sizes - 1) * (percentile / 100.0)
+            low = np.floor(position).astype(np.int64)
+            high = np.minimum(low + 1, starts + sizes - 1)
+            fraction = position - low
+            results[percentile] = sorted_durations[low] + (sorted_durations[high] - sorted_durations[low]) * fraction
+        means = np.add.reduceat(sorted_durations, starts) / sizes
+
+        output = []
+        for i, person_id in enumerate(sorted_persons[starts].tolist()):
+            if person_id not in self._persons:
+                continue
+            entry = {
+                'person_id': person_id,
+                'name': self._persons[person_id],
+                'appearances': int(sizes[i]),
+                'mean': float(means[i])
+            }
+            for percentile in percentiles:
+                entry[f'p{percentile:g}'] = float(results[percentile][i])
+            output.append(entry)
+        return output
+
+    def get_stats(self):
+        return {
+            'available': NUMPY_AVAILABLE,
+            'loaded': self.loaded,
+            'appearances': len(self._appearances) if self.loaded else 0,
+            'videos': len(self._videos) if self.loaded else 0,
+            'version': self._version,
+            'last_change': self._last_seq
+        }
+
+# Instancia global del motor de analítica
+analytics_engine = AnalyticsEngine()
+
+def build_analytics_engine():
+    """Cargar el motor de analítica global"""
+    analytics_engine.load()
+
+def get_analytics_engine():
+    """
+    Obtener el motor de analítica, al día con la base de datos si está
+    cargado; si el refresco falla se sigue sirviendo el último snapshot
+    """
+    try:
+        analytics_engine.refresh()
+    except Exception as e:
+        logger.warning(f"No se pudo refrescar la analítica en memoria: {e}")
+    return analytics_engine
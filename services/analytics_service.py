@@ -1,11 +1,18 @@
 from database import execute_query
+from services.analytics_engine import get_analytics_engine
 from datetime import datetime, timedelta
 import json
 
 class AnalyticsService:
     @staticmethod
     def get_dashboard_stats():
-        """Obtener estadísticas principales del dashboard"""
+        """Obtener estadísticas principales del dashboard (desde el snapshot en memoria)"""
+        from services.dashboard_cache import get_dashboard_cache
+        return get_dashboard_cache().get()
+    
+    @staticmethod
+    def compute_dashboard_stats():
+        """Calcular las estadísticas principales del dashboard"""
         stats = {
             'total_videos': AnalyticsService._get_total_videos(),
             'total_persons': AnalyticsService._get_total_persons(),
@@ -20,6 +27,9 @@ class AnalyticsService:
     
     @staticmethod
     def _get_total_videos():
+        engine = get_analytics_engine()
+        if engine.loaded:
+            return engine.totals()['total_videos']
         query = "SELECT COUNT(*) as count FROM videos"
         result = execute_query(query, fetch_one=True)
         return result['count'] if result else 0
@@ -32,12 +42,18 @@ class AnalyticsService:
     
     @staticmethod
     def _get_total_appearances():
+        engine = get_analytics_engine()
+        if engine.loaded:
+            return engine.totals()['total_appearances']
         query = "SELECT COUNT(*) as count FROM video_appearances"
         result = execute_query(query, fetch_one=True)
         return result['count'] if result else 0
     
     @staticmethod
     def _get_total_processing_time():
+        engine = get_analytics_engine()
+        if engine.loaded:
+            return engine.totals()['total_processing_time']
         query = """
             SELECT SUM(duration) as total_duration 
             FROM videos 
@@ -51,7 +67,7 @@ class AnalyticsService:
         query = """
             SELECT 'video' as type, original_filename as name, uploaded_at as date
             FROM videos
-            WHERE uploaded_at >= datetime('now', '-7 days')
+            WHERE uploaded_epoch >= CAST(strftime('%s', 'now', '-7 days') AS INTEGER)
             UNION ALL
             SELECT 'person' as type, name, created_at as date
             FROM persons
@@ -65,6 +81,9 @@ class AnalyticsService:
     
     @staticmethod
     def _get_top_persons(limit=5):
+        engine = get_analytics_engine()
+        if engine.loaded:
+            return engine.top_persons(limit)
         query = """
             SELECT p.id, p.name, COUNT(va.id) as appearance_count,
                    SUM(va.end_time - va.start_time) as total_time
@@ -80,11 +99,12 @@ class AnalyticsService:
     @staticmethod
     def _get_monthly_uploads():
         query = """
-            SELECT strftime('%Y-%m', uploaded_at) as month,
-                   COUNT(*) as count
-            FROM videos
-            WHERE uploaded_at >= datetime('now', '-12 months')
-            GROUP BY strftime('%Y-%m', uploaded_at)
+            SELECT substr(day, 1, 7) as month,
+                   SUM(video_count) as count
+            FROM daily_uploads
+            WHERE day >= strftime('%Y-%m', 'now', '-12 months') || '-01'
+            GROUP BY month
+            HAVING count > 0
             ORDER BY month
         """
         results = execute_query(query, fetch_all=True)
@@ -92,13 +112,15 @@ class AnalyticsService:
     
     @staticmethod
     def _get_weekly_appearances():
+        # El rango de días acota la lectura; la semana inicial se filtra por su clave
         query = """
-            SELECT strftime('%Y-%W', v.uploaded_at) as week,
-                   COUNT(va.id) as appearances
-            FROM video_appearances va
-            JOIN videos v ON va.video_id = v.id
-            WHERE v.uploaded_at >= datetime('now', '-12 weeks')
-            GROUP BY strftime('%Y-%W', v.uploaded_at)
+            SELECT strftime('%Y-%W', day) as week,
+                   SUM(appearance_count) as appearances
+            FROM daily_uploads
+            WHERE day >= DATE('now', '-90 days')
+            AND strftime('%Y-%W', day) >= strftime('%Y-%W', 'now', '-84 days')
+            GROUP BY week
+            HAVING appearances > 0
             ORDER BY week
         """
         results = execute_query(query, fetch_all=True)
@@ -108,44 +130,83 @@ class AnalyticsService:
     def get_person_timeline(person_id, days=30):
         """Obtener línea de tiempo de apariciones de una persona"""
         query = """
-            SELECT DATE(v.uploaded_at) as date,
-                   COUNT(va.id) as appearances,
-                   SUM(va.end_time - va.start_time) as total_time,
-                   GROUP_CONCAT(v.original_filename) as videos
-            FROM video_appearances va
-            JOIN videos v ON va.video_id = v.id
-            WHERE va.person_id = ? 
-            AND v.uploaded_at >= datetime('now', '-' || ? || ' days')
-            GROUP BY DATE(v.uploaded_at)
+            SELECT day as date,
+                   appearance_count as appearances,
+                   screen_time as total_time,
+                   video_count
+            FROM daily_person_stats
+            WHERE person_id = ? AND day >= DATE('now', '-' || ? || ' days')
             ORDER BY date DESC
         """
-        return execute_query(query, (person_id, days), fetch_all=True)
+        timeline = [dict(row) for row in execute_query(query, (person_id, days), fetch_all=True)]
+        if not timeline:
+            return []
+        
+        # Nombres de los videos: sólo se recorren los videos subidos en el período
+        videos_query = """
+            SELECT v.upload_day as date, GROUP_CONCAT(v.original_filename) as videos
+            FROM videos v
+            WHERE v.upload_day >= ?
+            AND EXISTS (
+                SELECT 1 FROM video_appearances va
+                WHERE va.video_id = v.id AND va.person_id = ?
+            )
+            GROUP BY v.upload_day
+        """
+        rows = execute_query(videos_query, (timeline[-1]['date'], person_id), fetch_all=True)
+        videos = {row['date']: row['videos'] for row in rows}
+        for entry in timeline:
+            entry['videos'] = videos.get(entry['date'])
+        return timeline
     
     @staticmethod
-    def get_co_appearance_stats():
-        """Estadísticas de co-apariciones entre personas"""
+    def get_co_appearance_stats(limit=20):
+        """Estadísticas de co-apariciones entre personas según el tiempo real compartido en pantalla"""
         query = """
             SELECT 
                 p1.name as person1,
                 p2.name as person2,
-                COUNT(*) as co_appearances,
-                GROUP_CONCAT(DISTINCT v.original_filename) as videos
-            FROM video_appearances va1
-            JOIN video_appearances va2 ON va1.video_id = va2.video_id
-            JOIN persons p1 ON va1.person_id = p1.id
-            JOIN persons p2 ON va2.person_id = p2.id
-            JOIN videos v ON va1.video_id = v.id
-            WHERE va1.person_id < va2.person_id
-            AND ABS(va1.start_time - va2.start_time) <= 5
-            GROUP BY va1.person_id, va2.person_id, p1.name, p2.name
-            ORDER BY co_appearances DESC
-            LIMIT 20
+                SUM(o.shared_segments) as co_appearances,
+                SUM(o.overlap_seconds) as overlap_seconds,
+                COUNT(*) as video_count,
+                GROUP_CONCAT(v.original_filename) as videos
+            FROM co_appearance_overlaps o
+            JOIN persons p1 ON o.person_a = p1.id
+            JOIN persons p2 ON o.person_b = p2.id
+            JOIN videos v ON o.video_id = v.id
+            GROUP BY o.person_a, o.person_b, p1.name, p2.name
+            ORDER BY overlap_seconds DESC, co_appearances DESC
+            LIMIT ?
         """
-        return execute_query(query, fetch_all=True)
+        results = execute_query(query, (limit,), fetch_all=True)
+        return [dict(row) for row in results] if results else []
+    
+    @staticmethod
+    def get_video_co_appearances(video_id):
+        """Solapamientos entre personas dentro de un video"""
+        query = """
+            SELECT 
+                o.person_a as person1_id,
+                p1.name as person1,
+                o.person_b as person2_id,
+                p2.name as person2,
+                o.shared_segments as co_appearances,
+                o.overlap_seconds
+            FROM co_appearance_overlaps o
+            JOIN persons p1 ON o.person_a = p1.id
+            JOIN persons p2 ON o.person_b = p2.id
+            WHERE o.video_id = ?
+            ORDER BY o.overlap_seconds DESC
+        """
+        results = execute_query(query, (video_id,), fetch_all=True)
+        return [dict(row) for row in results] if results else []
     
     @staticmethod
     def get_processing_metrics():
         """Métricas de procesamiento de videos"""
+        engine = get_analytics_engine()
+        if engine.loaded:
+            return engine.processing_metrics()
         query = """
             SELECT 
                 AVG(duration) as avg_video_duration,
@@ -163,6 +224,9 @@ class AnalyticsService:
     @staticmethod
     def get_hourly_appearance_pattern():
         """Patrón de apariciones por hora del día"""
+        engine = get_analytics_engine()
+        if engine.loaded:
+            return engine.hourly_pattern()
         query = """
             SELECT 
                 CAST(va.start_time / 3600 AS INTEGER) as hour,
@@ -186,4 +250,20 @@ class AnalyticsService:
             WHERE duration IS NOT NULL
         """
         result = execute_query(query, fetch_one=True)
-        return result if result else {}
\ No newline at end of file
+        return result if result else {}
+    
+    @staticmethod
+    def get_screen_time_distribution(bins=20, person_id=None):
+        """Histograma de la duración de las apariciones (None sin el motor en memoria)"""
+        engine = get_analytics_engine()
+        if not engine.loaded:
+            return None
+        return engine.screen_time_distribution(bins, person_id)
+    
+    @staticmethod
+    def get_person_percentiles():
+        """Percentiles de duración de las apariciones por persona (None sin el motor en memoria)"""
+        engine = get_analytics_engine()
+        if not engine.loaded:
+            return None
+        return engine.person_percentiles()
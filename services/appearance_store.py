@@ -0,0 +1,139 @@
+"""
+Escritura de apariciones y mantenimiento de las tablas derivadas.
+
+Todas las escrituras sobre video_appearances pasan por aquí para que las
+tablas agregadas (person_stats, person_videos, daily_person_stats, co_appearances,
+co_appearance_overlaps, presence_bitmaps, ...) y las columnas resumen de
+videos se actualicen en la misma transacción.
+"""
+from database import get_db
+from models import Person, Video, PersonStats, PersonVideos, DailyStats, CoAppearance, notify_change
+from services import overlap_service, presence_service, similarity_service, detection_store
+from datetime import datetime
+import json
+import time
+
+def _detach_video(cursor, video_id):
+    """Quitar la contribución actual del video de las tablas derivadas"""
+    PersonStats.apply_video(cursor, video_id, -1)
+    PersonVideos.apply_video(cursor, video_id, -1)
+    DailyStats.apply_video(cursor, video_id, -1)
+    CoAppearance.apply_video(cursor, video_id, -1)
+    overlap_service.apply_video(cursor, video_id, -1)
+    presence_service.apply_video(cursor, video_id, -1)
+
+def _attach_video(cursor, video_id):
+    """Sumar la contribución del video a las tablas derivadas"""
+    PersonStats.apply_video(cursor, video_id, 1)
+    PersonVideos.apply_video(cursor, video_id, 1)
+    DailyStats.apply_video(cursor, video_id, 1)
+    CoAppearance.apply_video(cursor, video_id, 1)
+    overlap_service.apply_video(cursor, video_id, 1)
+    presence_service.apply_video(cursor, video_id, 1)
+
+def store_video_analysis(video_id, appearances, analysis_result, detections=None, smoothing=None, stats=None):
+    """
+    Reemplazar las apariciones de un video y marcarlo como procesado
+    appearances: {person_id: [(start_time, end_time), ...]}
+    detections: {person_id: [(timestamp, distancia, frame, caja), ...]} crudas, si se quieren guardar
+    smoothing: parámetros con los que se obtuvieron los segmentos
+    stats: contadores del procesamiento, se guardan junto a las detecciones
+    """
+    rows = [
+        (video_id, person_id, start_time, end_time)
+        for person_id, segments in appearances.items()
+        for start_time, end_time in segments
+    ]
+    
+    with get_db() as conn:
+        cursor = conn.cursor()
+        
+        _detach_video(cursor, video_id)
+        cursor.execute("DELETE FROM video_appearances WHERE video_id = ?", (video_id,))
+        cursor.executemany(
+            "INSERT INTO video_appearances (video_id, person_id, start_time, end_time) VALUES (?, ?, ?, ?)",
+            rows
+        )
+        cursor.execute(
+            "UPDATE videos SET processed = 1, analysis_result = ?, processed_at = ? WHERE id = ?",
+            (analysis_result, datetime.now().isoformat(), video_id)
+        )
+        Video.refresh_summary(cursor, video_id)
+        _attach_video(cursor, video_id)
+        similarity_service.mark_dirty(cursor, video_id)
+        
+        if detections is not None:
+            detection_store.save_detections(cursor, video_id, detections, stats=stats, **(smoothing or {}))
+        elif smoothing:
+            detection_store.save_parameters(cursor, video_id, **smoothing)
+        
+        conn.commit()
+    
+    notify_change('video_appearances', 'update', video_id)
+    similarity_service.refresh_dirty()
+
+def resmooth_video(video_id, threshold=None, min_length=None, max_distance=None, save=True):
+    """
+    Recalcular los segmentos de un video desde sus detecciones crudas
+    Los parámetros en None conservan los guardados (max_distance=False la quita)
+    Retorna None si el video no tiene detecciones guardadas
+    """
+    stored = detection_store.load_detections(video_id)
+    if stored is None:
+        return None
+    
+    smoothing = {
+        'threshold': stored['threshold'] if threshold is None else threshold,
+        'min_length': stored['min_length'] if min_length is None else min_length,
+        'max_distance': stored['max_distance'] if max_distance is None else (max_distance or None)
+    }
+    
+    t0 = time.perf_counter()
+    appearances = detection_store.smooth_detections(stored, **smoothing)
+    elapsed_ms = (time.perf_counter() - t0) * 1000
+    
+    person_names = {person['id']: person['name'] for person in Person.get_all()}
+    result = detection_store.format_analysis_result(appearances, person_names, stored)
+    if save:
+        store_video_analysis(video_id, appearances, json.dumps(result), smoothing=smoothing)
+    
+    return {
+        'video_id': video_id,
+        'parameters': smoothing,
+        'detections': len(stored['timestamps']),
+        'segments': sum(len(segments) for segments in appearances.values()),
+        'smoothing_ms': round(elapsed_ms, 3),
+        'saved': save,
+        'analysis': result
+    }
+
+def delete_video_appearances(video_id):
+    """Eliminar las apariciones de un video"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        _detach_video(cursor, video_id)
+        cursor.execute("DELETE FROM video_appearances WHERE video_id = ?", (video_id,))
+        Video.refresh_summary(cursor, video_id)
+        similarity_service.mark_dirty(cursor, video_id)
+        conn.commit()
+    
+    notify_change('video_appearances', 'update', video_id)
+    similarity_service.refresh_dirty()
+
+def remove_video(video_id):
+    """Eliminar un video junto con sus apariciones"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT original_filename FROM videos WHERE id = ?", (video_id,))
+        video = cursor.fetchone()
+        
+        _detach_video(cursor, video_id)
+        cursor.execute("DELETE FROM video_appearances WHERE video_id = ?", (video_id,))
+        cursor.execute("DELETE FROM video_detections WHERE video_id = ?", (video_id,))
+        cursor.execute("DELETE FROM videos WHERE id = ?", (video_id,))
+        similarity_service.mark_dirty(cursor, video_id)
+        conn.commit()
+    
+    similarity_service.refresh_dirty()
+    if video:
+        notify_change('videos', 'delete', video_id, old_text=video['original_filename'])
@@ -0,0 +1,150 @@
+"""
+Snapshot en memoria de las estadísticas del dashboard.
+
+AnalyticsService.get_dashboard_stats ejecuta varias agregaciones sobre
+videos, persons y video_appearances; aquí se calculan una vez y se sirven
+desde memoria hasta que:
+
+- pasa el TTL (la actividad reciente depende de la fecha actual),
+- una escritura de este proceso avisa por models.on_change, o
+- cambia data_version (escrituras de otros procesos o que no pasan por
+  models). La versión se consulta como mucho cada VERSION_CHECK_INTERVAL
+  segundos para que servir el snapshot no abra una conexión por petición.
+
+Opcionalmente un hilo en segundo plano recalcula el snapshot en cuanto
+queda obsoleto, de modo que las peticiones no esperan al cálculo.
+"""
+from models import on_change
+from services.analytics_service import AnalyticsService
+from services.data_version import get_data_version
+import threading
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 60
+VERSION_CHECK_INTERVAL = 1.0
+
+class DashboardCache:
+    def __init__(self, compute, ttl=DEFAULT_TTL):
+        self.compute = compute
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._version = None
+        self._computed_at = 0.0
+        self._checked_at = 0.0
+        self._invalid = True
+        self._hits = 0
+        self._misses = 0
+        self._wakeup = threading.Event()
+        self._refresher = None
+        self.running = False
+
+    def _is_fresh(self, now):
+        if self._invalid or self._snapshot is None:
+            return False
+        if now - self._computed_at >= self.ttl:
+            return False
+        if now - self._checked_at >= VERSION_CHECK_INTERVAL:
+            self._checked_at = now
+            if get_data_version() != self._version:
+                return False
+        return True
+
+    def _refresh(self):
+        # La versión se lee antes de calcular: si hay una escritura durante
+        # el cálculo, el siguiente control la detecta y se recalcula
+        self._invalid = False
+        try:
+            version = get_data_version()
+            snapshot = self.compute()
+        except Exception:
+            self._invalid = True
+            raise
+        now = time.monotonic()
+        self._snapshot, self._version = snapshot, version
+        self._computed_at = self._checked_at = now
+        return snapshot
+
+    def get(self):
+        """Snapshot vigente; se recalcula si está obsoleto"""
+        now = time.monotonic()
+        snapshot = self._snapshot
+        if snapshot is not None and not self._invalid and now - self._checked_at < VERSION_CHECK_INTERVAL \
+                and now - self._computed_at < self.ttl:
+            self._hits += 1
+            return snapshot
+
+        with self._lock:
+            if self._is_fresh(time.monotonic()):
+                self._hits += 1
+                return self._snapshot
+            self._misses += 1
+            return self._refresh()
+
+    def invalidate(self):
+        """Descartar el snapshot actual"""
+        self._invalid = True
+        self._wakeup.set()
+
+    def handle_change(self, table, action, record_id, text=None, old_text=None):
+        """Listener de models: cualquier escritura puede cambiar los totales"""
+        self.invalidate()
+
+    def start_background_refresh(self, interval=VERSION_CHECK_INTERVAL):
+        """Recalcular en un hilo en cuanto el snapshot quede obsoleto"""
+        if self.running:
+            return
+        self.running = True
+        self._refresher = threading.Thread(
+            target=self._refresh_loop, args=(interval,), name='DashboardRefresh', daemon=True
+        )
+        self._refresher.start()
+        logger.info("Refresco del dashboard en segundo plano iniciado")
+
+    def stop_background_refresh(self):
+        self.running = False
+        self._wakeup.set()
+        if self._refresher:
+            self._refresher.join(timeout=5)
+            self._refresher = None
+
+    def _refresh_loop(self, interval):
+        while self.running:
+            self._wakeup.wait(interval)
+            self._wakeup.clear()
+            if not self.running:
+                break
+            try:
+                with self._lock:
+                    if not self._is_fresh(time.monotonic()):
+                        self._refresh()
+            except Exception as e:
+                logger.error(f"Error refrescando el dashboard: {e}")
+
+    def get_stats(self):
+        return {
+            'hits': self._hits,
+            'misses': self._misses,
+            'version': self._version,
+            'age_seconds': round(time.monotonic() - self._computed_at, 3) if self._snapshot is not None else None,
+            'ttl': self.ttl,
+            'background_refresh': self.running
+        }
+
+# Instancia global del snapshot del dashboard
+dashboard_cache = DashboardCache(AnalyticsService.compute_dashboard_stats)
+on_change(dashboard_cache.handle_change)
+
+def get_dashboard_cache():
+    """Obtener la instancia del snapshot del dashboard"""
+    return dashboard_cache
+
+def start_dashboard_refresh():
+    """Iniciar el refresco en segundo plano del snapshot global"""
+    dashboard_cache.start_background_refresh()
+
+def stop_dashboard_refresh():
+    dashboard_cache.stop_background_refresh()
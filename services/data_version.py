@@ -0,0 +1,51 @@
+"""
+Contador global de versión de los datos.
+
+Triggers sobre las tablas de las que dependen las respuestas de lectura
+incrementan data_version.version en cada INSERT, UPDATE o DELETE, en la
+misma transacción que la escritura y sin importar qué proceso la haga.
+Se usa para los ETag de la API y para invalidar cachés en memoria.
+"""
+from database import get_db, execute_query
+import sqlite3
+
+TRACKED_TABLES = ['videos', 'persons', 'video_appearances', 'video_tags', 'notifications']
+
+def ensure_data_version():
+    """Crear la tabla data_version y sus triggers si no existen"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS data_version (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                version INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        cursor.execute("INSERT OR IGNORE INTO data_version (id, version) VALUES (1, 0)")
+        
+        for table in TRACKED_TABLES:
+            for action in ('INSERT', 'UPDATE', 'DELETE'):
+                cursor.execute(f"""
+                    CREATE TRIGGER IF NOT EXISTS {table}_version_{action.lower()} AFTER {action} ON {table}
+                    BEGIN
+                        UPDATE data_version SET version = version + 1 WHERE id = 1;
+                    END
+                """)
+        
+        conn.commit()
+
+def bump_data_version(cursor):
+    """
+    Incrementar la versión dentro de la transacción de cursor, para tablas
+    derivadas sin triggers que también se sirven con ETag (video_neighbors)
+    """
+    try:
+        cursor.execute("UPDATE data_version SET version = version + 1 WHERE id = 1")
+    except sqlite3.OperationalError:
+        # Migraciones anteriores a la tabla data_version
+        pass
+
+def get_data_version():
+    """Versión actual de los datos (0 si la tabla aún no existe)"""
+    row = execute_query("SELECT version FROM data_version WHERE id = 1", fetch_one=True)
+    return row['version'] if row else 0
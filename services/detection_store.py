@@ -0,0 +1,289 @@
+"""
+Detecciones crudas de rostros por video y suavizado en segmentos.
+
+analyze_video_faces entrega, para cada persona reconocida, las detecciones
+(timestamp, distancia, frame, caja) con la caja (top, right, bottom, left) en
+coordenadas del frame original. Se guardan en video_detections como columnas
+empaquetadas en BLOB (float32 / int32 / int16, una fila por video), de modo
+que los segmentos pueden recalcularse con otros parámetros (umbral de unión,
+duración mínima, distancia máxima) sin volver a decodificar el video, y las
+etapas posteriores (emociones, miniaturas) recortan el rostro directamente.
+
+Las detecciones se enlazan a un segmento por persona y rango de tiempo; cada
+segmento del analysis_result lleva su detección representativa (la de menor
+distancia) con frame_number y face_locations.
+
+smooth_detections une detecciones consecutivas de la misma persona separadas
+por a lo sumo `threshold` segundos; con NumPy lo hace de forma vectorizada
+con np.diff y sin NumPy con el recorrido original.
+"""
+from database import get_db, execute_query
+from array import array
+import json
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+SMOOTHING_THRESHOLD = 3.0
+MIN_SEGMENT_LENGTH = 0.0
+NO_FRAME = -1
+
+_DTYPES = {'f': 'float32', 'i': 'int32', 'h': 'int16'}
+
+def _encode(typecode, values):
+    return array(typecode, values).tobytes()
+
+def _decode(typecode, blob):
+    if blob is None:
+        return None
+    if NUMPY_AVAILABLE:
+        return np.frombuffer(blob, dtype=_DTYPES[typecode])
+    values = array(typecode)
+    values.frombytes(blob)
+    return values
+
+def flatten(detections):
+    """
+    {person_id: [(timestamp, distancia[, frame, caja])]} -> columnas
+    (timestamps, person_ids, distances, frame_numbers, boxes); boxes va
+    aplanada, cuatro valores por detección. Sin frame o caja se guardan
+    NO_FRAME y ceros.
+    """
+    columns = {'timestamps': [], 'person_ids': [], 'distances': [],
+               'frame_numbers': [], 'boxes': []}
+    for person_id, person_detections in detections.items():
+        for detection in person_detections:
+            timestamp, distance = detection[0], detection[1]
+            frame_number = detection[2] if len(detection) > 2 else None
+            box = detection[3] if len(detection) > 3 else None
+            columns['timestamps'].append(timestamp)
+            columns['person_ids'].append(person_id)
+            columns['distances'].append(distance)
+            columns['frame_numbers'].append(NO_FRAME if frame_number is None else frame_number)
+            columns['boxes'].extend(box if box is not None else (0, 0, 0, 0))
+    return columns
+
+def smooth_detections(columns, threshold=SMOOTHING_THRESHOLD,
+                      min_length=MIN_SEGMENT_LENGTH, max_distance=None):
+    """
+    Segmentos {person_id: [(inicio, fin)]} a partir de detecciones en columnas
+    max_distance: descarta detecciones con distancia mayor (None = todas)
+    min_length: descarta segmentos más cortos (0 conserva los de una detección)
+    """
+    timestamps, person_ids, distances = (
+        columns['timestamps'], columns['person_ids'], columns['distances']
+    )
+    if not len(timestamps):
+        return {}
+
+    if not NUMPY_AVAILABLE:
+        return _smooth_python(timestamps, person_ids, distances, threshold, min_length, max_distance)
+
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    person_ids = np.asarray(person_ids, dtype=np.int64)
+    if max_distance is not None:
+        keep = np.asarray(distances, dtype=np.float64) <= max_distance
+        timestamps, person_ids = timestamps[keep], person_ids[keep]
+        if not len(timestamps):
+            return {}
+
+    order = np.lexsort((timestamps, person_ids))
+    timestamps, person_ids = timestamps[order], person_ids[order]
+
+    # Empieza un segmento donde cambia la persona o el salto supera el umbral
+    breaks = (np.diff(person_ids) != 0) | (np.diff(timestamps) > threshold)
+    starts = np.flatnonzero(np.r_[True, breaks])
+    ends = np.r_[starts[1:] - 1, len(timestamps) - 1]
+
+    segment_starts, segment_ends = timestamps[starts], timestamps[ends]
+    long_enough = (segment_ends - segment_starts) >= min_length
+
+    appearances = {}
+    for person_id, start, end in zip(person_ids[starts][long_enough].tolist(),
+                                     segment_starts[long_enough].tolist(),
+                                     segment_ends[long_enough].tolist()):
+        appearances.setdefault(person_id, []).append((start, end))
+    return appearances
+
+def _smooth_python(timestamps, person_ids, distances, threshold, min_length, max_distance):
+    by_person = {}
+    for timestamp, person_id, distance in zip(timestamps, person_ids, distances):
+        if max_distance is None or distance <= max_distance:
+            by_person.setdefault(person_id, []).append(timestamp)
+
+    appearances = {}
+    for person_id, person_timestamps in by_person.items():
+        person_timestamps.sort()
+        segments = []
+        start = end = person_timestamps[0]
+        for timestamp in person_timestamps[1:]:
+            if timestamp - end <= threshold:
+                end = timestamp
+            else:
+                segments.append((start, end))
+                start = end = timestamp
+        segments.append((start, end))
+
+        segments = [(s, e) for s, e in segments if e - s >= min_length]
+        if segments:
+            appearances[person_id] = segments
+    return appearances
+
+def save_detections(cursor, video_id, detections, threshold=SMOOTHING_THRESHOLD,
+                    min_length=MIN_SEGMENT_LENGTH, max_distance=None, stats=None):
+    """
+    Guardar las detecciones crudas de un video (dentro de la transacción del
+    análisis). detections puede ser el dict del procesador o columnas de flatten.
+    stats: contadores del procesamiento (face_quality), se guardan como JSON
+    """
+    columns = detections if 'timestamps' in detections else flatten(detections)
+    cursor.execute("""
+        INSERT OR REPLACE INTO video_detections
+            (video_id, detection_count, timestamps, person_ids, distances,
+             frame_numbers, boxes, threshold, min_length, max_distance, stats)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, (video_id, len(columns['timestamps']), _encode('f', columns['timestamps']),
+          _encode('i', columns['person_ids']), _encode('f', columns['distances']),
+          _encode('i', columns['frame_numbers']), _encode('h', columns['boxes']),
+          threshold, min_length, max_distance, json.dumps(stats) if stats else None))
+
+def save_parameters(cursor, video_id, threshold, min_length, max_distance):
+    cursor.execute("""
+        UPDATE video_detections SET threshold = ?, min_length = ?, max_distance = ?
+        WHERE video_id = ?
+    """, (threshold, min_length, max_distance, video_id))
+
+def load_detections(video_id):
+    """
+    Columnas (timestamps, person_ids, distances, frame_numbers, boxes) y
+    parámetros actuales, o None. frame_numbers y boxes son None en videos
+    analizados antes de guardar las cajas.
+    """
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM video_detections WHERE video_id = ?", (video_id,))
+        row = cursor.fetchone()
+
+    if not row:
+        return None
+    return {
+        'timestamps': _decode('f', row['timestamps']),
+        'person_ids': _decode('i', row['person_ids']),
+        'distances': _decode('f', row['distances']),
+        'frame_numbers': _decode('i', row['frame_numbers']),
+        'boxes': _decode('h', row['boxes']),
+        'threshold': row['threshold'],
+        'min_length': row['min_length'],
+        'max_distance': row['max_distance'],
+        'stats': json.loads(row['stats']) if row['stats'] else None
+    }
+
+QUALITY_COUNTERS = ['faces_detected', 'faces_encoded', 'skipped_small', 'skipped_blurry',
+                    'deferred_blurry', 'deferred_profile', 'deferred_encoded', 'deferred_dropped']
+
+def get_processing_stats(video_id):
+    """Contadores del último procesamiento de un video, o None"""
+    row = execute_query("SELECT stats FROM video_detections WHERE video_id = ?", (video_id,), fetch_one=True)
+    if not row or not row['stats']:
+        return None
+    return json.loads(row['stats'])
+
+def get_quality_totals():
+    """Suma de los contadores de calidad de todos los videos con estadísticas"""
+    columns = ', '.join(f"COALESCE(SUM(json_extract(stats, '$.{name}')), 0) AS {name}"
+                        for name in QUALITY_COUNTERS)
+    row = execute_query(f"""
+        SELECT COUNT(*) AS videos, {columns}
+        FROM video_detections
+        WHERE stats IS NOT NULL
+    """, fetch_one=True)
+    totals = dict(row)
+    attempted = totals['faces_encoded'] + totals['deferred_encoded']
+    totals['encode_ratio'] = attempted / totals['faces_detected'] if totals['faces_detected'] else None
+    return totals
+
+def segment_indices(columns, person_id, start_time, end_time):
+    """Índices de las detecciones de una persona dentro de [start_time, end_time]"""
+    timestamps, person_ids = columns['timestamps'], columns['person_ids']
+    # Los segmentos se guardan redondeados a 2 decimales
+    start_time, end_time = start_time - 0.005, end_time + 0.005
+    if NUMPY_AVAILABLE:
+        timestamps = np.asarray(timestamps)
+        mask = ((np.asarray(person_ids) == person_id)
+                & (timestamps >= start_time) & (timestamps <= end_time))
+        return np.flatnonzero(mask).tolist()
+    return [
+        i for i, (timestamp, detection_person) in enumerate(zip(timestamps, person_ids))
+        if detection_person == person_id and start_time <= timestamp <= end_time
+    ]
+
+def describe_detection(columns, index):
+    """Detección como dict (frame_number y face_location solo si se guardaron)"""
+    detection = {
+        'timestamp': round(float(columns['timestamps'][index]), 3),
+        'distance': round(float(columns['distances'][index]), 4)
+    }
+    frame_numbers, boxes = columns.get('frame_numbers'), columns.get('boxes')
+    if frame_numbers is not None and int(frame_numbers[index]) != NO_FRAME:
+        detection['frame_number'] = int(frame_numbers[index])
+        detection['face_location'] = [int(v) for v in boxes[4 * index:4 * index + 4]]
+    return detection
+
+def segment_detections(columns, person_id, start_time, end_time):
+    """Detecciones de un segmento, en orden de tiempo"""
+    indices = segment_indices(columns, person_id, start_time, end_time)
+    indices.sort(key=lambda i: columns['timestamps'][i])
+    return [describe_detection(columns, i) for i in indices]
+
+def representative_detection(columns, person_id, start_time, end_time):
+    """La detección de menor distancia del segmento, o None"""
+    indices = segment_indices(columns, person_id, start_time, end_time)
+    if not indices:
+        return None
+    best = min(indices, key=lambda i: columns['distances'][i])
+    return describe_detection(columns, best)
+
+def format_segment(person_id, start_time, end_time, columns=None):
+    """Segmento del analysis_result; con columnas agrega su detección representativa"""
+    segment = {'start': round(start_time, 2), 'end': round(end_time, 2)}
+    detection = representative_detection(columns, person_id, start_time, end_time) if columns else None
+    if detection:
+        segment['person_id'] = person_id
+        segment['distance'] = detection['distance']
+        if 'frame_number' in detection:
+            segment['frame_number'] = detection['frame_number']
+            segment['face_locations'] = [detection['face_location']]
+    return segment
+
+def format_analysis_result(appearances, person_names, columns=None):
+    """analysis_result con el mismo formato que process_video"""
+    result = {}
+    for person_id, segments in appearances.items():
+        person_name = person_names.get(person_id, 'Desconocido')
+        result[person_name] = [
+            format_segment(person_id, start_time, end_time, columns)
+            for start_time, end_time in segments
+        ]
+    return result
+
+def face_detections_from_analysis(analysis):
+    """
+    Rostros por frame para analyze_video_emotions a partir de un
+    analysis_result: [{'frame_number', 'face_locations', 'person_id'}]
+    """
+    face_detections = []
+    for segments in analysis.values():
+        if not isinstance(segments, list):
+            continue
+        for segment in segments:
+            if isinstance(segment, dict) and 'frame_number' in segment:
+                face_detections.append({
+                    'frame_number': segment['frame_number'],
+                    'face_locations': segment['face_locations'],
+                    'person_id': segment.get('person_id')
+                })
+    face_detections.sort(key=lambda f: f['frame_number'])
+    return face_detections
@@ -0,0 +1,140 @@
+"""
+Detectores de rostros intercambiables para el procesador de video.
+
+La detección con HOG de dlib (number_of_times_to_upsample=1) es el mayor
+costo de CPU por frame. Cada backend expone detect(rgb_frame) y devuelve
+cajas (top, right, bottom, left) como face_recognition.face_locations, así
+que el resto del procesador (codificación, cajas guardadas) no cambia:
+
+- 'hog': face_recognition / dlib HOG, el comportamiento original.
+- 'haar': cascada Haar frontal incluida en cv2.data; mucho más rápida, con
+  más falsos positivos y peor recall en rostros pequeños o girados.
+- 'haar+hog': la cascada con parámetros permisivos propone regiones y HOG
+  confirma solo dentro de ellas (recortes ampliados con un margen), de modo
+  que el costo de HOG es proporcional al área candidata y no al frame.
+
+Los perfiles (DETECTOR_PROFILES) eligen backend y parámetros; process_video
+recibe el nombre de un perfil o de un backend.
+"""
+import cv2
+
+try:
+    import face_recognition
+    FACE_RECOGNITION_AVAILABLE = True
+except ImportError:
+    FACE_RECOGNITION_AVAILABLE = False
+
+HAAR_CASCADE = 'haarcascade_frontalface_default.xml'
+
+DETECTOR_PROFILES = {
+    'accurate': {'backend': 'hog', 'upsample': 1},
+    'balanced': {'backend': 'haar+hog', 'upsample': 1, 'margin': 0.3},
+    'fast': {'backend': 'haar', 'min_neighbors': 5}
+}
+
+DEFAULT_DETECTOR_PROFILE = 'accurate'
+
+class HogDetector:
+    name = 'hog'
+
+    def __init__(self, upsample=1):
+        if not FACE_RECOGNITION_AVAILABLE:
+            raise RuntimeError("El detector HOG requiere face_recognition")
+        self.upsample = upsample
+
+    def detect(self, rgb_frame):
+        return face_recognition.face_locations(
+            rgb_frame, model='hog', number_of_times_to_upsample=self.upsample
+        )
+
+class HaarDetector:
+    name = 'haar'
+
+    def __init__(self, scale_factor=1.1, min_neighbors=5, min_size=20, cascade=HAAR_CASCADE):
+        self.classifier = cv2.CascadeClassifier(cv2.data.haarcascades + cascade)
+        if self.classifier.empty():
+            raise RuntimeError(f"No se pudo cargar la cascada {cascade}")
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.min_size = min_size
+
+    def candidates(self, rgb_frame):
+        """Rectángulos (x, y, w, h) de la cascada sobre el frame en grises"""
+        gray = cv2.cvtColor(rgb_frame, cv2.COLOR_RGB2GRAY)
+        gray = cv2.equalizeHist(gray)
+        rects = self.classifier.detectMultiScale(
+            gray, scaleFactor=self.scale_factor, minNeighbors=self.min_neighbors,
+            minSize=(self.min_size, self.min_size)
+        )
+        return [tuple(int(v) for v in rect) for rect in rects]
+
+    def detect(self, rgb_frame):
+        return [(y, x + w, y + h, x) for x, y, w, h in self.candidates(rgb_frame)]
+
+class CascadeDetector:
+    """Haar como pre-filtro y HOG solo dentro de las regiones candidatas"""
+    name = 'haar+hog'
+
+    def __init__(self, upsample=1, margin=0.3, min_neighbors=3, scale_factor=1.1, min_size=20):
+        self.haar = HaarDetector(scale_factor=scale_factor, min_neighbors=min_neighbors, min_size=min_size)
+        self.hog = HogDetector(upsample=upsample)
+        self.margin = margin
+
+    def detect(self, rgb_frame):
+        height, width = rgb_frame.shape[:2]
+        locations = []
+        for x, y, w, h in self.haar.candidates(rgb_frame):
+            pad_x, pad_y = int(w * self.margin), int(h * self.margin)
+            left, top = max(x - pad_x, 0), max(y - pad_y, 0)
+            right, bottom = min(x + w + pad_x, width), min(y + h + pad_y, height)
+
+            for t, r, b, l in self.hog.detect(rgb_frame[top:bottom, left:right]):
+                box = (t + top, r + left, b + top, l + left)
+                # Las regiones ampliadas pueden solaparse: un rostro, una caja
+                if not any(_overlaps(box, other) for other in locations):
+                    locations.append(box)
+        return locations
+
+def _overlaps(a, b, min_iou=0.5):
+    top, right = max(a[0], b[0]), min(a[1], b[1])
+    bottom, left = min(a[2], b[2]), max(a[3], b[3])
+    if right <= left or bottom <= top:
+        return False
+    inter = (right - left) * (bottom - top)
+    area = lambda box: (box[1] - box[3]) * (box[2] - box[0])
+    return inter / float(area(a) + area(b) - inter) >= min_iou
+
+BACKENDS = {
+    'hog': HogDetector,
+    'haar': HaarDetector,
+    'haar+hog': CascadeDetector
+}
+
+def is_valid_detector(profile):
+    if profile is None:
+        return True
+    return isinstance(profile, str) and (profile in DETECTOR_PROFILES or profile in BACKENDS)
+
+def get_detector(profile=None):
+    """
+    Detector para un perfil de DETECTOR_PROFILES o un backend de BACKENDS
+    (None usa DEFAULT_DETECTOR_PROFILE)
+    """
+    profile = profile or DEFAULT_DETECTOR_PROFILE
+    if profile in DETECTOR_PROFILES:
+        options = dict(DETECTOR_PROFILES[profile])
+        backend = options.pop('backend')
+    elif profile in BACKENDS:
+        backend, options = profile, {}
+    else:
+        raise ValueError(f"Detector desconocido: {profile}")
+    return BACKENDS[backend](**options)
+
+def list_detectors():
+    """Perfiles y backends aceptados por get_detector"""
+    return {
+        'default': DEFAULT_DETECTOR_PROFILE,
+        'profiles': DETECTOR_PROFILES,
+        'backends': list(BACKENDS),
+        'face_recognition': FACE_RECOGNITION_AVAILABLE
+    }
@@ -0,0 +1,133 @@
+"""
+Filtro de calidad de rostros antes de codificarlos.
+
+face_recognition.face_encodings ejecuta landmarks de 5 puntos (modelo 'small')
+y una pasada de la ResNet por cada caja, aunque sea un rostro diminuto o
+movido que nunca va a coincidir. assess_faces decide con medidas baratas, en
+este orden:
+
+- tamaño de la caja: por debajo de MIN_FACE_SIZE se descarta;
+- nitidez: varianza del Laplaciano del recorte normalizado a SHARPNESS_WIDTH
+  px; por debajo de BLUR_DROP se descarta y por debajo de BLUR_DEFER se
+  difiere;
+- pose: con los 5 landmarks del modelo 'small' se estima el giro (yaw) como
+  el desplazamiento de la nariz respecto del centro de los ojos, en unidades
+  de distancia entre ojos; por encima de MAX_YAW (perfil) se difiere.
+
+Los landmarks se calculan en una sola pasada, solo para las cajas que
+superan tamaño y nitidez, y encode_faces los reutiliza para la ResNet: cada
+rostro codificado pasa una sola vez por el predictor de landmarks.
+
+Los rostros diferidos no se pierden: el procesador los codifica al final
+solo si caen en tramos sin ninguna detección aceptada, donde podrían aportar
+recall.
+"""
+import cv2
+
+try:
+    import numpy as np
+    from face_recognition import api as face_api
+    FACE_RECOGNITION_AVAILABLE = True
+except ImportError:
+    FACE_RECOGNITION_AVAILABLE = False
+
+MIN_FACE_SIZE = 32
+SHARPNESS_WIDTH = 96
+BLUR_DROP = 15.0
+BLUR_DEFER = 40.0
+MAX_YAW = 0.5
+DEFER_MARGIN = 0.5
+MAX_DEFERRED = 300
+
+ENCODE, DEFER, DROP = 'encode', 'defer', 'drop'
+
+def new_stats():
+    """Contadores de calidad que el procesador guarda con las detecciones"""
+    return {
+        'faces_detected': 0,
+        'faces_encoded': 0,
+        'skipped_small': 0,
+        'skipped_blurry': 0,
+        'deferred_blurry': 0,
+        'deferred_profile': 0,
+        'deferred_encoded': 0,
+        'deferred_dropped': 0
+    }
+
+def sharpness(gray_frame, box):
+    """Varianza del Laplaciano del recorte (escalado a un ancho fijo)"""
+    top, right, bottom, left = box
+    crop = gray_frame[max(top, 0):bottom, max(left, 0):right]
+    if crop.size == 0:
+        return 0.0
+    height = max(int(crop.shape[0] * SHARPNESS_WIDTH / crop.shape[1]), 1)
+    crop = cv2.resize(crop, (SHARPNESS_WIDTH, height))
+    return float(cv2.Laplacian(crop, cv2.CV_64F).var())
+
+def yaw_from_landmarks(shape):
+    """Giro aproximado (0 = frontal) a partir de los 5 landmarks de dlib"""
+    points = [(point.x, point.y) for point in shape.parts()]
+    # Mismo orden que face_recognition.face_landmarks(model='small')
+    right_eye = (points[0][0] + points[1][0]) / 2
+    left_eye = (points[2][0] + points[3][0]) / 2
+    nose = points[4][0]
+    eye_distance = abs(right_eye - left_eye)
+    if eye_distance < 1:
+        # Ojos superpuestos: rostro de perfil
+        return 1.0
+    return abs(nose - (left_eye + right_eye) / 2) / eye_distance
+
+def _check_box(gray_frame, box):
+    """Tamaño y nitidez: (decisión, contador)"""
+    top, right, bottom, left = box
+    if min(bottom - top, right - left) < MIN_FACE_SIZE:
+        return DROP, 'skipped_small'
+    score = sharpness(gray_frame, box)
+    if score < BLUR_DROP:
+        return DROP, 'skipped_blurry'
+    if score < BLUR_DEFER:
+        return DEFER, 'deferred_blurry'
+    return ENCODE, None
+
+def assess_faces(rgb_frame, gray_frame, boxes, stats=None):
+    """
+    [(caja, ENCODE | DEFER | DROP, landmarks)] para cajas (top, right,
+    bottom, left); landmarks es el resultado de dlib para encode_faces (None
+    si la caja no se codifica)
+    """
+    results = [[box, *_check_box(gray_frame, box), None] for box in boxes]
+
+    candidates = [result for result in results if result[1] == ENCODE]
+    if candidates and FACE_RECOGNITION_AVAILABLE:
+        shapes = face_api._raw_face_landmarks(rgb_frame, [result[0] for result in candidates], model='small')
+        for result, shape in zip(candidates, shapes):
+            if yaw_from_landmarks(shape) > MAX_YAW:
+                result[1], result[2] = DEFER, 'deferred_profile'
+            else:
+                result[3] = shape
+
+    if stats is not None:
+        for _, decision, counter, _ in results:
+            stats['faces_detected'] += 1
+            if decision != ENCODE:
+                stats[counter] += 1
+    return [(box, decision, shape) for box, decision, _, shape in results]
+
+def encode_faces(rgb_frame, landmarks):
+    """Embeddings como face_recognition.face_encodings, con landmarks ya calculados"""
+    return [np.array(face_api.face_encoder.compute_face_descriptor(rgb_frame, shape, 1))
+            for shape in landmarks]
+
+def defer_crop(rgb_frame, box):
+    """Recorte con margen y la caja relativa a él, para codificar más tarde"""
+    top, right, bottom, left = box
+    height, width = rgb_frame.shape[:2]
+    pad_y, pad_x = int((bottom - top) * DEFER_MARGIN), int((right - left) * DEFER_MARGIN)
+    crop_top, crop_left = max(top - pad_y, 0), max(left - pad_x, 0)
+    crop_bottom, crop_right = min(bottom + pad_y, height), min(right + pad_x, width)
+    crop = rgb_frame[crop_top:crop_bottom, crop_left:crop_right].copy()
+    return crop, (top - crop_top, right - crop_left, bottom - crop_top, left - crop_left)
+
+def uncovered(timestamp, covered_timestamps, window):
+    """True si no hay ninguna detección aceptada a menos de window segundos"""
+    return not any(abs(timestamp - other) <= window for other in covered_timestamps)
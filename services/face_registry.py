@@ -0,0 +1,222 @@
+"""
+Registro en memoria de los rostros conocidos (galería) compartido por los workers.
+
+Antes cada video llamaba a load_known_faces(), que vuelve a leer y codificar
+las fotos de todas las personas. El registro guarda una sola vez por proceso
+la matriz de embeddings (una fila por persona), los ids y los nombres, y solo
+la reconstruye cuando cambia gallery_version: triggers sobre persons la
+incrementan al crear, renombrar o eliminar una persona, en la misma
+transacción y sin importar qué proceso haga la escritura.
+
+Al reconstruir solo se codifican las fotos nuevas: los embeddings se guardan
+por (person_id, photo_path), así que un renombrado no vuelve a pasar por el
+codificador.
+
+Para workers en procesos separados, publish_shared() copia la matriz a un
+bloque de multiprocessing.shared_memory y devuelve un descriptor pequeño
+(nombre del bloque, forma, ids, nombres, versión) que el proceso hijo abre
+con attach_shared() sin duplicar los embeddings.
+"""
+from database import get_db, execute_query
+from models import Person
+import threading
+import logging
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+try:
+    from multiprocessing import shared_memory
+    SHARED_MEMORY_AVAILABLE = NUMPY_AVAILABLE
+except ImportError:
+    SHARED_MEMORY_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+def ensure_gallery_version():
+    """Crear la tabla gallery_version y sus triggers sobre persons si no existen"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS gallery_version (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                version INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        cursor.execute("INSERT OR IGNORE INTO gallery_version (id, version) VALUES (1, 0)")
+
+        for action, event in (('insert', 'INSERT'),
+                              ('update', 'UPDATE OF name, photo_path'),
+                              ('delete', 'DELETE')):
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS persons_gallery_{action} AFTER {event} ON persons
+                BEGIN
+                    UPDATE gallery_version SET version = version + 1 WHERE id = 1;
+                END
+            """)
+
+        conn.commit()
+
+def get_gallery_version():
+    """Versión actual de la galería (0 si la tabla aún no existe)"""
+    try:
+        row = execute_query("SELECT version FROM gallery_version WHERE id = 1", fetch_one=True)
+    except Exception:
+        return 0
+    return row['version'] if row else 0
+
+class KnownFaces:
+    """Galería inmutable: se reemplaza entera al recargar, nunca se modifica"""
+    def __init__(self, encodings, names, ids, version, shared_block=None):
+        self.encodings = encodings
+        self.names = names
+        self.ids = ids
+        self.version = version
+        self._shared_block = shared_block
+
+    def __len__(self):
+        return len(self.ids)
+
+    def as_tuple(self):
+        """(known_encodings, known_names, known_ids) como load_known_faces()"""
+        return self.encodings, self.names, self.ids
+
+class FaceRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._faces = None
+        self._encoder = None
+        self._encoding_cache = {}
+        self._shared = None
+        self._loads = 0
+        self._hits = 0
+        self._encoded = 0
+
+    def _build(self, encode_person, version):
+        encodings, names, ids = [], [], []
+        cache = {}
+        for person in Person.get_all():
+            key = (person['id'], person['photo_path'])
+            if key in self._encoding_cache:
+                encoding = self._encoding_cache[key]
+            else:
+                encoding = encode_person(person)
+                self._encoded += 1
+            cache[key] = encoding
+            if encoding is None:
+                continue
+            encodings.append(encoding)
+            names.append(person['name'])
+            ids.append(person['id'])
+
+        # Las personas eliminadas o con otra foto salen de la caché
+        self._encoding_cache = cache
+        if NUMPY_AVAILABLE and encodings:
+            encodings = np.vstack([np.asarray(e, dtype=np.float64) for e in encodings])
+        return KnownFaces(encodings, names, ids, version)
+
+    def get(self, encode_person):
+        """
+        Galería vigente; se recarga si cambió gallery_version o el codificador
+        encode_person(person) -> embedding, o None si la foto no tiene rostro
+        """
+        version = get_gallery_version()
+        with self._lock:
+            faces = self._faces
+            if faces is not None and faces.version == version and self._encoder is encode_person:
+                self._hits += 1
+                return faces
+
+            if self._encoder is not encode_person:
+                self._encoding_cache = {}
+                self._encoder = encode_person
+            self._faces = self._build(encode_person, version)
+            self._loads += 1
+            logger.info(f"Galería cargada: {len(self._faces)} rostros (versión {version})")
+            return self._faces
+
+    def invalidate(self):
+        with self._lock:
+            self._faces = None
+
+    def publish_shared(self, encode_person):
+        """
+        Descriptor de la galería vigente en memoria compartida para procesos
+        hijos (None si no hay NumPy o la galería está vacía). El bloque se
+        reutiliza mientras la versión no cambie.
+        """
+        faces = self.get(encode_person)
+        if not SHARED_MEMORY_AVAILABLE or not len(faces):
+            return None
+
+        with self._lock:
+            if self._shared is not None and self._shared[1]['version'] == faces.version:
+                return self._shared[1]
+
+            matrix = faces.encodings
+            block = shared_memory.SharedMemory(create=True, size=matrix.nbytes)
+            np.ndarray(matrix.shape, dtype=matrix.dtype, buffer=block.buf)[:] = matrix
+            descriptor = {
+                'name': block.name,
+                'shape': matrix.shape,
+                'dtype': matrix.dtype.str,
+                'names': list(faces.names),
+                'ids': list(faces.ids),
+                'version': faces.version
+            }
+
+            # Los hijos que ya abrieron el bloque anterior conservan su mapeo
+            self._release_shared()
+            self._shared = (block, descriptor)
+            return descriptor
+
+    def _release_shared(self):
+        if self._shared is not None:
+            block = self._shared[0]
+            block.close()
+            try:
+                block.unlink()
+            except FileNotFoundError:
+                pass
+            self._shared = None
+
+    def close(self):
+        """Liberar el bloque de memoria compartida (al detener los workers)"""
+        with self._lock:
+            self._release_shared()
+
+    def get_stats(self):
+        faces = self._faces
+        return {
+            'loaded': faces is not None,
+            'faces': len(faces) if faces is not None else 0,
+            'version': faces.version if faces is not None else None,
+            'loads': self._loads,
+            'hits': self._hits,
+            'encoded_photos': self._encoded,
+            'shared_block': self._shared[1]['name'] if self._shared else None
+        }
+
+def attach_shared(descriptor):
+    """KnownFaces sobre el bloque compartido publicado por el proceso padre"""
+    try:
+        # Solo el proceso padre debe liberar el bloque (track existe desde 3.13)
+        block = shared_memory.SharedMemory(name=descriptor['name'], track=False)
+    except TypeError:
+        block = shared_memory.SharedMemory(name=descriptor['name'])
+        # Antes de 3.13 el hijo registra el bloque y lo borraría al terminar
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(block._name, 'shared_memory')
+    encodings = np.ndarray(descriptor['shape'], dtype=np.dtype(descriptor['dtype']), buffer=block.buf)
+    return KnownFaces(encodings, descriptor['names'], descriptor['ids'],
+                      descriptor['version'], shared_block=block)
+
+# Instancia global del registro
+face_registry = FaceRegistry()
+
+def get_face_registry():
+    """Obtener el registro de rostros conocidos del proceso"""
+    return face_registry
@@ -0,0 +1,139 @@
+"""
+Índice de intervalos en memoria para consultas "¿quién está en pantalla en T?".
+
+Cada video se indexa con un árbol de intervalos implícito sobre los segmentos
+ordenados por inicio (mismo esquema que cgranges): el nodo i guarda el máximo
+end_time de su subárbol, así que una consulta visita O(log n + m) nodos.
+Los índices se construyen bajo demanda y se cachean por video; la caché se
+invalida sola cuando cambia processed_at del video.
+"""
+from collections import OrderedDict
+from database import execute_query
+import threading
+
+LINEAR_SCAN_LEVEL = 3
+MAX_CACHED_VIDEOS = 64
+
+class VideoIntervalIndex:
+    def __init__(self, segments):
+        """segments: filas con person_id, person_name, start_time, end_time"""
+        self.segments = sorted(segments, key=lambda s: s['start_time'])
+        self.starts = [s['start_time'] for s in self.segments]
+        self.ends = [s['end_time'] for s in self.segments]
+        self.max_ends = list(self.ends)
+        self.root_level = self._build()
+
+    def __len__(self):
+        return len(self.segments)
+
+    def _build(self):
+        n = len(self.segments)
+        if n == 0:
+            return -1
+        
+        max_ends = self.max_ends
+        last_i = (n - 1) & ~1
+        last = max_ends[last_i]
+        
+        level = 1
+        while (1 << level) <= n:
+            half = 1 << (level - 1)
+            for i in range((half << 1) - 1, n, half << 2):
+                left = max_ends[i - half]
+                right = max_ends[i + half] if i + half < n else last
+                max_ends[i] = max(self.ends[i], left, right)
+            
+            # last_i pasa a apuntar al padre del último nodo real
+            last_i = last_i - half if (last_i >> level) & 1 else last_i + half
+            if last_i < n and max_ends[last_i] > last:
+                last = max_ends[last_i]
+            level += 1
+        
+        return level - 1
+
+    def query(self, start, end):
+        """Segmentos con start_time <= end y end_time >= start (intervalos cerrados)"""
+        n = len(self.segments)
+        if n == 0:
+            return []
+        
+        starts, ends, max_ends = self.starts, self.ends, self.max_ends
+        found = []
+        stack = [(self.root_level, (1 << self.root_level) - 1, False)]
+        
+        while stack:
+            level, node, left_done = stack.pop()
+            
+            if level <= LINEAR_SCAN_LEVEL:
+                i = node >> level << level
+                stop = min(i + (1 << (level + 1)) - 1, n)
+                while i < stop and starts[i] <= end:
+                    if ends[i] >= start:
+                        found.append(i)
+                    i += 1
+            elif not left_done:
+                left = node - (1 << (level - 1))
+                stack.append((level, node, True))
+                if left >= n or max_ends[left] >= start:
+                    stack.append((level - 1, left, False))
+            elif node < n and starts[node] <= end:
+                if ends[node] >= start:
+                    found.append(node)
+                stack.append((level - 1, node + (1 << (level - 1)), False))
+        
+        found.sort()
+        return [self.segments[i] for i in found]
+
+    def at(self, timestamp):
+        """Segmentos que contienen el instante indicado"""
+        return self.query(timestamp, timestamp)
+
+class IntervalIndexCache:
+    def __init__(self, max_videos=MAX_CACHED_VIDEOS):
+        self.max_videos = max_videos
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, video_id):
+        """Índice del video, o None si el video no existe"""
+        video = execute_query("SELECT processed_at FROM videos WHERE id = ?", (video_id,), fetch_one=True)
+        if not video:
+            self.invalidate(video_id)
+            return None
+        
+        stamp = video['processed_at']
+        with self._lock:
+            cached = self._indexes.get(video_id)
+            if cached and cached[0] == stamp:
+                self._indexes.move_to_end(video_id)
+                return cached[1]
+        
+        segments = execute_query("""
+            SELECT va.id, va.person_id, p.name as person_name, va.start_time, va.end_time
+            FROM video_appearances va
+            JOIN persons p ON va.person_id = p.id
+            WHERE va.video_id = ?
+        """, (video_id,), fetch_all=True)
+        index = VideoIntervalIndex([dict(s) for s in segments])
+        
+        with self._lock:
+            self._indexes[video_id] = (stamp, index)
+            self._indexes.move_to_end(video_id)
+            while len(self._indexes) > self.max_videos:
+                self._indexes.popitem(last=False)
+        
+        return index
+
+    def invalidate(self, video_id=None):
+        with self._lock:
+            if video_id is None:
+                self._indexes.clear()
+            else:
+                self._indexes.pop(video_id, None)
+
+# Instancia global de la caché de índices
+interval_index_cache = IntervalIndexCache()
+
+def get_interval_index_cache():
+    """Obtener la caché global de índices de intervalos"""
+    return interval_index_cache
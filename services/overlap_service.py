@@ -0,0 +1,90 @@
+"""
+Solapamiento temporal real entre personas dentro de un video.
+
+Un barrido (sweep-line) sobre los extremos ordenados de los segmentos calcula,
+para cada pareja de personas, los segundos que comparten pantalla y cuántos
+pares de segmentos se intersectan. Los resultados se guardan por video en
+co_appearance_overlaps y se recalculan solo cuando cambian sus apariciones.
+"""
+from database import get_db
+
+START = 0
+END = 1
+
+def sweep_overlaps(segments):
+    """
+    segments: [(person_id, start_time, end_time), ...] de un mismo video
+    Retorna {(person_a, person_b): [overlap_seconds, shared_segments]} con person_a < person_b
+    """
+    events = []
+    for person_id, start_time, end_time in segments:
+        events.append((start_time, START, person_id))
+        events.append((end_time, END, person_id))
+    
+    # Con tiempos iguales los inicios van antes que los finales para que
+    # segmentos que se tocan (o de duración cero) cuenten como simultáneos
+    events.sort()
+    
+    active = {}
+    overlaps = {}
+    previous_time = None
+    
+    for time, kind, person_id in events:
+        if previous_time is not None and time > previous_time and len(active) > 1:
+            elapsed = time - previous_time
+            persons = sorted(active)
+            for i, person_a in enumerate(persons):
+                for person_b in persons[i + 1:]:
+                    overlaps.setdefault((person_a, person_b), [0.0, 0])[0] += elapsed
+        previous_time = time
+        
+        if kind == START:
+            for other_id, open_segments in active.items():
+                if other_id != person_id:
+                    pair = (min(person_id, other_id), max(person_id, other_id))
+                    overlaps.setdefault(pair, [0.0, 0])[1] += open_segments
+            active[person_id] = active.get(person_id, 0) + 1
+        else:
+            active[person_id] -= 1
+            if active[person_id] == 0:
+                del active[person_id]
+    
+    return overlaps
+
+def apply_video(cursor, video_id, sign):
+    """Quitar (sign=-1) o calcular y guardar (sign=1) los solapamientos de un video"""
+    if sign < 0:
+        cursor.execute("DELETE FROM co_appearance_overlaps WHERE video_id = ?", (video_id,))
+        return
+    
+    cursor.execute("""
+        SELECT person_id, start_time, end_time
+        FROM video_appearances
+        WHERE video_id = ?
+    """, (video_id,))
+    segments = [(r['person_id'], r['start_time'], r['end_time']) for r in cursor.fetchall()]
+    
+    overlaps = sweep_overlaps(segments)
+    cursor.executemany("""
+        INSERT OR REPLACE INTO co_appearance_overlaps
+            (video_id, person_a, person_b, overlap_seconds, shared_segments)
+        VALUES (?, ?, ?, ?, ?)
+    """, [
+        (video_id, person_a, person_b, seconds, shared)
+        for (person_a, person_b), (seconds, shared) in overlaps.items()
+    ])
+
+def rebuild_all():
+    """Recalcular los solapamientos de todos los videos procesados"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT DISTINCT video_id FROM video_appearances")
+        video_ids = [r['video_id'] for r in cursor.fetchall()]
+        
+        cursor.execute("DELETE FROM co_appearance_overlaps")
+        for video_id in video_ids:
+            apply_video(cursor, video_id, 1)
+        
+        conn.commit()
+    
+    return len(video_ids)
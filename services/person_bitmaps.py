@@ -0,0 +1,274 @@
+"""
+Bitmaps en memoria de los videos donde aparece cada persona.
+
+Cada video recibe un ordinal denso (en orden de id) y cada persona un entero
+de Python cuyo bit i indica si aparece en el video con ordinal i. Las
+consultas AND / OR / NOT entre cualquier número de personas son operaciones
+sobre enteros, cuyo coste depende del número de videos y no de cuántas
+apariciones tiene cada persona.
+
+Se construye al iniciar la aplicación y se mantiene con las notificaciones
+de models (videos creados o eliminados y apariciones reescritas). Las
+escrituras de otros procesos (workers de análisis, otras instancias, scripts
+de migración) no avisan: triggers sobre videos y video_appearances anotan en
+video_changes el video afectado con un número de secuencia creciente (una
+fila por video, que se reemplaza). query() lee como mucho cada
+CHANGE_CHECK_INTERVAL segundos los videos con secuencia mayor que la última
+vista y corrige solo esos; las escrituras que no tocan videos ni apariciones
+(notificaciones, etiquetas) no cuestan nada.
+"""
+from models import on_change
+from database import get_db, execute_query
+import sqlite3
+import threading
+import time
+
+CHANGE_CHECK_INTERVAL = 1.0
+BATCH_SIZE = 500
+# Con más videos cambiados que esto conviene recargar todo
+REBUILD_THRESHOLD = 5000
+
+def ensure_video_changes():
+    """Crear la tabla video_changes y sus triggers si no existen"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS video_changes (
+                video_id INTEGER PRIMARY KEY,
+                seq INTEGER NOT NULL
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_video_changes_seq ON video_changes(seq)")
+        
+        # Las escrituras están serializadas: MAX(seq) + 1 crece en orden de commit
+        for name, event, video in (
+            ('videos_changes_insert', 'INSERT ON videos', 'new.id'),
+            ('videos_changes_delete', 'DELETE ON videos', 'old.id'),
+            ('video_appearances_changes_insert', 'INSERT ON video_appearances', 'new.video_id'),
+            ('video_appearances_changes_delete', 'DELETE ON video_appearances', 'old.video_id'),
+            ('video_appearances_changes_update', 'UPDATE OF video_id, person_id ON video_appearances', 'new.video_id'),
+            ('video_appearances_changes_move', 'UPDATE OF video_id ON video_appearances', 'old.video_id')
+        ):
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {name} AFTER {event}
+                BEGIN
+                    INSERT OR REPLACE INTO video_changes (video_id, seq)
+                    VALUES ({video}, (SELECT COALESCE(MAX(seq), 0) + 1 FROM video_changes));
+                END
+            """)
+        
+        conn.commit()
+
+def _last_change(cursor):
+    """Última secuencia de video_changes (None si la tabla aún no existe)"""
+    try:
+        cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM video_changes")
+    except sqlite3.OperationalError:
+        return None
+    return cursor.fetchone()[0]
+
+def _set_bits(bitmap):
+    """Posiciones de los bits activos, de menor a mayor"""
+    bits = bin(bitmap)[:1:-1]
+    i = bits.find('1')
+    while i != -1:
+        yield i
+        i = bits.find('1', i + 1)
+
+class PersonBitmapIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._reset()
+        self.built = False
+        self._last_seq = None
+        self._checked_at = 0.0
+
+    def _reset(self):
+        self._ordinals = {}        # video_id -> ordinal
+        self._video_ids = []       # ordinal -> video_id (None si se eliminó)
+        self._video_persons = {}   # video_id -> frozenset de person_id
+        self._bitmaps = {}         # person_id -> int
+        self._all = 0              # videos existentes
+
+    def _ordinal(self, video_id):
+        ordinal = self._ordinals.get(video_id)
+        if ordinal is None:
+            ordinal = len(self._video_ids)
+            self._ordinals[video_id] = ordinal
+            self._video_ids.append(video_id)
+            self._all |= 1 << ordinal
+        return ordinal
+
+    def build(self):
+        """Cargar videos y apariciones desde la base de datos"""
+        with get_db() as conn:
+            cursor = conn.cursor()
+            # Una transacción de lectura: la secuencia corresponde a las filas leídas
+            cursor.execute("BEGIN")
+            last_seq = _last_change(cursor)
+            cursor.execute("SELECT id FROM videos ORDER BY id")
+            video_ids = [row['id'] for row in cursor.fetchall()]
+            cursor.execute("""
+                SELECT DISTINCT person_id, video_id FROM video_appearances
+                ORDER BY person_id
+            """)
+            rows = cursor.fetchall()
+            conn.rollback()
+        
+        with self._lock:
+            self._reset()
+            for video_id in video_ids:
+                self._ordinal(video_id)
+            
+            size = len(self._video_ids) // 8 + 1
+            video_persons = {}
+            current_person, bits = None, None
+            for row in rows:
+                if row['person_id'] != current_person:
+                    if current_person is not None:
+                        self._bitmaps[current_person] = int.from_bytes(bits, 'little')
+                    current_person, bits = row['person_id'], bytearray(size)
+                
+                video_id = row['video_id']
+                if video_id not in self._ordinals:
+                    continue
+                ordinal = self._ordinals[video_id]
+                bits[ordinal >> 3] |= 1 << (ordinal & 7)
+                video_persons.setdefault(video_id, set()).add(current_person)
+            
+            if current_person is not None:
+                self._bitmaps[current_person] = int.from_bytes(bits, 'little')
+            
+            self._video_persons = {video_id: frozenset(persons) for video_id, persons in video_persons.items()}
+            self._last_seq = last_seq
+            self._checked_at = time.monotonic()
+            self.built = True
+
+    def _refresh_if_stale(self):
+        """Corregir los videos que otros procesos cambiaron desde la última lectura"""
+        now = time.monotonic()
+        if not self.built or self._last_seq is None or now - self._checked_at < CHANGE_CHECK_INTERVAL:
+            return
+        self._checked_at = now
+        
+        # Con el lock tomado durante la lectura, un listener de este proceso
+        # no puede aplicar su versión antes que una lectura más vieja
+        with self._lock, get_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN")
+            cursor.execute(
+                "SELECT video_id, seq FROM video_changes WHERE seq > ? ORDER BY seq", (self._last_seq,)
+            )
+            changes = cursor.fetchall()
+            if not changes:
+                conn.rollback()
+                return
+            if len(changes) > REBUILD_THRESHOLD:
+                conn.rollback()
+                self.build()
+                return
+            
+            video_ids = [row['video_id'] for row in changes]
+            existing, persons = set(), {}
+            for start in range(0, len(video_ids), BATCH_SIZE):
+                batch = video_ids[start:start + BATCH_SIZE]
+                cursor.execute(f"""
+                    SELECT v.id as video_id, va.person_id
+                    FROM videos v
+                    LEFT JOIN video_appearances va ON va.video_id = v.id
+                    WHERE v.id IN ({','.join('?' * len(batch))})
+                """, batch)
+                for row in cursor.fetchall():
+                    existing.add(row['video_id'])
+                    if row['person_id'] is not None:
+                        persons.setdefault(row['video_id'], set()).add(row['person_id'])
+            conn.rollback()
+            
+            for video_id in video_ids:
+                if video_id in existing:
+                    self.set_video_persons(video_id, persons.get(video_id, ()))
+                else:
+                    self.remove_video(video_id)
+            self._last_seq = changes[-1]['seq']
+
+    def set_video_persons(self, video_id, person_ids):
+        """Reemplazar las personas de un video"""
+        with self._lock:
+            ordinal = self._ordinal(video_id)
+            bit = 1 << ordinal
+            new_persons = frozenset(person_ids)
+            old_persons = self._video_persons.get(video_id, frozenset())
+            
+            for person_id in old_persons - new_persons:
+                self._bitmaps[person_id] &= ~bit
+            for person_id in new_persons - old_persons:
+                self._bitmaps[person_id] = self._bitmaps.get(person_id, 0) | bit
+            
+            if new_persons:
+                self._video_persons[video_id] = new_persons
+            else:
+                self._video_persons.pop(video_id, None)
+
+    def remove_video(self, video_id):
+        with self._lock:
+            if video_id not in self._ordinals:
+                return
+            self.set_video_persons(video_id, ())
+            ordinal = self._ordinals.pop(video_id)
+            self._video_ids[ordinal] = None
+            self._all &= ~(1 << ordinal)
+
+    def handle_change(self, table, action, record_id, text=None, old_text=None):
+        """Listener de models"""
+        if not self.built:
+            return
+        
+        if table == 'videos':
+            if action == 'insert':
+                with self._lock:
+                    self._ordinal(record_id)
+            elif action == 'delete':
+                self.remove_video(record_id)
+        elif table == 'video_appearances':
+            rows = execute_query(
+                "SELECT DISTINCT person_id FROM video_appearances WHERE video_id = ?",
+                (record_id,), fetch_all=True
+            )
+            self.set_video_persons(record_id, [row['person_id'] for row in rows])
+
+    def query(self, all_of=(), any_of=(), none_of=()):
+        """
+        Ids de los videos con todas las personas de all_of, al menos una de
+        any_of y ninguna de none_of (las listas vacías no filtran)
+        """
+        self._refresh_if_stale()
+        with self._lock:
+            result = self._all
+            for person_id in all_of:
+                result &= self._bitmaps.get(person_id, 0)
+                if not result:
+                    return []
+            
+            if any_of:
+                union = 0
+                for person_id in any_of:
+                    union |= self._bitmaps.get(person_id, 0)
+                result &= union
+            
+            for person_id in none_of:
+                result &= ~self._bitmaps.get(person_id, 0)
+            
+            video_ids = self._video_ids
+            return [video_ids[ordinal] for ordinal in _set_bits(result)]
+
+# Instancia global del índice de bitmaps
+person_bitmaps = PersonBitmapIndex()
+on_change(person_bitmaps.handle_change)
+
+def build_person_bitmaps():
+    """Construir el índice de bitmaps global"""
+    person_bitmaps.build()
+
+def get_person_bitmaps():
+    """Obtener la instancia del índice de bitmaps por persona"""
+    return person_bitmaps
@@ -0,0 +1,224 @@
+"""
+Presencia por segundo de cada persona en cada video.
+
+Para cada (video, persona) se guarda en presence_bitmaps un bitmap empaquetado
+(np.packbits, orden de bits 'big') con un bit por segundo del video: el bit s
+vale 1 si algún segmento de la persona toca el intervalo [s, s + 1). Cobertura,
+solapamiento entre personas y mapas de calor se resuelven con AND/OR y conteo
+de bits sobre estos BLOB, sin leer video_appearances.
+
+Los bitmaps se escriben desde appearance_store en la misma transacción que
+las apariciones. Sin NumPy se empaquetan y cuentan con enteros de Python.
+"""
+from database import get_db
+import math
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+def _second_range(start_time, end_time):
+    """Segundos [first, last) que toca un segmento (al menos uno)"""
+    first = max(int(math.floor(start_time)), 0)
+    last = max(int(math.ceil(end_time)), first + 1)
+    return first, last
+
+def pack_segments(segments, seconds):
+    """segments: [(start_time, end_time)] -> bytes con `seconds` bits"""
+    if NUMPY_AVAILABLE:
+        bits = np.zeros(seconds, dtype=np.uint8)
+        for start_time, end_time in segments:
+            first, last = _second_range(start_time, end_time)
+            bits[first:last] = 1
+        return np.packbits(bits).tobytes()
+
+    packed = bytearray((seconds + 7) // 8)
+    for start_time, end_time in segments:
+        first, last = _second_range(start_time, end_time)
+        for second in range(first, min(last, seconds)):
+            packed[second >> 3] |= 0x80 >> (second & 7)
+    return bytes(packed)
+
+def unpack(bitmap, seconds):
+    """bytes -> arreglo de 0/1 de longitud seconds (lista sin NumPy)"""
+    if NUMPY_AVAILABLE:
+        return np.unpackbits(np.frombuffer(bitmap, dtype=np.uint8), count=seconds)
+    return [(bitmap[second >> 3] >> (7 - (second & 7))) & 1 for second in range(seconds)]
+
+def _to_int(bitmap):
+    return int.from_bytes(bitmap, 'big')
+
+def _popcount(value):
+    return bin(value).count('1')
+
+def _video_seconds(cursor, video_id, segments):
+    cursor.execute("SELECT duration FROM videos WHERE id = ?", (video_id,))
+    row = cursor.fetchone()
+    duration = row['duration'] if row and row['duration'] else 0
+    longest = max((end_time for _, _, end_time in segments), default=0)
+    return max(int(math.ceil(max(duration, longest))), 1)
+
+def apply_video(cursor, video_id, sign):
+    """Quitar (sign=-1) o calcular y guardar (sign=1) los bitmaps de un video"""
+    if sign < 0:
+        cursor.execute("DELETE FROM presence_bitmaps WHERE video_id = ?", (video_id,))
+        return
+
+    cursor.execute("""
+        SELECT person_id, start_time, end_time
+        FROM video_appearances
+        WHERE video_id = ?
+    """, (video_id,))
+    segments = [(r['person_id'], r['start_time'], r['end_time']) for r in cursor.fetchall()]
+    if not segments:
+        return
+
+    seconds = _video_seconds(cursor, video_id, segments)
+    by_person = {}
+    for person_id, start_time, end_time in segments:
+        by_person.setdefault(person_id, []).append((start_time, end_time))
+
+    cursor.executemany("""
+        INSERT OR REPLACE INTO presence_bitmaps (video_id, person_id, seconds, bitmap)
+        VALUES (?, ?, ?, ?)
+    """, [
+        (video_id, person_id, seconds, pack_segments(person_segments, seconds))
+        for person_id, person_segments in by_person.items()
+    ])
+
+def rebuild_all():
+    """Recalcular los bitmaps de todos los videos con apariciones"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT DISTINCT video_id FROM video_appearances")
+        video_ids = [r['video_id'] for r in cursor.fetchall()]
+
+        cursor.execute("DELETE FROM presence_bitmaps")
+        for video_id in video_ids:
+            apply_video(cursor, video_id, 1)
+
+        conn.commit()
+
+    return len(video_ids)
+
+def _load(video_id):
+    """(seconds, {person_id: (name, bitmap)}) de un video"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT pb.person_id, pb.seconds, pb.bitmap, p.name
+            FROM presence_bitmaps pb
+            LEFT JOIN persons p ON p.id = pb.person_id
+            WHERE pb.video_id = ?
+        """, (video_id,))
+        rows = cursor.fetchall()
+
+    seconds = rows[0]['seconds'] if rows else 0
+    return seconds, {row['person_id']: (row['name'], bytes(row['bitmap'])) for row in rows}
+
+def _runs(value, seconds):
+    """Intervalos [inicio, fin) de segundos consecutivos con el bit activo"""
+    # El segundo 0 es el bit más alto; el relleno del último byte queda al final
+    bits = bin(value)[2:].zfill((seconds + 7) // 8 * 8)[:seconds]
+    runs = []
+    start = bits.find('1')
+    while start != -1:
+        end = bits.find('0', start)
+        if end == -1:
+            end = seconds
+        runs.append((start, end))
+        start = bits.find('1', end)
+    return runs
+
+def get_presence(video_id, person_ids):
+    """
+    Cobertura de cada persona y segundos en que están todas juntas
+    (y al menos una) en pantalla
+    """
+    seconds, bitmaps = _load(video_id)
+    if not seconds:
+        return None
+
+    all_of = None
+    any_of = 0
+    persons = []
+    for person_id in person_ids:
+        name, bitmap = bitmaps.get(person_id, (None, b''))
+        value = _to_int(bitmap) if bitmap else 0
+        all_of = value if all_of is None else all_of & value
+        any_of |= value
+        present = _popcount(value)
+        persons.append({
+            'person_id': person_id,
+            'person_name': name,
+            'seconds_on_screen': present,
+            'coverage': present / seconds
+        })
+
+    all_of = all_of or 0
+    together = _popcount(all_of)
+    return {
+        'video_id': video_id,
+        'seconds': seconds,
+        'persons': persons,
+        'together_seconds': together,
+        'together_coverage': together / seconds,
+        'together_intervals': _runs(all_of, seconds),
+        'any_seconds': _popcount(any_of),
+        'any_coverage': _popcount(any_of) / seconds
+    }
+
+def get_heatmap(video_id, bucket_seconds=10):
+    """
+    Segundos en pantalla de cada persona por bloque de bucket_seconds, más
+    los segundos con al menos una persona y el promedio de personas a la vez
+    """
+    seconds, bitmaps = _load(video_id)
+    if not seconds:
+        return None
+
+    buckets = (seconds + bucket_seconds - 1) // bucket_seconds
+    persons = []
+    if NUMPY_AVAILABLE:
+        matrix = np.zeros((len(bitmaps), buckets * bucket_seconds), dtype=np.uint8)
+        for row, (_, bitmap) in enumerate(bitmaps.values()):
+            matrix[row, :seconds] = unpack(bitmap, seconds)
+        per_bucket = matrix.reshape(len(bitmaps), buckets, bucket_seconds).sum(axis=2)
+        on_screen = matrix.any(axis=0).reshape(buckets, bucket_seconds).sum(axis=1).tolist()
+        persons_per_second = matrix.sum(axis=0).reshape(buckets, bucket_seconds).sum(axis=1)
+        concurrency = (persons_per_second / bucket_seconds).round(3).tolist()
+        counts = per_bucket.tolist()
+    else:
+        counts, any_bits = [], [0] * seconds
+        per_second = [0] * seconds
+        for _, bitmap in bitmaps.values():
+            bits = unpack(bitmap, seconds)
+            counts.append([sum(bits[i:i + bucket_seconds]) for i in range(0, seconds, bucket_seconds)])
+            for second, bit in enumerate(bits):
+                per_second[second] += bit
+                any_bits[second] |= bit
+        on_screen = [sum(any_bits[i:i + bucket_seconds]) for i in range(0, seconds, bucket_seconds)]
+        concurrency = [round(sum(per_second[i:i + bucket_seconds]) / bucket_seconds, 3)
+                       for i in range(0, seconds, bucket_seconds)]
+
+    for (person_id, (name, _)), person_counts in zip(bitmaps.items(), counts):
+        persons.append({
+            'person_id': person_id,
+            'person_name': name,
+            'seconds_on_screen': sum(person_counts),
+            'coverage': sum(person_counts) / seconds,
+            'counts': person_counts
+        })
+    persons.sort(key=lambda p: -p['seconds_on_screen'])
+
+    return {
+        'video_id': video_id,
+        'seconds': seconds,
+        'bucket_seconds': bucket_seconds,
+        'bucket_starts': [i * bucket_seconds for i in range(buckets)],
+        'on_screen': on_screen,
+        'average_persons': concurrency,
+        'persons': persons
+    }
@@ -0,0 +1,105 @@
+"""
+Índice de texto completo (SQLite FTS5) sobre nombres de archivo, personas y tags.
+
+La tabla virtual search_index se mantiene sincronizada con triggers sobre
+videos, persons y video_tags. El rowid codifica el origen de cada fila
+(id * 4 + tipo) para que los triggers borren por clave sin recorrer el índice.
+
+Si la instalación de SQLite no incluye FTS5 se deja FTS_AVAILABLE = False y
+AdvancedSearchService sigue usando las consultas LIKE.
+"""
+from database import get_db
+import sqlite3
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+FTS_AVAILABLE = False
+
+KIND_CODES = {'video': 1, 'person': 2, 'tag': 3}
+
+SOURCES = [
+    # (tipo, tabla, columna de texto)
+    ('video', 'videos', 'original_filename'),
+    ('person', 'persons', 'name'),
+    ('tag', 'video_tags', 'tag'),
+]
+
+def _create_statements():
+    statements = ["""
+        CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+            text,
+            kind UNINDEXED,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )
+    """]
+    
+    for kind, table, column in SOURCES:
+        code = KIND_CODES[kind]
+        statements.append(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_search_insert AFTER INSERT ON {table}
+            BEGIN
+                INSERT INTO search_index (rowid, text, kind) VALUES (new.id * 4 + {code}, new.{column}, '{kind}');
+            END
+        """)
+        statements.append(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_search_update AFTER UPDATE OF {column} ON {table}
+            BEGIN
+                DELETE FROM search_index WHERE rowid = old.id * 4 + {code};
+                INSERT INTO search_index (rowid, text, kind) VALUES (new.id * 4 + {code}, new.{column}, '{kind}');
+            END
+        """)
+        statements.append(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_search_delete AFTER DELETE ON {table}
+            BEGIN
+                DELETE FROM search_index WHERE rowid = old.id * 4 + {code};
+            END
+        """)
+    
+    return statements
+
+def ensure_search_index():
+    """Crear el índice FTS5 y sus triggers; poblarlo si se acaba de crear"""
+    global FTS_AVAILABLE
+    
+    try:
+        with get_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'search_index'")
+            exists = cursor.fetchone() is not None
+            
+            for statement in _create_statements():
+                cursor.execute(statement)
+            
+            if not exists:
+                for kind, table, column in SOURCES:
+                    cursor.execute(f"""
+                        INSERT INTO search_index (rowid, text, kind)
+                        SELECT id * 4 + {KIND_CODES[kind]}, {column}, '{kind}' FROM {table}
+                    """)
+            
+            conn.commit()
+    except sqlite3.OperationalError as e:
+        logger.warning(f"FTS5 no disponible, la búsqueda por texto usará LIKE: {e}")
+        FTS_AVAILABLE = False
+        return False
+    
+    FTS_AVAILABLE = True
+    return True
+
+def build_match_query(text, prefix_last_only=False):
+    """
+    Convierte texto libre en una consulta FTS5 segura: cada palabra entre
+    comillas y como prefijo ("juan"* "per"*). Retorna None si no hay palabras.
+    """
+    terms = re.findall(r'\w+', text, re.UNICODE)
+    if not terms:
+        return None
+    
+    if prefix_last_only:
+        quoted = [f'"{term}"' for term in terms[:-1]] + [f'"{terms[-1]}"*']
+    else:
+        quoted = [f'"{term}"*' for term in terms]
+    return ' '.join(quoted)
@@ -1,107 +1,150 @@
-from models import Person, Video, VideoAppearance
-from database import get_db
+from models import Person, Video, VideoAppearance, PersonStats, CoAppearance
+from database import get_db, execute_query
+from services.person_bitmaps import get_person_bitmaps
 from utils import format_time
+import json
 
-def search_videos_by_person(person_id):
+def parse_cursor(after):
+    """Convierte un cursor 'uploaded_at,id' en tupla; None si no es válido"""
+    if not after:
+        return None
+    
+    uploaded_at, _, video_id = after.rpartition(',')
+    if not uploaded_at or not video_id.isdigit():
+        return None
+    return uploaded_at, int(video_id)
+
+def search_videos_by_person(person_id, after=None, limit=None):
+    """
+    Videos donde aparece una persona, del más reciente al más antiguo.
+    Paginación por keyset: after=(uploaded_at, video_id) del último video de
+    la página anterior; limit=None devuelve todo el historial.
+    """
+    stats = PersonStats.get_by_person(person_id)
+    if not stats:
+        return None
+    
+    conditions = ["pv.person_id = ?", "v.processed = 1"]
+    params = [person_id]
+    if after:
+        conditions.append("(pv.uploaded_at, pv.video_id) < (?, ?)")
+        params.extend(after)
+    
+    # La página se lee en orden del índice (person_id, uploaded_at, video_id)
+    # de person_videos: el keyset y el LIMIT se resuelven en el índice y solo
+    # se visitan los videos de la página. CROSS JOIN fija ese orden de tablas
+    page_query = f"""
+        SELECT v.id, v.original_filename, v.uploaded_at, v.duration
+        FROM person_videos pv
+        CROSS JOIN videos v ON v.id = pv.video_id
+        WHERE {' AND '.join(conditions)}
+        ORDER BY pv.uploaded_at DESC, pv.video_id DESC
+    """
+    if limit is not None:
+        page_query += " LIMIT ?"
+        params.append(limit)
+    
+    # Una sola consulta: la página de videos y todas sus apariciones, ya ordenadas
+    query = f"""
+        SELECT page.id as video_id, page.original_filename, page.uploaded_at, page.duration,
+               va.start_time, va.end_time
+        FROM ({page_query}) page
+        JOIN video_appearances va ON va.video_id = page.id AND va.person_id = ?
+        ORDER BY page.uploaded_at DESC, page.id DESC, va.start_time
+    """
+    params.append(person_id)
+    
     with get_db() as conn:
         cursor = conn.cursor()
-        
-        query = """
-            SELECT DISTINCT v.*, p.name as person_name
-            FROM videos v
-            JOIN video_appearances va ON v.id = va.video_id
-            JOIN persons p ON va.person_id = p.id
-            WHERE p.id = ? AND v.processed = 1
-            ORDER BY v.uploaded_at DESC
-        """
-        
-        cursor.execute(query, (person_id,))
-        videos = cursor.fetchall()
-        
-        results = []
-        for video in videos:
-            appearances_query = """
-                SELECT start_time, end_time 
-                FROM video_appearances 
-                WHERE video_id = ? AND person_id = ?
-                ORDER BY start_time
-            """
-            cursor.execute(appearances_query, (video['id'], person_id))
-            appearances = cursor.fetchall()
-            
-            total_duration = sum(a['end_time'] - a['start_time'] for a in appearances)
-            
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+    
+    results = []
+    for row in rows:
+        if not results or results[-1]['video_id'] != row['video_id']:
             results.append({
-                'video_id': video['id'],
-                'filename': video['original_filename'],
-                'uploaded_at': video['uploaded_at'],
-                'duration': video['duration'],
-                'appearances': [
-                    {
-                        'start': a['start_time'],
-                        'end': a['end_time'],
-                        'start_formatted': format_time(a['start_time']),
-                        'end_formatted': format_time(a['end_time']),
-                        'duration': a['end_time'] - a['start_time']
-                    }
-                    for a in appearances
-                ],
-                'total_appearances': len(appearances),
-                'total_duration': total_duration,
-                'total_duration_formatted': format_time(total_duration)
+                'video_id': row['video_id'],
+                'filename': row['original_filename'],
+                'uploaded_at': row['uploaded_at'],
+                'duration': row['duration'],
+                'appearances': []
             })
         
-        return {
-            'person_name': video['person_name'] if videos else None,
-            'total_videos': len(results),
-            'videos': results
-        }
+        results[-1]['appearances'].append({
+            'start': row['start_time'],
+            'end': row['end_time'],
+            'start_formatted': format_time(row['start_time']),
+            'end_formatted': format_time(row['end_time']),
+            'duration': row['end_time'] - row['start_time']
+        })
+    
+    for video in results:
+        total_duration = sum(a['duration'] for a in video['appearances'])
+        video['total_appearances'] = len(video['appearances'])
+        video['total_duration'] = total_duration
+        video['total_duration_formatted'] = format_time(total_duration)
+    
+    next_after = None
+    if limit is not None and len(results) == limit:
+        last = results[-1]
+        next_after = f"{last['uploaded_at']},{last['video_id']}"
+    
+    return {
+        'person_name': stats['person_name'],
+        'total_videos': stats['total_videos'],
+        'videos': results,
+        'next_after': next_after
+    }
+
+def _format_person_stats(stats):
+    return {
+        'person_id': stats['person_id'],
+        'person_name': stats['person_name'],
+        'photo_path': stats['photo_path'],
+        'total_videos': stats['total_videos'],
+        'total_appearances': stats['total_appearances'],
+        'total_screen_time': stats['total_screen_time'],
+        'total_screen_time_formatted': format_time(stats['total_screen_time']),
+        'last_seen': stats['last_seen']
+    }
 
 def get_person_statistics(person_id):
-    person = Person.get_by_id(person_id)
-    if not person:
+    stats = PersonStats.get_by_person(person_id)
+    if not stats:
         return None
     
-    with get_db() as conn:
-        cursor = conn.cursor()
-        
-        query = """
-            SELECT 
-                COUNT(DISTINCT va.video_id) as total_videos,
-                COUNT(va.id) as total_appearances,
-                SUM(va.end_time - va.start_time) as total_screen_time
-            FROM video_appearances va
-            WHERE va.person_id = ?
-        """
-        cursor.execute(query, (person_id,))
-        stats = cursor.fetchone()
-        
-        return {
-            'person_id': person_id,
-            'person_name': person['name'],
-            'photo_path': person['photo_path'],
-            'total_videos': stats['total_videos'] or 0,
-            'total_appearances': stats['total_appearances'] or 0,
-            'total_screen_time': stats['total_screen_time'] or 0,
-            'total_screen_time_formatted': format_time(stats['total_screen_time'] or 0)
-        }
+    return _format_person_stats(stats)
 
 def get_all_persons_statistics():
-    persons = Person.get_all()
-    results = []
-    
-    for person in persons:
-        stats = get_person_statistics(person['id'])
-        if stats:
-            results.append(stats)
-    
-    results.sort(key=lambda x: x['total_screen_time'], reverse=True)
-    return results
+    return [_format_person_stats(stats) for stats in PersonStats.get_all()]
+
+def iter_all_persons_statistics():
+    return (_format_person_stats(stats) for stats in PersonStats.iter_all())
 
 def search_videos_by_multiple_persons(person_ids):
     if not person_ids:
         return []
     
+    bitmaps = get_person_bitmaps()
+    if not bitmaps.built:
+        return _search_videos_by_multiple_persons_sql(person_ids)
+    
+    video_ids = bitmaps.query(all_of=person_ids)
+    if not video_ids:
+        return []
+    
+    query = """
+        SELECT v.id, v.original_filename, v.uploaded_at, v.duration,
+               ? as matching_persons
+        FROM videos v
+        WHERE v.id IN (SELECT value FROM json_each(?)) AND v.processed = 1
+        ORDER BY v.uploaded_at DESC
+    """
+    videos = execute_query(query, (len(set(person_ids)), json.dumps(video_ids)), fetch_all=True)
+    return [dict(v) for v in videos]
+
+def _search_videos_by_multiple_persons_sql(person_ids):
+    """Versión SQL, usada mientras el índice de bitmaps no está construido"""
     with get_db() as conn:
         cursor = conn.cursor()
         
@@ -122,41 +165,61 @@ def search_videos_by_multiple_persons(person_ids):
         
         return [dict(v) for v in videos]
 
-def get_co_appearance_matrix():
+def get_co_appearance_matrix(format_type='dense', top_k=None):
+    """
+    Matriz de co-apariciones leída de la tabla materializada co_appearances
+    format_type='dense': todas las parejas de personas, incluidas las de conteo 0
+    format_type='sparse': solo parejas con co-apariciones, ordenadas por conteo y
+                          recortadas a top_k por persona si se indica
+    """
     persons = Person.get_all()
-    matrix = {}
+    names = {person['id']: person['name'] for person in persons}
     
-    with get_db() as conn:
-        cursor = conn.cursor()
+    if format_type == 'sparse':
+        matrix = {
+            person_id: {'name': name, 'co_appearances': []}
+            for person_id, name in names.items()
+        }
         
-        for person in persons:
-            matrix[person['id']] = {
-                'name': person['name'],
-                'co_appearances': {}
-            }
+        # Las filas llegan ordenadas por conteo descendente
+        for row in CoAppearance.get_all():
+            a, b, count = row['person_a'], row['person_b'], row['video_count']
+            if a not in names or b not in names:
+                continue
+            for person_id, other_id in ((a, b), (b, a)):
+                co_appearances = matrix[person_id]['co_appearances']
+                if top_k is None or len(co_appearances) < top_k:
+                    co_appearances.append({
+                        'person_id': other_id,
+                        'name': names[other_id],
+                        'count': count
+                    })
         
-        for person1 in persons:
-            for person2 in persons:
-                if person1['id'] >= person2['id']:
-                    continue
-                
-                query = """
-                    SELECT COUNT(DISTINCT va1.video_id) as count
-                    FROM video_appearances va1
-                    JOIN video_appearances va2 ON va1.video_id = va2.video_id
-                    WHERE va1.person_id = ? AND va2.person_id = ?
-                """
-                cursor.execute(query, (person1['id'], person2['id']))
-                result = cursor.fetchone()
-                count = result['count'] if result else 0
-                
-                matrix[person1['id']]['co_appearances'][person2['id']] = {
-                    'name': person2['name'],
-                    'count': count
-                }
-                matrix[person2['id']]['co_appearances'][person1['id']] = {
-                    'name': person1['name'],
-                    'count': count
-                }
+        return matrix
+    
+    counts = {(row['person_a'], row['person_b']): row['video_count'] for row in CoAppearance.get_all()}
+    matrix = {}
+    
+    for person in persons:
+        matrix[person['id']] = {
+            'name': person['name'],
+            'co_appearances': {}
+        }
+    
+    for person1 in persons:
+        for person2 in persons:
+            if person1['id'] >= person2['id']:
+                continue
+            
+            count = counts.get((person1['id'], person2['id']), 0)
+            
+            matrix[person1['id']]['co_appearances'][person2['id']] = {
+                'name': person2['name'],
+                'count': count
+            }
+            matrix[person2['id']]['co_appearances'][person1['id']] = {
+                'name': person1['name'],
+                'count': count
+            }
     
     return matrix
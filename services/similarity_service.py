@@ -0,0 +1,319 @@
+"""
+Videos similares según las personas que aparecen en ellos.
+
+Cada video se representa como un vector disperso persona -> segundos en
+pantalla. Para cada video se guardan en video_neighbors sus TOP_K vecinos
+por similitud coseno (con Jaccard y personas en común como datos extra), de
+modo que /api/search/similar/<id> es una sola consulta.
+
+Las escrituras de apariciones marcan el video en similarity_dirty y
+refresh_dirty() recalcula sólo lo afectado: las listas de los videos
+modificados y, en los demás videos que comparten personas con ellos, la
+entrada correspondiente a cada video modificado. Si SciPy está disponible
+los productos se hacen con matrices dispersas; si no, con un índice
+invertido en Python.
+"""
+from database import get_db
+from services.data_version import bump_data_version
+import threading
+import logging
+import heapq
+import math
+
+try:
+    import numpy as np
+    from scipy import sparse
+    SCIPY_AVAILABLE = True
+except ImportError:
+    SCIPY_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+TOP_K = 20
+BATCH_SIZE = 500
+# Peso mínimo de una persona en un video: un segmento de una sola detección
+# tiene duración 0 pero la persona sí aparece
+MIN_WEIGHT = 0.25
+
+_refresh_lock = threading.Lock()
+
+def _rank_key(neighbor):
+    neighbor_id, cosine, jaccard, common = neighbor
+    return (-cosine, -common, -neighbor_id)
+
+def _chunks(items, size=BATCH_SIZE):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def _load_vectors(cursor, video_ids=None):
+    """{video_id: {person_id: segundos}} de los videos indicados (o de todos)"""
+    query = """
+        SELECT video_id, person_id, SUM(end_time - start_time) as seconds
+        FROM video_appearances
+        {where}
+        GROUP BY video_id, person_id
+    """
+    vectors = {}
+    if video_ids is None:
+        batches = [None]
+    else:
+        batches = list(_chunks(video_ids))
+    
+    for batch in batches:
+        if batch is None:
+            cursor.execute(query.format(where=''))
+        else:
+            placeholders = ','.join('?' for _ in batch)
+            cursor.execute(query.format(where=f"WHERE video_id IN ({placeholders})"), batch)
+        for row in cursor.fetchall():
+            vectors.setdefault(row['video_id'], {})[row['person_id']] = max(row['seconds'] or 0, MIN_WEIGHT)
+    
+    return vectors
+
+def _videos_with_persons(cursor, person_ids):
+    """Ids de los videos donde aparece alguna de las personas"""
+    video_ids = set()
+    for batch in _chunks(person_ids):
+        placeholders = ','.join('?' for _ in batch)
+        cursor.execute(f"SELECT DISTINCT video_id FROM video_appearances WHERE person_id IN ({placeholders})", batch)
+        video_ids.update(row['video_id'] for row in cursor.fetchall())
+    return video_ids
+
+def _top_k(neighbors, k=None):
+    return heapq.nsmallest(k or TOP_K, neighbors, key=_rank_key)
+
+def _neighbors_python(targets, candidates, k):
+    """Vecinos con un índice invertido persona -> [(video, peso)]"""
+    inverted = {}
+    for video_id, vector in candidates.items():
+        for person_id, weight in vector.items():
+            inverted.setdefault(person_id, []).append((video_id, weight))
+    norms = {video_id: math.sqrt(sum(w * w for w in vector.values())) for video_id, vector in candidates.items()}
+    
+    results = {}
+    for video_id, vector in targets.items():
+        norm = math.sqrt(sum(w * w for w in vector.values()))
+        dots = {}
+        common = {}
+        for person_id, weight in vector.items():
+            for other_id, other_weight in inverted.get(person_id, ()):
+                dots[other_id] = dots.get(other_id, 0.0) + weight * other_weight
+                common[other_id] = common.get(other_id, 0) + 1
+        
+        neighbors = []
+        for other_id, dot in dots.items():
+            if other_id == video_id:
+                continue
+            shared = common[other_id]
+            cosine = dot / (norm * norms[other_id])
+            jaccard = shared / (len(vector) + len(candidates[other_id]) - shared)
+            neighbors.append((other_id, cosine, jaccard, shared))
+        results[video_id] = _top_k(neighbors, k)
+    
+    return results
+
+class _SparseMatrix:
+    """Vectores como matriz CSR (fila = video, columna = persona)"""
+    def __init__(self, vectors, person_columns):
+        self.ids = list(vectors)
+        rows, cols, data = [], [], []
+        for row, video_id in enumerate(self.ids):
+            for person_id, weight in vectors[video_id].items():
+                rows.append(row)
+                cols.append(person_columns.setdefault(person_id, len(person_columns)))
+                data.append(weight)
+        self.rows, self.cols, self.data = rows, cols, data
+
+    def build(self, width):
+        self.matrix = sparse.csr_matrix((self.data, (self.rows, self.cols)), shape=(len(self.ids), width))
+        self.binary = self.matrix.copy()
+        self.binary.data[:] = 1.0
+        self.norms = np.sqrt(np.asarray(self.matrix.multiply(self.matrix).sum(axis=1)).ravel())
+        self.sizes = np.asarray(self.binary.sum(axis=1)).ravel()
+        return self
+
+    def slice(self, start, stop):
+        part = _SparseMatrix.__new__(_SparseMatrix)
+        part.ids = self.ids[start:stop]
+        part.matrix = self.matrix[start:stop]
+        part.binary = self.binary[start:stop]
+        part.norms = self.norms[start:stop]
+        part.sizes = self.sizes[start:stop]
+        return part
+
+def _neighbors_sparse(target, candidate, k):
+    """Vecinos de cada fila de target entre las filas de candidate"""
+    dots = (target.matrix @ candidate.matrix.T).tocsr()
+    common = (target.binary @ candidate.binary.T).tocsr()
+    dots.sort_indices()
+    common.sort_indices()
+    
+    results = {}
+    for row, video_id in enumerate(target.ids):
+        start, end = dots.indptr[row], dots.indptr[row + 1]
+        columns = dots.indices[start:end]
+        cosines = dots.data[start:end] / (target.norms[row] * candidate.norms[columns])
+        shared = common.data[common.indptr[row]:common.indptr[row + 1]]
+        jaccards = shared / (target.sizes[row] + candidate.sizes[columns] - shared)
+        
+        neighbors = [
+            (candidate.ids[column], float(cosine), float(jaccard), int(count))
+            for column, cosine, jaccard, count in zip(columns, cosines, jaccards, shared)
+            if candidate.ids[column] != video_id
+        ]
+        results[video_id] = _top_k(neighbors, k)
+    
+    return results
+
+def compute_neighbors(targets, candidates, k=None):
+    """
+    targets, candidates: {video_id: {person_id: peso}}
+    Retorna {video_id: [(vecino, coseno, jaccard, personas_en_común)]} ordenado
+    """
+    if not targets or not candidates:
+        return {video_id: [] for video_id in targets}
+    
+    if not SCIPY_AVAILABLE:
+        return _neighbors_python(targets, candidates, k)
+    
+    person_columns = {}
+    target = _SparseMatrix(targets, person_columns)
+    candidate = _SparseMatrix(candidates, person_columns)
+    width = len(person_columns)
+    return _neighbors_sparse(target.build(width), candidate.build(width), k)
+
+def _write_neighbors(cursor, video_id, neighbors):
+    cursor.execute("DELETE FROM video_neighbors WHERE video_id = ?", (video_id,))
+    cursor.executemany("""
+        INSERT INTO video_neighbors (video_id, rank, neighbor_id, cosine, jaccard, common_persons)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, [(video_id, rank, neighbor_id, cosine, jaccard, common)
+          for rank, (neighbor_id, cosine, jaccard, common) in enumerate(neighbors, 1)])
+
+def _load_lists(cursor, video_ids):
+    lists = {}
+    for batch in _chunks(video_ids):
+        placeholders = ','.join('?' for _ in batch)
+        cursor.execute(f"""
+            SELECT video_id, neighbor_id, cosine, jaccard, common_persons
+            FROM video_neighbors
+            WHERE video_id IN ({placeholders})
+            ORDER BY video_id, rank
+        """, batch)
+        for row in cursor.fetchall():
+            lists.setdefault(row['video_id'], []).append(
+                (row['neighbor_id'], row['cosine'], row['jaccard'], row['common_persons'])
+            )
+    return lists
+
+def _recompute(cursor, video_ids):
+    """Recalcular por completo la lista de vecinos de los videos indicados"""
+    for batch in _chunks(video_ids):
+        targets = _load_vectors(cursor, batch)
+        persons = {person_id for vector in targets.values() for person_id in vector}
+        candidates = _load_vectors(cursor, _videos_with_persons(cursor, persons))
+        
+        results = compute_neighbors(targets, candidates)
+        for video_id in batch:
+            _write_neighbors(cursor, video_id, results.get(video_id, []))
+
+def _refresh(cursor, changed):
+    changed = set(changed)
+    changed_vectors = _load_vectors(cursor, changed)
+    
+    # Videos cuya lista puede cambiar: los que comparten personas con los
+    # modificados y los que ya los tenían como vecinos
+    persons = {person_id for vector in changed_vectors.values() for person_id in vector}
+    affected = _videos_with_persons(cursor, persons)
+    for batch in _chunks(changed):
+        placeholders = ','.join('?' for _ in batch)
+        cursor.execute(f"SELECT DISTINCT video_id FROM video_neighbors WHERE neighbor_id IN ({placeholders})", batch)
+        affected.update(row['video_id'] for row in cursor.fetchall())
+    affected -= changed
+    
+    recompute = set(changed)
+    for batch in _chunks(affected):
+        vectors = _load_vectors(cursor, batch)
+        # Similitud de cada video afectado con los modificados (None si ya no comparten personas)
+        scores = compute_neighbors(vectors, changed_vectors, k=len(changed_vectors))
+        lists = _load_lists(cursor, batch)
+        
+        for video_id in batch:
+            current = lists.get(video_id, [])
+            merged = [n for n in current if n[0] not in changed]
+            new_scores = {n[0]: n for n in scores.get(video_id, [])}
+            
+            # Si un modificado bajó o salió de la lista, el hueco puede ocuparlo
+            # un video que no estaba: hay que recalcular la lista completa
+            lost = any(
+                n[0] in changed and (n[0] not in new_scores or _rank_key(new_scores[n[0]]) > _rank_key(n))
+                for n in current
+            )
+            if lost and len(current) >= TOP_K:
+                recompute.add(video_id)
+                continue
+            
+            merged = _top_k(merged + list(new_scores.values()))
+            if merged != current:
+                _write_neighbors(cursor, video_id, merged)
+    
+    _recompute(cursor, recompute)
+
+def mark_dirty(cursor, video_id):
+    """Marcar un video cuyas apariciones cambiaron (dentro de la transacción que las escribe)"""
+    cursor.execute("""
+        INSERT INTO similarity_dirty (video_id, version) VALUES (?, 1)
+        ON CONFLICT(video_id) DO UPDATE SET version = version + 1
+    """, (video_id,))
+
+def refresh_dirty():
+    """Actualizar video_neighbors para los videos marcados; retorna cuántos se procesaron"""
+    with _refresh_lock:
+        with get_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT video_id, version FROM similarity_dirty")
+            dirty = [(row['video_id'], row['version']) for row in cursor.fetchall()]
+            if not dirty:
+                return 0
+            
+            try:
+                _refresh(cursor, [video_id for video_id, _ in dirty])
+                # Las listas se escriben después de las apariciones: sin esto
+                # /similar seguiría validando el ETag de los vecinos anteriores
+                bump_data_version(cursor)
+                # Si otro proceso volvió a marcar el video mientras tanto, se conserva la marca
+                cursor.executemany(
+                    "DELETE FROM similarity_dirty WHERE video_id = ? AND version = ?", dirty
+                )
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                logger.error(f"Error actualizando videos similares: {e}")
+                return 0
+    
+    return len(dirty)
+
+def rebuild_all():
+    """Recalcular la tabla video_neighbors completa"""
+    with _refresh_lock:
+        with get_db() as conn:
+            cursor = conn.cursor()
+            vectors = _load_vectors(cursor)
+            cursor.execute("DELETE FROM video_neighbors")
+            cursor.execute("DELETE FROM similarity_dirty")
+            
+            if SCIPY_AVAILABLE and vectors:
+                person_columns = {}
+                full = _SparseMatrix(vectors, person_columns)
+                full.build(len(person_columns))
+                for start in range(0, len(full.ids), BATCH_SIZE):
+                    results = _neighbors_sparse(full.slice(start, start + BATCH_SIZE), full, None)
+                    for video_id, neighbors in results.items():
+                        _write_neighbors(cursor, video_id, neighbors)
+            else:
+                for video_id, neighbors in compute_neighbors(vectors, vectors).items():
+                    _write_neighbors(cursor, video_id, neighbors)
+            
+            bump_data_version(cursor)
+            conn.commit()
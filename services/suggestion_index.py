@@ -0,0 +1,177 @@
+"""
+Índice de prefijos en memoria para las sugerencias de búsqueda.
+
+Por cada tipo (personas, tags, nombres de archivo) se mantiene un arreglo
+ordenado de claves normalizadas, una por cada palabra del texto, sobre el que
+se busca con bisect. Se construye al iniciar la aplicación y se actualiza con
+las notificaciones de escritura de models, sin volver a consultar la base.
+"""
+from bisect import bisect_left, insort
+from models import on_change
+from database import get_db
+import threading
+import unicodedata
+import time
+import sys
+import re
+
+SOURCES = {
+    # tabla: (clave de la respuesta, columna de texto)
+    'persons': ('persons', 'name'),
+    'video_tags': ('tags', 'tag'),
+    'videos': ('filenames', 'original_filename'),
+}
+
+MAX_CANDIDATES = 500
+
+def normalize(text):
+    """Minúsculas y sin tildes, para que 'nun' encuentre 'Núñez'"""
+    decomposed = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(c for c in decomposed if not unicodedata.combining(c))
+
+def _word_keys(text):
+    """
+    Claves desde el inicio de cada palabra, marcando la que cubre el texto
+    completo: 'Ana Pérez' -> [('ana perez', True), ('perez', False)]
+    """
+    normalized = normalize(text)
+    starts = [m.start() for m in re.finditer(r'[^\W_]+', normalized)]
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    return [(normalized[i:], i == 0) for i in starts]
+
+class _PrefixSet:
+    def __init__(self):
+        self.keys = []       # [(clave, texto, es_inicio)] ordenado
+        self.counts = {}     # texto -> filas que lo contienen
+
+    def add(self, text):
+        count = self.counts.get(text, 0)
+        self.counts[text] = count + 1
+        if count == 0:
+            for key, whole in _word_keys(text):
+                insort(self.keys, (key, text, whole))
+
+    def remove(self, text):
+        count = self.counts.get(text, 0)
+        if count > 1:
+            self.counts[text] = count - 1
+            return
+        self.counts.pop(text, None)
+        for key, whole in _word_keys(text):
+            entry = (key, text, whole)
+            i = bisect_left(self.keys, entry)
+            if i < len(self.keys) and self.keys[i] == entry:
+                del self.keys[i]
+
+    def search(self, prefix, limit):
+        candidates = {}
+        i = bisect_left(self.keys, (prefix,))
+        scanned = 0
+        while i < len(self.keys) and scanned < MAX_CANDIDATES:
+            key, text, whole = self.keys[i]
+            if not key.startswith(prefix):
+                break
+            # Mejor si coincide desde el inicio del texto y no en una palabra intermedia
+            candidates[text] = candidates.get(text, False) or whole
+            i += 1
+            scanned += 1
+        
+        ranked = sorted(candidates, key=lambda t: (not candidates[t], -self.counts.get(t, 0), t))
+        return ranked[:limit]
+
+class SuggestionIndex:
+    def __init__(self):
+        self._sets = {key: _PrefixSet() for key, _ in SOURCES.values()}
+        self._lock = threading.RLock()
+        self.built = False
+        self.build_ms = 0.0
+        self.updates = 0
+        self.update_seconds = 0.0
+        self.queries = 0
+        self.query_seconds = 0.0
+
+    def build(self):
+        """Cargar todos los textos desde la base de datos"""
+        t0 = time.perf_counter()
+        sets = {key: _PrefixSet() for key, _ in SOURCES.values()}
+        
+        with get_db() as conn:
+            cursor = conn.cursor()
+            for table, (key, column) in SOURCES.items():
+                cursor.execute(f"SELECT {column} as text, COUNT(*) as count FROM {table} GROUP BY {column}")
+                prefix_set = sets[key]
+                entries = []
+                for row in cursor.fetchall():
+                    prefix_set.counts[row['text']] = row['count']
+                    entries.extend((word_key, row['text'], whole) for word_key, whole in _word_keys(row['text']))
+                entries.sort()
+                prefix_set.keys = entries
+        
+        with self._lock:
+            self._sets = sets
+            self.built = True
+            self.build_ms = (time.perf_counter() - t0) * 1000
+
+    def handle_change(self, table, action, record_id, text=None, old_text=None):
+        """Listener de models: aplica una escritura sobre persons, videos o video_tags"""
+        if table not in SOURCES or not self.built:
+            return
+        
+        t0 = time.perf_counter()
+        with self._lock:
+            prefix_set = self._sets[SOURCES[table][0]]
+            if old_text is not None:
+                prefix_set.remove(old_text)
+            if text is not None:
+                prefix_set.add(text)
+            self.updates += 1
+            self.update_seconds += time.perf_counter() - t0
+
+    def suggest(self, partial_text, limit=10):
+        t0 = time.perf_counter()
+        prefix = normalize(partial_text.strip())
+        
+        with self._lock:
+            if prefix:
+                suggestions = {key: prefix_set.search(prefix, limit) for key, prefix_set in self._sets.items()}
+            else:
+                suggestions = {key: [] for key in self._sets}
+            self.queries += 1
+            self.query_seconds += time.perf_counter() - t0
+        
+        return suggestions
+
+    def get_stats(self):
+        """Tamaño aproximado en memoria y coste de construcción, actualización y consulta"""
+        with self._lock:
+            memory_bytes = 0
+            entries = {}
+            for key, prefix_set in self._sets.items():
+                memory_bytes += sys.getsizeof(prefix_set.keys) + sys.getsizeof(prefix_set.counts)
+                memory_bytes += sum(sys.getsizeof(entry) + sys.getsizeof(entry[0]) for entry in prefix_set.keys)
+                memory_bytes += sum(sys.getsizeof(text) for text in prefix_set.counts)
+                entries[key] = {'texts': len(prefix_set.counts), 'keys': len(prefix_set.keys)}
+            
+            return {
+                'built': self.built,
+                'entries': entries,
+                'memory_bytes': memory_bytes,
+                'build_ms': round(self.build_ms, 2),
+                'updates': self.updates,
+                'avg_update_us': round(self.update_seconds / self.updates * 1e6, 2) if self.updates else 0,
+                'queries': self.queries,
+                'avg_query_us': round(self.query_seconds / self.queries * 1e6, 2) if self.queries else 0
+            }
+
+# Instancia global del índice de sugerencias
+suggestion_index = SuggestionIndex()
+on_change(suggestion_index.handle_change)
+
+def build_suggestion_index():
+    """Construir el índice de sugerencias global"""
+    suggestion_index.build()
+
+def get_suggestion_index():
+    """Obtener la instancia del índice de sugerencias"""
+    return suggestion_index
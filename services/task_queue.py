@@ -1,89 +1,173 @@
+"""
+Cola de tareas en segundo plano (procesamiento de videos, lotes, limpieza).
+
+Las tareas se guardan en la tabla tasks (services/task_store) en lugar de un
+queue.Queue en memoria: sobreviven a reinicios, los workers las reclaman de
+forma atómica y al arrancar se recuperan las que quedaron running en un
+proceso que ya no existe. Un hilo de mantenimiento actualiza el heartbeat de
+las tareas en curso y devuelve a la cola las de workers que dejaron de latir.
+
+Con backend='process' las tareas de análisis (CPU_TASK_TYPES) las ejecutan
+procesos worker (services/worker_pool) en lugar de hilos del proceso web, que
+solo atienden las tareas livianas. Quien encola no nota la diferencia.
+
+Un lote (batch_process) no recorre sus videos en un solo worker: se reparte
+en tareas hijas batch_video que toma cualquier worker libre. La tarea del lote
+queda en espera hasta que termina la última hija; task_store la cierra con el
+resumen y _notify_batch_completed envía la notificación del lote una vez.
+"""
 import threading
-import queue
-import time
-from datetime import datetime
 import json
 import logging
-from services.video_processor import process_video
+from services.video_processor import process_video, get_known_faces
+from services.face_registry import get_face_registry
+from services import task_store
 from models import Video, Notification
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+POLL_INTERVAL = 1.0
+HEARTBEAT_INTERVAL = task_store.HEARTBEAT_INTERVAL
+STALE_AFTER = task_store.STALE_AFTER
+
+# Tareas de análisis de video: con backend 'process' no corren en el proceso web
+# (batch_process solo reparte el lote en hijas batch_video)
+CPU_TASK_TYPES = ('process_video', 'batch_video')
+WORKER_BACKEND = 'process'
+
 class TaskQueue:
-    def __init__(self, max_workers=2):
-        self.task_queue = queue.Queue()
-        self.result_queue = queue.Queue()
+    def __init__(self, max_workers=2, backend='thread', pool_options=None):
+        """
+        backend: 'thread' (todo en hilos de este proceso) o 'process'
+        pool_options: argumentos de ProcessWorkerPool (size, max_jobs, memory_limit_mb)
+        """
         self.max_workers = max_workers
+        self.backend = backend
+        self.pool_options = pool_options or {}
+        self.pool = None
         self.workers = []
         self.running = False
+        self._active = set()
+        self._active_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._maintenance = None
         
     def start(self):
         """Iniciar el sistema de cola de tareas"""
         if self.running:
             return
+        
+        task_store.ensure_task_table()
+        recovered = task_store.recover(STALE_AFTER, check_processes=True)
+        if recovered:
+            logger.info(f"{recovered} tareas interrumpidas devueltas a la cola")
             
         self.running = True
+        self._stopping.clear()
         for i in range(self.max_workers):
             worker = threading.Thread(target=self._worker, name=f'TaskWorker-{i}')
             worker.daemon = True
             worker.start()
             self.workers.append(worker)
+        
+        self._maintenance = threading.Thread(target=self._maintain, name='TaskQueue-heartbeat', daemon=True)
+        self._maintenance.start()
+        
+        if self.backend == 'process':
+            from services.worker_pool import ProcessWorkerPool
+            self.pool = ProcessWorkerPool(task_types=CPU_TASK_TYPES, **self.pool_options)
+            self.pool.start()
             
-        logger.info(f"TaskQueue iniciado con {self.max_workers} workers")
+        logger.info(f"TaskQueue iniciado con {self.max_workers} workers (backend {self.backend})")
     
     def stop(self):
-        """Detener el sistema de cola de tareas"""
+        """Detener el sistema de cola de tareas (las tareas en cola quedan guardadas)"""
         self.running = False
-        # Agregar tareas de parada para cada worker
-        for _ in range(self.max_workers):
-            self.task_queue.put(('stop', None, None))
+        self._stopping.set()
+        self._wakeup.set()
         
         # Esperar a que terminen los workers
         for worker in self.workers:
             worker.join(timeout=5)
+        if self._maintenance:
+            self._maintenance.join(timeout=5)
+        if self.pool:
+            self.pool.stop()
         
         self.workers = []
+        self.pool = None
+        self._maintenance = None
+        get_face_registry().close()
         logger.info("TaskQueue detenido")
     
+    def _maintain(self):
+        """Heartbeat de las tareas en curso y recuperación de las huérfanas"""
+        while not self._stopping.wait(HEARTBEAT_INTERVAL):
+            try:
+                with self._active_lock:
+                    active = list(self._active)
+                task_store.heartbeat(active)
+                recovered = task_store.recover(STALE_AFTER)
+                if recovered:
+                    logger.warning(f"{recovered} tareas sin heartbeat devueltas a la cola")
+                    self._wakeup.set()
+            except Exception as e:
+                logger.error(f"Error en el mantenimiento de la cola: {e}")
+    
     def _worker(self):
-        """Worker que procesa tareas de la cola"""
+        """Worker que reclama y procesa tareas de la tabla tasks"""
+        worker = task_store.worker_name(threading.current_thread().name)
+        # Con procesos worker, los hilos solo toman las tareas livianas
+        excluded = CPU_TASK_TYPES if self.backend == 'process' else ()
         while self.running:
             try:
-                # Obtener tarea de la cola (bloquea hasta que haya una tarea)
-                task_type, task_data, task_id = self.task_queue.get(timeout=1)
-                
-                if task_type == 'stop':
-                    break
-                    
-                logger.info(f"Procesando tarea {task_id}: {task_type}")
-                
-                # Procesar la tarea
-                result = self._process_task(task_type, task_data, task_id)
-                
-                # Guardar resultado
-                self.result_queue.put({
-                    'task_id': task_id,
-                    'task_type': task_type,
-                    'result': result,
-                    'completed_at': datetime.now().isoformat()
-                })
-                
-                # Marcar tarea como completada
-                self.task_queue.task_done()
-                
-            except queue.Empty:
-                continue
+                claimed = task_store.claim(worker, exclude_types=excluded)
             except Exception as e:
-                logger.error(f"Error procesando tarea {task_id}: {str(e)}")
-                # Crear notificación de error
-                Notification.create(
-                    type='error',
-                    title='Error en procesamiento',
-                    message=f'Error procesando tarea {task_id}: {str(e)}',
-                    icon='❌'
-                )
+                logger.error(f"Error reclamando tarea: {e}")
+                self._stopping.wait(POLL_INTERVAL)
+                continue
+            
+            if claimed is None:
+                # Sin tareas: esperar a add_task o al siguiente sondeo
+                # (otra instancia puede encolar en la misma base)
+                self._wakeup.wait(POLL_INTERVAL)
+                self._wakeup.clear()
+                continue
+            
+            self.execute(worker, *claimed)
+    
+    def execute(self, worker, row_id, task_type, task_data):
+        """Ejecutar una tarea reclamada por worker y guardar su resultado o su error"""
+        task_id = task_store.task_key(task_type, row_id)
+        with self._active_lock:
+            self._active.add(row_id)
+        
+        logger.info(f"Procesando tarea {task_id}: {task_type}")
+        try:
+            # Procesar la tarea y guardar el resultado
+            result = self._process_task(task_type, task_data, task_id)
+            if not task_store.complete(row_id, worker, result):
+                logger.warning(f"Tarea {task_id} reasignada a otro worker: se descarta este resultado")
+        except Exception as e:
+            task_store.fail(row_id, worker, str(e))
+            logger.error(f"Error procesando tarea {task_id}: {str(e)}")
+            # Crear notificación de error
+            Notification.create(
+                type='error',
+                title='Error en procesamiento',
+                message=f'Error procesando tarea {task_id}: {str(e)}',
+                icon='❌'
+            )
+        finally:
+            with self._active_lock:
+                self._active.discard(row_id)
+    
+    def known_faces(self):
+        """Galería con la que se procesan los videos (los procesos worker la reemplazan)"""
+        return get_known_faces()
     
     def _process_task(self, task_type, task_data, task_id):
         """Procesar una tarea específica"""
@@ -92,6 +176,8 @@ class TaskQueue:
                 return self._process_video_task(task_data, task_id)
             elif task_type == 'batch_process':
                 return self._process_batch_task(task_data, task_id)
+            elif task_type == 'batch_video':
+                return self._process_video_task(task_data, task_id)
             elif task_type == 'cleanup':
                 return self._process_cleanup_task(task_data, task_id)
             else:
@@ -102,7 +188,7 @@ class TaskQueue:
             raise
     
     def _process_video_task(self, task_data, task_id):
-        """Procesar un video individual"""
+        """Procesar un video individual (también cada video de un lote)"""
         video_id = task_data['video_id']
         
         # Notificar inicio
@@ -119,7 +205,7 @@ class TaskQueue:
             raise ValueError(f"Video {video_id} no encontrado")
         
         # Procesar video
-        result = process_video(video_id, video['file_path'])
+        result = process_video(video_id, video['file_path'], self.known_faces(), task_data.get('detector'))
         
         # Notificar completado
         if result:
@@ -145,9 +231,8 @@ class TaskQueue:
         }
     
     def _process_batch_task(self, task_data, task_id):
-        """Procesar múltiples videos en lote"""
+        """Repartir un lote en una tarea hija por video"""
         video_ids = task_data['video_ids']
-        results = []
         
         Notification.create(
             type='info',
@@ -156,39 +241,15 @@ class TaskQueue:
             icon='📦'
         )
         
-        for i, video_id in enumerate(video_ids):
-            try:
-                result = self._process_video_task({'video_id': video_id}, f"{task_id}-{i}")
-                results.append({
-                    'video_id': video_id,
-                    'success': True,
-                    'result': result
-                })
-            except Exception as e:
-                logger.error(f"Error procesando video {video_id}: {str(e)}")
-                results.append({
-                    'video_id': video_id,
-                    'success': False,
-                    'error': str(e)
-                })
-        
-        # Notificar completado del lote
-        successful = len([r for r in results if r['success']])
-        failed = len(results) - successful
-        
-        Notification.create(
-            type='success' if failed == 0 else 'warning',
-            title='Procesamiento en lote completado',
-            message=f'Procesados {successful} videos exitosamente, {failed} fallaron',
-            icon='📦✅' if failed == 0 else '📦⚠️'
+        # La tarea del lote queda waiting: complete() no la toca y el resumen
+        # lo escribe la última hija al terminar
+        task_store.spawn_children(
+            task_store.parse_key(task_id), 'batch_video',
+            [{'video_id': video_id, 'detector': task_data.get('detector')} for video_id in video_ids]
         )
+        self._wake('batch_video')
         
-        return {
-            'total': len(video_ids),
-            'successful': successful,
-            'failed': failed,
-            'results': results
-        }
+        return {'total': len(video_ids)}
     
     def _process_cleanup_task(self, task_data, task_id):
         """Tarea de limpieza y mantenimiento"""
@@ -219,53 +280,84 @@ class TaskQueue:
             
             return {'cleaned_files': cleaned_files}
         
+        elif cleanup_type == 'tasks':
+            # Borrar el historial de tareas terminadas
+            return {'purged_tasks': task_store.purge_finished()}
+        
         return {'cleanup_type': cleanup_type, 'completed': True}
     
     def add_task(self, task_type, task_data):
         """Agregar una tarea a la cola"""
-        task_id = f"{task_type}_{int(time.time() * 1000)}"
-        self.task_queue.put((task_type, task_data, task_id))
+        row_id = task_store.enqueue(task_type, task_data)
+        task_id = task_store.task_key(task_type, row_id)
+        self._wake(task_type)
         logger.info(f"Tarea agregada: {task_id}")
         return task_id
     
-    def add_video_processing_task(self, video_id):
-        """Agregar tarea de procesamiento de video"""
-        return self.add_task('process_video', {'video_id': video_id})
+    def _wake(self, task_type):
+        """Despertar a los workers que atienden task_type"""
+        if self.pool and task_type in CPU_TASK_TYPES:
+            self.pool.wake()
+        else:
+            self._wakeup.set()
+    
+    def add_video_processing_task(self, video_id, detector=None):
+        """Agregar tarea de procesamiento de video (detector: perfil de face_detectors)"""
+        return self.add_task('process_video', {'video_id': video_id, 'detector': detector})
     
-    def add_batch_processing_task(self, video_ids):
+    def add_batch_processing_task(self, video_ids, detector=None):
         """Agregar tarea de procesamiento en lote"""
-        return self.add_task('batch_process', {'video_ids': video_ids})
+        return self.add_task('batch_process', {'video_ids': video_ids, 'detector': detector})
     
     def add_cleanup_task(self, cleanup_type='general'):
         """Agregar tarea de limpieza"""
         return self.add_task('cleanup', {'type': cleanup_type})
     
+    def pending_count(self):
+        return task_store.counts()[task_store.QUEUED]
+    
     def get_queue_status(self):
         """Obtener estado de la cola"""
+        totals = task_store.counts()
         return {
             'running': self.running,
             'workers': len(self.workers),
-            'pending_tasks': self.task_queue.qsize(),
-            'completed_results': self.result_queue.qsize()
+            'pending_tasks': totals[task_store.QUEUED],
+            'running_tasks': totals[task_store.RUNNING],
+            'completed_results': totals[task_store.DONE],
+            'failed_tasks': totals[task_store.FAILED],
+            'waiting_batches': totals[task_store.WAITING],
+            'backend': self.backend,
+            'process_pool': self.pool.get_stats() if self.pool else None,
+            'gallery': get_face_registry().get_stats()
         }
     
+    def get_task(self, task_id):
+        """Estado y resultado de una tarea, o None"""
+        return task_store.get_task(task_id)
+    
     def get_completed_results(self, limit=10):
-        """Obtener resultados de tareas completadas"""
-        results = []
-        count = 0
-        
-        while not self.result_queue.empty() and count < limit:
-            try:
-                result = self.result_queue.get_nowait()
-                results.append(result)
-                count += 1
-            except queue.Empty:
-                break
-        
-        return results
+        """Obtener resultados de las últimas tareas terminadas"""
+        return task_store.recent_finished(limit)
+
+def _notify_batch_completed(task):
+    """Notificación del lote cuando task_store cierra su última tarea hija"""
+    if not task or task['task_type'] != 'batch_process':
+        return
+    summary = task['result']
+    failed = summary['failed']
+    
+    Notification.create(
+        type='success' if failed == 0 else 'warning',
+        title='Procesamiento en lote completado',
+        message=f'Procesados {summary["successful"]} videos exitosamente, {failed} fallaron',
+        icon='📦✅' if failed == 0 else '📦⚠️'
+    )
+
+task_store.on_parent_closed(_notify_batch_completed)
 
 # Instancia global del TaskQueue
-task_queue = TaskQueue()
+task_queue = TaskQueue(backend=WORKER_BACKEND)
 
 def start_task_queue():
     """Iniciar la cola de tareas global"""
@@ -0,0 +1,394 @@
+"""
+Tabla tasks: almacenamiento durable de la cola de tareas.
+
+Cada tarea se escribe en tasks con su estado (queued, running, done, failed)
+y sobrevive a reinicios del proceso. Los workers la reclaman con claim(),
+que en una transacción BEGIN IMMEDIATE toma la tarea en cola más antigua y
+la marca como running: dos workers (hilos o procesos) nunca reciben la misma.
+
+Mientras una tarea corre, su worker actualiza heartbeat_at. recover()
+devuelve a la cola las tareas running cuyo worker dejó de latir (o, al
+arrancar, las de un proceso de este mismo equipo que ya no existe); tras
+MAX_ATTEMPTS intentos la tarea queda failed.
+
+Una tarea puede repartirse en tareas hijas (spawn_children): queda en estado
+waiting, que recover() no toca, hasta que termina la última hija. Esa misma
+transacción la cierra como done con el resumen de las hijas y avisa a los
+listeners registrados con on_parent_closed(), una sola vez por tarea padre.
+"""
+from database import get_db
+import socket
+import json
+import time
+import os
+
+QUEUED, RUNNING, WAITING, DONE, FAILED = 'queued', 'running', 'waiting', 'done', 'failed'
+MAX_ATTEMPTS = 3
+HEARTBEAT_INTERVAL = 10.0
+STALE_AFTER = 3 * HEARTBEAT_INTERVAL
+
+HOSTNAME = socket.gethostname()
+
+_parent_listeners = []
+
+def on_parent_closed(listener):
+    """listener(task): task es la tarea padre (get_task) recién cerrada"""
+    _parent_listeners.append(listener)
+
+def _notify_parents(parent_ids):
+    for parent_id in parent_ids:
+        task = _get_by_id(parent_id)
+        for listener in _parent_listeners:
+            listener(task)
+
+def ensure_task_table():
+    """Crear la tabla tasks y sus índices si no existen"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS tasks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                task_type TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                parent_id INTEGER,
+                state TEXT NOT NULL DEFAULT 'queued',
+                result TEXT,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                worker TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                heartbeat_at REAL,
+                finished_at REAL
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_state ON tasks(state, id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_finished ON tasks(finished_at)")
+
+        # Tablas creadas antes de las tareas hijas
+        cursor.execute("PRAGMA table_info(tasks)")
+        if 'parent_id' not in [column['name'] for column in cursor.fetchall()]:
+            cursor.execute("ALTER TABLE tasks ADD COLUMN parent_id INTEGER")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_parent ON tasks(parent_id, state)")
+        conn.commit()
+
+def worker_name(thread_name):
+    """Identificador del worker: equipo, pid e hilo"""
+    return f"{HOSTNAME}:{os.getpid()}:{thread_name}"
+
+def task_key(task_type, task_id):
+    """task_id público ('process_video_42') a partir del id de la fila"""
+    return f"{task_type}_{task_id}"
+
+def parse_key(key):
+    try:
+        return int(str(key).rsplit('_', 1)[-1])
+    except ValueError:
+        return None
+
+def enqueue(task_type, payload):
+    """Agregar una tarea en cola; retorna su id"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT INTO tasks (task_type, payload, state, created_at) VALUES (?, ?, ?, ?)",
+            (task_type, json.dumps(payload), QUEUED, time.time())
+        )
+        conn.commit()
+        return cursor.lastrowid
+
+def _close_parent(cursor, parent_id):
+    """
+    Cerrar la tarea padre si ya no le quedan hijas pendientes, agregando sus
+    resultados; True solo para quien la cierra
+    """
+    cursor.execute("""
+        SELECT 1 FROM tasks WHERE parent_id = ? AND state IN (?, ?) LIMIT 1
+    """, (parent_id, QUEUED, RUNNING))
+    if cursor.fetchone():
+        return False
+
+    cursor.execute("SELECT payload, state, result, error FROM tasks WHERE parent_id = ? ORDER BY id", (parent_id,))
+    results = []
+    for row in cursor.fetchall():
+        entry = dict(json.loads(row['payload']), success=row['state'] == DONE)
+        if row['state'] == DONE:
+            entry['result'] = json.loads(row['result']) if row['result'] else None
+        else:
+            entry['error'] = row['error']
+        results.append(entry)
+
+    successful = sum(1 for entry in results if entry['success'])
+    summary = {
+        'total': len(results),
+        'successful': successful,
+        'failed': len(results) - successful,
+        'results': results
+    }
+    # La condición sobre state hace que solo una transacción cierre la tarea
+    cursor.execute(
+        "UPDATE tasks SET state = ?, result = ?, finished_at = ? WHERE id = ? AND state = ?",
+        (DONE, json.dumps(summary), time.time(), parent_id, WAITING)
+    )
+    return cursor.rowcount == 1
+
+def spawn_children(parent_id, task_type, payloads):
+    """
+    Encolar una tarea hija por payload y dejar la tarea padre en espera;
+    retorna los ids de las hijas
+    """
+    now = time.time()
+    with get_db() as conn:
+        conn.isolation_level = None
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            child_ids = []
+            for payload in payloads:
+                cursor.execute(
+                    "INSERT INTO tasks (task_type, payload, parent_id, state, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (task_type, json.dumps(payload), parent_id, QUEUED, now)
+                )
+                child_ids.append(cursor.lastrowid)
+            cursor.execute(
+                "UPDATE tasks SET state = ?, worker = NULL, heartbeat_at = NULL WHERE id = ?",
+                (WAITING, parent_id)
+            )
+            # Sin hijas la tarea padre se cierra en el acto
+            closed = _close_parent(cursor, parent_id)
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+
+    if closed:
+        _notify_parents([parent_id])
+    return child_ids
+
+def claim(worker, task_types=None, exclude_types=()):
+    """
+    Reclamar atómicamente la tarea en cola más antigua; (id, tipo, payload) o None
+    task_types / exclude_types: restringir los tipos que atiende este worker
+    """
+    conditions, params = ["state = ?"], [QUEUED]
+    if task_types:
+        conditions.append(f"task_type IN ({', '.join('?' * len(task_types))})")
+        params.extend(task_types)
+    if exclude_types:
+        conditions.append(f"task_type NOT IN ({', '.join('?' * len(exclude_types))})")
+        params.extend(exclude_types)
+
+    with get_db() as conn:
+        conn.isolation_level = None
+        cursor = conn.cursor()
+        # IMMEDIATE toma el bloqueo de escritura antes de leer: nadie más
+        # puede reclamar la misma fila entre el SELECT y el UPDATE
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            cursor.execute(f"""
+                SELECT id, task_type, payload FROM tasks
+                WHERE {' AND '.join(conditions)}
+                ORDER BY id LIMIT 1
+            """, params)
+            row = cursor.fetchone()
+            if row:
+                now = time.time()
+                cursor.execute("""
+                    UPDATE tasks
+                    SET state = ?, worker = ?, attempts = attempts + 1,
+                        started_at = ?, heartbeat_at = ?
+                    WHERE id = ?
+                """, (RUNNING, worker, now, now, row['id']))
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+
+    if not row:
+        return None
+    return row['id'], row['task_type'], json.loads(row['payload'])
+
+def _finish(task_id, worker, state, result=None, error=None):
+    """
+    Cerrar una tarea running de este worker; False si ya no le pertenece
+    (recover() la devolvió a la cola y otro worker la reclamó, o es una tarea
+    padre en espera)
+    """
+    with get_db() as conn:
+        conn.isolation_level = None
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            cursor.execute(
+                """
+                UPDATE tasks SET state = ?, result = ?, error = ?, finished_at = ?
+                WHERE id = ? AND state = ? AND worker = ?
+                """,
+                (state, json.dumps(result) if result is not None else None, error, time.time(),
+                 task_id, RUNNING, worker)
+            )
+            finished = cursor.rowcount == 1
+            closed = False
+            if finished:
+                cursor.execute("SELECT parent_id FROM tasks WHERE id = ?", (task_id,))
+                parent_id = cursor.fetchone()['parent_id']
+                closed = parent_id is not None and _close_parent(cursor, parent_id)
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+
+    if closed:
+        _notify_parents([parent_id])
+    return finished
+
+def complete(task_id, worker, result):
+    return _finish(task_id, worker, DONE, result=result)
+
+def fail(task_id, worker, error):
+    return _finish(task_id, worker, FAILED, error=error)
+
+def heartbeat(task_ids):
+    """Marcar como vivas las tareas que este proceso está ejecutando"""
+    if not task_ids:
+        return
+    with get_db() as conn:
+        conn.executemany(
+            "UPDATE tasks SET heartbeat_at = ? WHERE id = ? AND state = ?",
+            [(time.time(), task_id, RUNNING) for task_id in task_ids]
+        )
+        conn.commit()
+
+def _process_alive(pid):
+    if os.name != 'posix':
+        # En Windows os.kill(pid, 0) terminaría el proceso: solo cuenta el heartbeat
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def _is_orphan(worker):
+    """Worker de este equipo cuyo proceso ya no existe"""
+    try:
+        host, pid, _ = worker.split(':', 2)
+        pid = int(pid)
+    except (AttributeError, ValueError):
+        return False
+    return host == HOSTNAME and pid != os.getpid() and not _process_alive(pid)
+
+def recover(stale_after, check_processes=False):
+    """
+    Devolver a la cola las tareas running sin heartbeat desde hace stale_after
+    segundos (o de procesos muertos si check_processes); retorna cuántas
+    """
+    cutoff = time.time() - stale_after
+    with get_db() as conn:
+        conn.isolation_level = None
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            cursor.execute("SELECT id, parent_id, worker, attempts, heartbeat_at FROM tasks WHERE state = ?", (RUNNING,))
+            lost = [
+                row for row in cursor.fetchall()
+                if (row['heartbeat_at'] or 0) < cutoff or (check_processes and _is_orphan(row['worker']))
+            ]
+            closed = []
+            for row in lost:
+                if row['attempts'] >= MAX_ATTEMPTS:
+                    cursor.execute(
+                        "UPDATE tasks SET state = ?, error = ?, finished_at = ? WHERE id = ?",
+                        (FAILED, f"Worker perdido tras {row['attempts']} intentos", time.time(), row['id'])
+                    )
+                    if row['parent_id'] is not None and _close_parent(cursor, row['parent_id']):
+                        closed.append(row['parent_id'])
+                else:
+                    cursor.execute(
+                        "UPDATE tasks SET state = ?, worker = NULL, heartbeat_at = NULL WHERE id = ?",
+                        (QUEUED, row['id'])
+                    )
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+
+    _notify_parents(closed)
+    return len(lost)
+
+def counts():
+    """{estado: cantidad}"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT state, COUNT(*) AS total FROM tasks GROUP BY state")
+        totals = {QUEUED: 0, RUNNING: 0, WAITING: 0, DONE: 0, FAILED: 0}
+        totals.update({row['state']: row['total'] for row in cursor.fetchall()})
+        return totals
+
+def _describe(row):
+    return {
+        'task_id': task_key(row['task_type'], row['id']),
+        'parent_id': row['parent_id'],
+        'task_type': row['task_type'],
+        'state': row['state'],
+        'payload': json.loads(row['payload']),
+        'result': json.loads(row['result']) if row['result'] else None,
+        'error': row['error'],
+        'attempts': row['attempts'],
+        'worker': row['worker'],
+        'created_at': row['created_at'],
+        'started_at': row['started_at'],
+        'completed_at': row['finished_at']
+    }
+
+def _get_by_id(task_id):
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM tasks WHERE id = ?", (task_id,))
+        row = cursor.fetchone()
+        if not row:
+            return None
+        task = _describe(row)
+
+        # Avance de una tarea repartida en hijas
+        cursor.execute("SELECT state, COUNT(*) AS total FROM tasks WHERE parent_id = ? GROUP BY state", (task_id,))
+        children = {child['state']: child['total'] for child in cursor.fetchall()}
+        if children:
+            task['children'] = {
+                'total': sum(children.values()),
+                'pending': children.get(QUEUED, 0) + children.get(RUNNING, 0),
+                'done': children.get(DONE, 0),
+                'failed': children.get(FAILED, 0)
+            }
+        return task
+
+def get_task(key):
+    task_id = parse_key(key)
+    if task_id is None:
+        return None
+    return _get_by_id(task_id)
+
+def recent_finished(limit=10):
+    """Tareas terminadas (done o failed), de la más reciente a la más antigua"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT * FROM tasks
+            WHERE state IN (?, ?)
+            ORDER BY finished_at DESC
+            LIMIT ?
+        """, (DONE, FAILED, limit))
+        return [_describe(row) for row in cursor.fetchall()]
+
+def purge_finished(days=30):
+    """Borrar tareas terminadas hace más de `days` días"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "DELETE FROM tasks WHERE state IN (?, ?) AND finished_at < ?",
+            (DONE, FAILED, time.time() - days * 86400)
+        )
+        conn.commit()
+        return cursor.rowcount
@@ -5,7 +5,20 @@ Para desarrollo y pruebas cuando face_recognition no está disponible
 import os
 import json
 import cv2
-from models import Person, Video, VideoAppearance
+from models import Person
+from services.appearance_store import store_video_analysis
+from services.face_registry import get_face_registry
+from services.face_quality import new_stats
+from services.detection_store import flatten, smooth_detections, format_segment, SMOOTHING_THRESHOLD
+
+def encode_person(person):
+    """Versión mock: el "embedding" de cada persona es su id"""
+    print(f"  📷 Simulando: {person['name']} ✓")
+    return [float(person['id'])]
+
+def get_known_faces():
+    """Galería del registro compartido (solo se recarga si cambian las personas)"""
+    return get_face_registry().get(encode_person)
 
 def load_known_faces():
     """Versión mock que simula la carga de rostros conocidos"""
@@ -13,25 +26,24 @@ def load_known_faces():
     print("MODO DEMO - SIMULANDO CARGA DE ROSTROS")
     print("="*60)
     
-    persons = Person.get_all()
-    print(f"Total de personas registradas: {len(persons)}")
-    
-    # Simular que todas las personas están disponibles
-    known_encodings = list(range(len(persons)))  # IDs simulados
-    known_names = [person['name'] for person in persons]
-    known_ids = [person['id'] for person in persons]
-    
-    for person in persons:
-        print(f"  📷 Simulando: {person['name']} ✓")
+    known_encodings, known_names, known_ids = get_known_faces().as_tuple()
     
     print(f"\nTotal de rostros simulados: {len(known_encodings)}")
     print("="*60 + "\n")
     
     return known_encodings, known_names, known_ids
 
-def analyze_video_faces(video_path):
-    """Versión simplificada que simula el análisis de rostros"""
-    known_encodings, known_names, known_ids = load_known_faces()
+def analyze_video_faces(video_path, known_faces=None, detector=None, stats=None):
+    """
+    Versión simplificada que simula el análisis de rostros
+    known_faces: galería fija (un lote usa la misma para todos sus videos)
+    detector: se acepta por compatibilidad; en modo demo no se detecta nada
+    stats: dict que se completa con los contadores de face_quality
+    """
+    if known_faces is None:
+        known_encodings, known_names, known_ids = load_known_faces()
+    else:
+        known_encodings, known_names, known_ids = known_faces.as_tuple()
     
     if len(known_encodings) == 0:
         print("⚠ NO HAY ROSTROS REGISTRADOS. No se puede procesar el video.")
@@ -47,12 +59,15 @@ def analyze_video_faces(video_path):
         fps = video.get(cv2.CAP_PROP_FPS)
         frame_count = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
         duration = frame_count / fps if fps > 0 else 60  # Default 60 seconds
+        width = int(video.get(cv2.CAP_PROP_FRAME_WIDTH)) or 640
+        height = int(video.get(cv2.CAP_PROP_FRAME_HEIGHT)) or 360
         video.release()
     except:
         # Si OpenCV falla, usar valores por defecto
         fps = 30
         frame_count = 1800  # 60 seconds at 30fps
         duration = 60
+        width, height = 640, 360
     
     print(f"FPS: {fps:.2f}")
     print(f"Total de frames: {frame_count}")
@@ -76,11 +91,20 @@ def analyze_video_faces(video_path):
             timestamps = []
             
             for _ in range(num_appearances):
-                # Generar timestamp aleatorio
+                # Generar timestamp aleatorio, distancia de coincidencia y caja
+                # (top, right, bottom, left) simuladas
                 timestamp = random.uniform(5, duration - 5)  # Evitar principio/final
-                timestamps.append(timestamp)
+                size = random.randint(height // 6, height // 3)
+                top = random.randint(0, height - size)
+                left = random.randint(0, width - size)
+                box = (top, left + size, top + size, left)
+                timestamps.append((timestamp, random.uniform(0.3, 0.6), int(timestamp * (fps or 30)), box))
             
             detections[person_id] = sorted(timestamps)
+            if stats is not None:
+                # En modo demo todos los rostros simulados pasan el filtro de calidad
+                stats['faces_detected'] += len(timestamps)
+                stats['faces_encoded'] += len(timestamps)
             
             person_name = known_names[known_ids.index(person_id)]
             print(f"Simulando {len(timestamps)} apariciones de: {person_name}")
@@ -88,39 +112,18 @@ def analyze_video_faces(video_path):
     print("="*60 + "\n")
     return detections
 
-def smooth_appearances(detections):
+def smooth_appearances(detections, threshold=SMOOTHING_THRESHOLD):
     """Mantener la misma lógica de suavizado"""
     print("\n" + "="*60)
     print("SUAVIZANDO APARICIONES")
     print("="*60)
+    print(f"Umbral de suavizado: {threshold} segundos")
     
-    SMOOTHING_THRESHOLD = 3.0
-    print(f"Umbral de suavizado: {SMOOTHING_THRESHOLD} segundos")
-    
-    appearances = {}
+    appearances = smooth_detections(flatten(detections), threshold=threshold)
     
-    for person_id, timestamps in detections.items():
-        if not timestamps:
-            continue
-        
-        timestamps = sorted(timestamps)
-        segments = []
-        start = timestamps[0]
-        end = timestamps[0]
-        
-        for i in range(1, len(timestamps)):
-            if timestamps[i] - end <= SMOOTHING_THRESHOLD:
-                end = timestamps[i]
-            else:
-                segments.append((start, end))
-                start = timestamps[i]
-                end = timestamps[i]
-        
-        segments.append((start, end))
-        appearances[person_id] = segments
-        
+    for person_id, segments in appearances.items():
         print(f"\nPersona ID {person_id}:")
-        print(f"  Detecciones individuales: {len(timestamps)}")
+        print(f"  Detecciones individuales: {len(detections[person_id])}")
         print(f"  Segmentos continuos: {len(segments)}")
         for idx, (s, e) in enumerate(segments, 1):
             print(f"    Segmento {idx}: {s:.2f}s - {e:.2f}s (duración: {e-s:.2f}s)")
@@ -129,7 +132,7 @@ def smooth_appearances(detections):
     
     return appearances
 
-def process_video(video_id, video_path):
+def process_video(video_id, video_path, known_faces=None, detector=None):
     """Función principal de procesamiento - versión demo"""
     print("\n" + "█"*60)
     print("█" + " "*58 + "█")
@@ -144,16 +147,15 @@ def process_video(video_id, video_path):
         print(f"⚠ ERROR: El archivo no existe: {video_path}")
         return {}
     
-    detections = analyze_video_faces(video_path)
+    stats = new_stats()
+    detections = analyze_video_faces(video_path, known_faces, detector, stats)
     appearances = smooth_appearances(detections)
+    columns = flatten(detections)
     
     print("\n" + "="*60)
     print("GUARDANDO RESULTADOS EN BASE DE DATOS")
     print("="*60)
     
-    # Limpiar apariciones previas
-    VideoAppearance.delete_by_video(video_id)
-    
     result = {}
     for person_id, segments in appearances.items():
         person = Person.get_by_id(person_id)
@@ -163,15 +165,13 @@ def process_video(video_id, video_path):
         result[person_name] = []
         
         for idx, (start_time, end_time) in enumerate(segments, 1):
-            VideoAppearance.create(video_id, person_id, start_time, end_time)
-            result[person_name].append({
-                'start': round(start_time, 2),
-                'end': round(end_time, 2)
-            })
+            # Incluye frame y caja de la mejor detección del segmento
+            result[person_name].append(format_segment(person_id, start_time, end_time, columns))
             print(f"  Segmento {idx}: {start_time:.2f}s - {end_time:.2f}s guardado ✓")
     
-    # Marcar video como procesado
-    Video.mark_processed(video_id, json.dumps(result))
+    # Guardar apariciones (y detecciones crudas), marcar como procesado y
+    # actualizar estadísticas en una sola transacción
+    store_video_analysis(video_id, appearances, json.dumps(result), detections=columns, stats=stats)
     
     print("\n" + "="*60)
     print("✓ VIDEO PROCESADO EXITOSAMENTE (MODO DEMO)")
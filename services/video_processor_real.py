@@ -2,50 +2,72 @@ import face_recognition
 import cv2
 import os
 import json
-from models import Person, Video, VideoAppearance
+from models import Person
+from services.appearance_store import store_video_analysis
+from services.face_registry import get_face_registry
+from services.face_detectors import get_detector
+from services.face_quality import (new_stats, assess_faces, encode_faces, defer_crop, uncovered,
+                                   ENCODE, DEFER, MAX_DEFERRED)
+from services.detection_store import flatten, smooth_detections, format_segment, SMOOTHING_THRESHOLD
 
 FACES_FOLDER = os.path.join('instance', 'faces')
 FPS_SAMPLE = 4
-SMOOTHING_THRESHOLD = 3.0
+MATCH_TOLERANCE = 0.6
 MAX_RESOLUTION = 800
 
-def load_known_faces():
-    known_encodings = []
-    known_names = []
-    known_ids = []
+def encode_person(person):
+    """Embedding de la foto de una persona, o None si no hay foto o rostro"""
+    photo_path = os.path.join(FACES_FOLDER, person['photo_path'])
+    if not os.path.exists(photo_path):
+        print(f"  ⚠ Foto no encontrada: {person['name']} ({photo_path})")
+        return None
+    
+    print(f"  📷 Procesando: {person['name']}")
+    image = face_recognition.load_image_file(photo_path)
+    encodings = face_recognition.face_encodings(image)
     
+    if len(encodings) > 0:
+        print(f"     ✓ Rostro codificado exitosamente")
+        return encodings[0]
+    print(f"     ✗ No se detectó rostro en la imagen")
+    return None
+
+def get_known_faces():
+    """Galería del registro compartido; solo se codifican fotos nuevas"""
+    return get_face_registry().get(encode_person)
+
+def load_known_faces():
     print("\n" + "="*60)
     print("CARGANDO ROSTROS CONOCIDOS")
     print("="*60)
     
-    persons = Person.get_all()
-    print(f"Total de personas registradas: {len(persons)}")
-    
-    for person in persons:
-        photo_path = os.path.join(FACES_FOLDER, person['photo_path'])
-        if not os.path.exists(photo_path):
-            print(f"  ⚠ Foto no encontrada: {person['name']} ({photo_path})")
-            continue
-        
-        print(f"  📷 Procesando: {person['name']}")
-        image = face_recognition.load_image_file(photo_path)
-        encodings = face_recognition.face_encodings(image)
-        
-        if len(encodings) > 0:
-            known_encodings.append(encodings[0])
-            known_names.append(person['name'])
-            known_ids.append(person['id'])
-            print(f"     ✓ Rostro codificado exitosamente")
-        else:
-            print(f"     ✗ No se detectó rostro en la imagen")
+    known_encodings, known_names, known_ids = get_known_faces().as_tuple()
     
     print(f"\nTotal de rostros cargados: {len(known_encodings)}")
     print("="*60 + "\n")
     
     return known_encodings, known_names, known_ids
 
-def analyze_video_faces(video_path):
-    known_encodings, known_names, known_ids = load_known_faces()
+def match_face(known_encodings, face_encoding):
+    """(índice, distancia) de la persona más cercana, o None si supera la tolerancia"""
+    distances = face_recognition.face_distance(known_encodings, face_encoding)
+    match_index = int(distances.argmin())
+    distance = float(distances[match_index])
+    if distance > MATCH_TOLERANCE:
+        return None
+    return match_index, distance
+
+def analyze_video_faces(video_path, known_faces=None, detector=None, stats=None):
+    """
+    detector: perfil o backend de face_detectors (None = perfil por defecto)
+    stats: dict que se completa con los contadores de face_quality
+    """
+    if stats is None:
+        stats = new_stats()
+    if known_faces is None:
+        known_encodings, known_names, known_ids = load_known_faces()
+    else:
+        known_encodings, known_names, known_ids = known_faces.as_tuple()
     
     if len(known_encodings) == 0:
         print("⚠ NO HAY ROSTROS REGISTRADOS. No se puede procesar el video.")
@@ -71,11 +93,13 @@ def analyze_video_faces(video_path):
     print(f"Analizando cada {frame_interval} frames ({FPS_SAMPLE} FPS)")
     print(f"Frames a procesar: {frames_to_process}")
     print(f"Resolución máxima de análisis: {MAX_RESOLUTION}px")
+    face_detector = get_detector(detector)
+    print(f"Detector de rostros: {face_detector.name}")
     print("="*60 + "\n")
     
     detections = {}
     frames_processed = 0
-    faces_detected = 0
+    deferred = []
     last_detection = {}
     skip_until_frame = {}
     
@@ -103,6 +127,7 @@ def analyze_video_faces(video_path):
                 continue
             
             height, width = frame.shape[:2]
+            scale = 1.0
             if width > MAX_RESOLUTION:
                 scale = MAX_RESOLUTION / width
                 new_width = MAX_RESOLUTION
@@ -116,26 +141,48 @@ def analyze_video_faces(video_path):
             
             rgb_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
             
-            face_locations = face_recognition.face_locations(rgb_frame, model='hog', number_of_times_to_upsample=1)
-            face_encodings = face_recognition.face_encodings(rgb_frame, face_locations)
+            face_locations = face_detector.detect(rgb_frame)
+            
+            # Solo se codifican los rostros con calidad suficiente; los dudosos
+            # se guardan recortados para decidir al final
+            gray_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2GRAY)
+            accepted, landmarks = [], []
+            for face_location, decision, shape in assess_faces(rgb_frame, gray_frame, face_locations, stats):
+                if decision == ENCODE:
+                    accepted.append(face_location)
+                    landmarks.append(shape)
+                elif decision == DEFER:
+                    if len(deferred) < MAX_DEFERRED:
+                        deferred.append((timestamp, frame_number, scale, face_location,
+                                         defer_crop(rgb_frame, face_location)))
+                    else:
+                        stats['deferred_dropped'] += 1
+            
+            face_locations = accepted
+            # Los landmarks del control de pose se reutilizan para codificar
+            face_encodings = encode_faces(rgb_frame, landmarks)
+            stats['faces_encoded'] += len(face_encodings)
             
             if face_encodings:
                 print(f" | Rostros detectados: {len(face_encodings)}", end="")
-                faces_detected += len(face_encodings)
             
             detected_names = []
-            for face_encoding in face_encodings:
-                matches = face_recognition.compare_faces(known_encodings, face_encoding, tolerance=0.6)
+            for face_location, face_encoding in zip(face_locations, face_encodings):
+                # La persona más cercana, si está dentro de la tolerancia; la
+                # distancia se guarda para poder filtrar al re-suavizar
+                match = match_face(known_encodings, face_encoding)
                 
-                if True in matches:
-                    match_index = matches.index(True)
+                if match:
+                    match_index, distance = match
                     person_id = known_ids[match_index]
                     person_name = known_names[match_index]
                     
                     if person_id not in detections:
                         detections[person_id] = []
                     
-                    detections[person_id].append(timestamp)
+                    # Caja en coordenadas del frame original para recortar sin redetectar
+                    box = tuple(int(round(v / scale)) for v in face_location)
+                    detections[person_id].append((timestamp, distance, frame_number, box))
                     detected_names.append(person_name)
                     last_detection[person_id] = frame_number
                     
@@ -151,11 +198,35 @@ def analyze_video_faces(video_path):
     
     video.release()
     
+    # Rostros diferidos: solo se codifican los que caen donde no hubo ninguna
+    # detección aceptada (ahí podrían agregar un segmento nuevo)
+    covered = [d[0] for person_detections in detections.values() for d in person_detections]
+    for timestamp, frame_number, scale, face_location, (crop, crop_box) in deferred:
+        if not uncovered(timestamp, covered, SMOOTHING_THRESHOLD):
+            continue
+        encodings = face_recognition.face_encodings(crop, [crop_box])
+        stats['deferred_encoded'] += len(encodings)
+        match = match_face(known_encodings, encodings[0]) if encodings else None
+        if match:
+            match_index, distance = match
+            box = tuple(int(round(v / scale)) for v in face_location)
+            detections.setdefault(known_ids[match_index], []).append((timestamp, distance, frame_number, box))
+            covered.append(timestamp)
+    for person_detections in detections.values():
+        person_detections.sort()
+    
+    stats['frames_processed'] = frames_processed
+    stats['detector'] = face_detector.name
+    
     print("\n" + "="*60)
     print("ANÁLISIS COMPLETADO")
     print("="*60)
     print(f"Frames procesados: {frames_processed}")
-    print(f"Rostros detectados: {faces_detected}")
+    print(f"Rostros detectados: {stats['faces_detected']}")
+    print(f"Rostros codificados: {stats['faces_encoded'] + stats['deferred_encoded']} "
+          f"(descartados: {stats['skipped_small']} pequeños, {stats['skipped_blurry']} borrosos; "
+          f"diferidos: {stats['deferred_blurry'] + stats['deferred_profile']}, "
+          f"codificados al final: {stats['deferred_encoded']})")
     print(f"Personas reconocidas: {len(detections)}")
     for person_id in detections:
         idx = known_ids.index(person_id)
@@ -164,36 +235,17 @@ def analyze_video_faces(video_path):
     
     return detections
 
-def smooth_appearances(detections):
+def smooth_appearances(detections, threshold=SMOOTHING_THRESHOLD):
     print("\n" + "="*60)
     print("SUAVIZANDO APARICIONES")
     print("="*60)
-    print(f"Umbral de suavizado: {SMOOTHING_THRESHOLD} segundos")
+    print(f"Umbral de suavizado: {threshold} segundos")
     
-    appearances = {}
+    appearances = smooth_detections(flatten(detections), threshold=threshold)
     
-    for person_id, timestamps in detections.items():
-        if not timestamps:
-            continue
-        
-        timestamps = sorted(timestamps)
-        segments = []
-        start = timestamps[0]
-        end = timestamps[0]
-        
-        for i in range(1, len(timestamps)):
-            if timestamps[i] - end <= SMOOTHING_THRESHOLD:
-                end = timestamps[i]
-            else:
-                segments.append((start, end))
-                start = timestamps[i]
-                end = timestamps[i]
-        
-        segments.append((start, end))
-        appearances[person_id] = segments
-        
+    for person_id, segments in appearances.items():
         print(f"\nPersona ID {person_id}:")
-        print(f"  Detecciones individuales: {len(timestamps)}")
+        print(f"  Detecciones individuales: {len(detections[person_id])}")
         print(f"  Segmentos continuos: {len(segments)}")
         for idx, (s, e) in enumerate(segments, 1):
             print(f"    Segmento {idx}: {s:.2f}s - {e:.2f}s (duración: {e-s:.2f}s)")
@@ -202,7 +254,7 @@ def smooth_appearances(detections):
     
     return appearances
 
-def process_video(video_id, video_path):
+def process_video(video_id, video_path, known_faces=None, detector=None):
     print("\n" + "█"*60)
     print("█" + " "*58 + "█")
     print("█" + " "*15 + "PROCESAMIENTO DE VIDEO" + " "*22 + "█")
@@ -211,15 +263,15 @@ def process_video(video_id, video_path):
     print(f"Video ID: {video_id}")
     print(f"Ruta: {video_path}")
     
-    detections = analyze_video_faces(video_path)
+    stats = new_stats()
+    detections = analyze_video_faces(video_path, known_faces, detector, stats)
     appearances = smooth_appearances(detections)
+    columns = flatten(detections)
     
     print("\n" + "="*60)
     print("GUARDANDO RESULTADOS EN BASE DE DATOS")
     print("="*60)
     
-    VideoAppearance.delete_by_video(video_id)
-    
     result = {}
     for person_id, segments in appearances.items():
         person = Person.get_by_id(person_id)
@@ -229,14 +281,13 @@ def process_video(video_id, video_path):
         result[person_name] = []
         
         for idx, (start_time, end_time) in enumerate(segments, 1):
-            VideoAppearance.create(video_id, person_id, start_time, end_time)
-            result[person_name].append({
-                'start': round(start_time, 2),
-                'end': round(end_time, 2)
-            })
+            # Incluye frame y caja de la mejor detección del segmento
+            result[person_name].append(format_segment(person_id, start_time, end_time, columns))
             print(f"  Segmento {idx}: {start_time:.2f}s - {end_time:.2f}s guardado ✓")
     
-    Video.mark_processed(video_id, json.dumps(result))
+    # Guardar apariciones (y detecciones crudas), marcar como procesado y
+    # actualizar estadísticas en una sola transacción
+    store_video_analysis(video_id, appearances, json.dumps(result), detections=columns, stats=stats)
     
     print("\n" + "="*60)
     print("✓ VIDEO PROCESADO EXITOSAMENTE")
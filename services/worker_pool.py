@@ -0,0 +1,354 @@
+"""
+Procesos worker para las tareas de análisis de video.
+
+Los hilos de TaskQueue comparten el GIL con las peticiones web; la detección
+de rostros y el manejo de frames en Python las frenan. ProcessWorkerPool
+lanza procesos separados (uno por núcleo por defecto) que reclaman
+directamente de la tabla tasks las tareas de task_types, así que
+add_video_processing_task no cambia. Cada worker es un intérprete nuevo
+(python -m services.worker_pool): no hereda los hilos ni los índices en
+memoria del proceso web, ni vuelve a ejecutar app.py al arrancar.
+
+Para contener fugas de memoria de dlib y OpenCV:
+- cada worker termina tras max_jobs tareas o si al acabar una su RSS supera
+  memory_limit_mb; el supervisor lanza otro en su lugar;
+- si durante una tarea el RSS pasa de HARD_LIMIT_FACTOR veces el límite, el
+  supervisor termina el proceso y la tarea vuelve a la cola (o queda failed
+  tras task_store.MAX_ATTEMPTS intentos).
+
+El supervisor habla con cada worker por su stdin, una línea JSON por
+mensaje: 'wake' (hay tareas nuevas), 'gallery' (descriptor de la galería en
+memoria compartida de face_registry, reenviado cuando cambia su versión) y
+'stop' (terminar al acabar la tarea actual).
+
+En sentido inverso, el stdout del worker queda reservado para sus mensajes
+(los print del procesador van a stderr). Al terminar cada tarea envía
+'changes': las notificaciones de models.notify_change que emitió, que solo
+llegan a los listeners de su propio proceso. El supervisor las repite en el
+proceso web para que los índices en memoria (bitmaps de personas,
+sugerencias, dashboard) vean los videos procesados por los workers.
+"""
+from models import on_change, notify_change
+from services import task_store
+from services.face_registry import get_face_registry, get_gallery_version, attach_shared
+import subprocess
+import threading
+import logging
+import queue
+import json
+import time
+import sys
+import os
+
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+MAX_JOBS_PER_WORKER = 20
+MEMORY_LIMIT_MB = 1536
+HARD_LIMIT_FACTOR = 1.5
+SUPERVISE_INTERVAL = 2.0
+POLL_INTERVAL = 1.0
+# Varios procesos escriben en la misma base: esperan más el bloqueo que el
+# proceso web antes de fallar con "database is locked"
+WORKER_BUSY_TIMEOUT = 30.0
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def rss_mb(pid):
+    """Memoria residente de un proceso en MB, o None si no se puede medir"""
+    if PSUTIL_AVAILABLE:
+        try:
+            return psutil.Process(pid).memory_info().rss / (1024 * 1024)
+        except psutil.Error:
+            return None
+    try:
+        with open(f'/proc/{pid}/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+class ProcessWorkerPool:
+    def __init__(self, task_types, size=None, max_jobs=MAX_JOBS_PER_WORKER, memory_limit_mb=MEMORY_LIMIT_MB):
+        self.task_types = tuple(task_types)
+        self.size = size or os.cpu_count() or 1
+        self.max_jobs = max_jobs
+        self.memory_limit_mb = memory_limit_mb
+        self._slots = []
+        self._slots_lock = threading.Lock()
+        self._gallery = None
+        self._supervisor = None
+        self._stopping = threading.Event()
+        self._recycled = 0
+        self._killed = 0
+        self.running = False
+
+    def _send(self, slot, message, value=None):
+        try:
+            slot['process'].stdin.write(json.dumps({'type': message, 'value': value}) + '\n')
+            slot['process'].stdin.flush()
+        except (BrokenPipeError, OSError, ValueError):
+            # El worker terminó: el supervisor lo relanza
+            pass
+
+    def _publish_gallery(self):
+        """Publicar la galería vigente y reenviarla a los workers si cambió"""
+        from services.video_processor import encode_person
+        try:
+            descriptor = get_face_registry().publish_shared(encode_person)
+        except Exception as e:
+            logger.warning(f"No se pudo publicar la galería en memoria compartida: {e}")
+            return
+        if descriptor is not None and descriptor is not self._gallery:
+            self._gallery = descriptor
+            with self._slots_lock:
+                for slot in self._slots:
+                    self._send(slot, 'gallery', descriptor)
+
+    def _spawn(self, index):
+        import database
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'services.worker_pool',
+             '--database', os.path.abspath(database.DATABASE_PATH),
+             '--index', str(index),
+             '--task-types', ','.join(self.task_types),
+             '--max-jobs', str(self.max_jobs),
+             '--memory-limit', str(self.memory_limit_mb)],
+            cwd=PROJECT_ROOT, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True
+        )
+        slot = {'index': index, 'process': process, 'name': f'ProcessWorker-{index}', 'started_at': time.time()}
+        threading.Thread(target=self._read_messages, args=(slot,), name=f"{slot['name']}-reader", daemon=True).start()
+        if self._gallery:
+            self._send(slot, 'gallery', self._gallery)
+        return slot
+
+    def _read_messages(self, slot):
+        """Repetir en este proceso las notificaciones de cambios del worker"""
+        for line in slot['process'].stdout:
+            try:
+                message = json.loads(line)
+            except ValueError:
+                continue
+            if message.get('type') != 'changes':
+                continue
+            for change in message['value']:
+                try:
+                    notify_change(*change)
+                except Exception as e:
+                    logger.error(f"Error aplicando un cambio de {slot['name']}: {e}")
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self._stopping.clear()
+        self._publish_gallery()
+        with self._slots_lock:
+            self._slots = [self._spawn(i) for i in range(self.size)]
+        self._supervisor = threading.Thread(target=self._supervise, name='ProcessWorkerPool', daemon=True)
+        self._supervisor.start()
+        logger.info(f"ProcessWorkerPool iniciado con {self.size} procesos")
+        if rss_mb(os.getpid()) is None:
+            logger.warning("No se puede medir la memoria de los procesos (instale psutil): "
+                           "solo se reciclan los workers por número de tareas")
+
+    def _supervise(self):
+        """Relanzar workers terminados, cortar los que exceden la memoria y difundir la galería"""
+        while not self._stopping.wait(SUPERVISE_INTERVAL):
+            try:
+                died = False
+                with self._slots_lock:
+                    for position, slot in enumerate(self._slots):
+                        process = slot['process']
+                        if process.poll() is not None:
+                            if process.returncode != 0:
+                                died = True
+                            self._recycled += 1
+                            self._slots[position] = self._spawn(slot['index'])
+                            continue
+
+                        memory = rss_mb(process.pid)
+                        if memory is not None and memory > self.memory_limit_mb * HARD_LIMIT_FACTOR:
+                            logger.warning(f"{slot['name']} usa {memory:.0f} MB: se termina")
+                            process.kill()
+                            self._killed += 1
+
+                if died:
+                    # La tarea que corría el proceso muerto vuelve a la cola
+                    task_store.recover(task_store.STALE_AFTER, check_processes=True)
+                    self.wake()
+
+                if self._gallery is None or self._gallery['version'] != get_gallery_version():
+                    self._publish_gallery()
+            except Exception as e:
+                logger.error(f"Error supervisando los procesos worker: {e}")
+
+    def wake(self):
+        """Avisar a los workers de que hay tareas nuevas"""
+        with self._slots_lock:
+            for slot in self._slots:
+                self._send(slot, 'wake')
+
+    def stop(self, timeout=5):
+        """Pedir a los workers que terminen al acabar su tarea actual"""
+        self.running = False
+        self._stopping.set()
+        if self._supervisor:
+            self._supervisor.join(timeout=timeout)
+        with self._slots_lock:
+            for slot in self._slots:
+                self._send(slot, 'stop')
+            for slot in self._slots:
+                try:
+                    slot['process'].wait(timeout=timeout)
+                except subprocess.TimeoutExpired:
+                    # Su tarea queda running y se recupera al volver a arrancar
+                    slot['process'].kill()
+            self._slots = []
+
+    def get_stats(self):
+        with self._slots_lock:
+            slots = list(self._slots)
+        return {
+            'processes': len(slots),
+            'max_jobs_per_worker': self.max_jobs,
+            'memory_limit_mb': self.memory_limit_mb,
+            'recycled': self._recycled,
+            'killed_for_memory': self._killed,
+            'gallery_version': self._gallery['version'] if self._gallery else None,
+            'workers': [
+                {
+                    'name': slot['name'],
+                    'pid': slot['process'].pid,
+                    'alive': slot['process'].poll() is None,
+                    'rss_mb': round(rss_mb(slot['process'].pid) or 0, 1),
+                    'uptime': round(time.time() - slot['started_at'], 1)
+                }
+                for slot in slots
+            ]
+        }
+
+def _read_control(control):
+    """Hilo del worker: mensajes JSON del supervisor por stdin (EOF = detenerse)"""
+    for line in sys.stdin:
+        try:
+            message = json.loads(line)
+        except ValueError:
+            continue
+        control.put((message['type'], message.get('value')))
+    control.put(('stop', None))
+
+def worker_main(database_path, index, task_types, max_jobs, memory_limit_mb):
+    """Bucle de un proceso worker: reclamar, ejecutar y reciclarse"""
+    import database
+    database.DATABASE_PATH = database_path
+    database.BUSY_TIMEOUT = WORKER_BUSY_TIMEOUT
+    from services.task_queue import TaskQueue
+
+    name = task_store.worker_name(f'ProcessWorker-{index}')
+    state = {'gallery': None, 'faces': None, 'current': None, 'stop': False}
+    control = queue.Queue()
+
+    # stdout queda para los mensajes al supervisor
+    channel, sys.stdout = sys.stdout, sys.stderr
+    changes = []
+    on_change(lambda *change: changes.append(change))
+
+    def send_changes():
+        if not changes:
+            return
+        channel.write(json.dumps({'type': 'changes', 'value': changes}) + '\n')
+        channel.flush()
+        changes.clear()
+
+    class WorkerExecutor(TaskQueue):
+        def known_faces(self):
+            # La galería compartida si sigue vigente; si no, la del registro propio
+            descriptor = state['gallery']
+            if descriptor and descriptor['version'] == get_gallery_version():
+                if state['faces'] is None or state['faces'].version != descriptor['version']:
+                    state['faces'] = attach_shared(descriptor)
+                return state['faces']
+            return super().known_faces()
+
+    executor = WorkerExecutor(max_workers=0)
+
+    def read_control(timeout):
+        try:
+            message, value = control.get(timeout=timeout) if timeout else control.get_nowait()
+        except queue.Empty:
+            return
+        while True:
+            if message == 'gallery':
+                state['gallery'] = value
+            elif message == 'stop':
+                state['stop'] = True
+            try:
+                message, value = control.get_nowait()
+            except queue.Empty:
+                return
+
+    def beat():
+        while not state['stop']:
+            time.sleep(task_store.HEARTBEAT_INTERVAL)
+            if state['current'] is not None:
+                try:
+                    task_store.heartbeat([state['current']])
+                except Exception as e:
+                    logger.warning(f"Heartbeat fallido en {name}: {e}")
+
+    threading.Thread(target=_read_control, args=(control,), daemon=True).start()
+    threading.Thread(target=beat, daemon=True).start()
+
+    jobs = 0
+    while not state['stop']:
+        read_control(0)
+        if state['stop']:
+            break
+
+        try:
+            claimed = task_store.claim(name, task_types=task_types)
+        except Exception as e:
+            logger.error(f"Error reclamando tarea en {name}: {e}")
+            read_control(POLL_INTERVAL)
+            continue
+        if claimed is None:
+            read_control(POLL_INTERVAL)
+            continue
+
+        state['current'] = claimed[0]
+        try:
+            executor.execute(name, *claimed)
+        except Exception as e:
+            # Ni siquiera se pudo guardar el error: la tarea sigue running
+            # y recover() la devuelve a la cola cuando deje de latir
+            logger.error(f"Error guardando la tarea {claimed[0]} en {name}: {e}")
+        finally:
+            state['current'] = None
+            send_changes()
+        jobs += 1
+
+        memory = rss_mb(os.getpid())
+        if jobs >= max_jobs or (memory is not None and memory > memory_limit_mb):
+            logger.info(f"{name} se recicla tras {jobs} tareas ({memory or 0:.0f} MB)")
+            break
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Proceso worker de la cola de tareas")
+    parser.add_argument('--database', required=True)
+    parser.add_argument('--index', type=int, default=0)
+    parser.add_argument('--task-types', required=True)
+    parser.add_argument('--max-jobs', type=int, default=MAX_JOBS_PER_WORKER)
+    parser.add_argument('--memory-limit', type=float, default=MEMORY_LIMIT_MB)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    worker_main(args.database, args.index, tuple(args.task_types.split(',')),
+                args.max_jobs, args.memory_limit)
@@ -15,7 +15,14 @@ CREATE TABLE IF NOT EXISTS videos (
     analysis_result TEXT,
     emotion_analysis TEXT,
     uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    processed_at TIMESTAMP
+    processed_at TIMESTAMP,
+    uploaded_epoch INTEGER,
+    upload_day TEXT,
+    upload_week TEXT,
+    upload_month TEXT,
+    appearance_count INTEGER NOT NULL DEFAULT 0,
+    unique_persons INTEGER NOT NULL DEFAULT 0,
+    persons_list TEXT
 );
 
 CREATE TABLE IF NOT EXISTS video_appearances (
@@ -45,8 +52,158 @@ CREATE TABLE IF NOT EXISTS notifications (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+CREATE TABLE IF NOT EXISTS person_stats (
+    person_id INTEGER PRIMARY KEY,
+    total_videos INTEGER NOT NULL DEFAULT 0,
+    total_appearances INTEGER NOT NULL DEFAULT 0,
+    total_screen_time REAL NOT NULL DEFAULT 0,
+    last_seen TIMESTAMP,
+    FOREIGN KEY (person_id) REFERENCES persons(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS co_appearances (
+    person_a INTEGER NOT NULL,
+    person_b INTEGER NOT NULL,
+    video_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (person_a, person_b),
+    FOREIGN KEY (person_a) REFERENCES persons(id) ON DELETE CASCADE,
+    FOREIGN KEY (person_b) REFERENCES persons(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS co_appearance_overlaps (
+    video_id INTEGER NOT NULL,
+    person_a INTEGER NOT NULL,
+    person_b INTEGER NOT NULL,
+    overlap_seconds REAL NOT NULL DEFAULT 0,
+    shared_segments INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (video_id, person_a, person_b),
+    FOREIGN KEY (video_id) REFERENCES videos(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS video_neighbors (
+    video_id INTEGER NOT NULL,
+    rank INTEGER NOT NULL,
+    neighbor_id INTEGER NOT NULL,
+    cosine REAL NOT NULL,
+    jaccard REAL NOT NULL,
+    common_persons INTEGER NOT NULL,
+    PRIMARY KEY (video_id, rank),
+    FOREIGN KEY (video_id) REFERENCES videos(id) ON DELETE CASCADE,
+    FOREIGN KEY (neighbor_id) REFERENCES videos(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS similarity_dirty (
+    video_id INTEGER PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 1
+);
+
+CREATE TABLE IF NOT EXISTS person_videos (
+    video_id INTEGER NOT NULL,
+    person_id INTEGER NOT NULL,
+    uploaded_at TIMESTAMP,
+    PRIMARY KEY (video_id, person_id),
+    FOREIGN KEY (video_id) REFERENCES videos(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS presence_bitmaps (
+    video_id INTEGER NOT NULL,
+    person_id INTEGER NOT NULL,
+    seconds INTEGER NOT NULL,
+    bitmap BLOB NOT NULL,
+    PRIMARY KEY (video_id, person_id),
+    FOREIGN KEY (video_id) REFERENCES videos(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS video_detections (
+    video_id INTEGER PRIMARY KEY,
+    detection_count INTEGER NOT NULL DEFAULT 0,
+    timestamps BLOB NOT NULL,
+    person_ids BLOB NOT NULL,
+    distances BLOB NOT NULL,
+    frame_numbers BLOB,
+    boxes BLOB,
+    threshold REAL NOT NULL DEFAULT 3.0,
+    min_length REAL NOT NULL DEFAULT 0,
+    max_distance REAL,
+    stats TEXT,
+    FOREIGN KEY (video_id) REFERENCES videos(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS daily_uploads (
+    day TEXT PRIMARY KEY,
+    video_count INTEGER NOT NULL DEFAULT 0,
+    appearance_count INTEGER NOT NULL DEFAULT 0,
+    screen_time REAL NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS daily_person_stats (
+    person_id INTEGER NOT NULL,
+    day TEXT NOT NULL,
+    video_count INTEGER NOT NULL DEFAULT 0,
+    appearance_count INTEGER NOT NULL DEFAULT 0,
+    screen_time REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (person_id, day),
+    FOREIGN KEY (person_id) REFERENCES persons(id) ON DELETE CASCADE
+);
+
 CREATE INDEX IF NOT EXISTS idx_video_appearances_video ON video_appearances(video_id);
 CREATE INDEX IF NOT EXISTS idx_video_appearances_person ON video_appearances(person_id);
 CREATE INDEX IF NOT EXISTS idx_video_tags_video ON video_tags(video_id);
 CREATE INDEX IF NOT EXISTS idx_notifications_read ON notifications(read);
 CREATE INDEX IF NOT EXISTS idx_notifications_created ON notifications(created_at);
+CREATE INDEX IF NOT EXISTS idx_person_stats_screen_time ON person_stats(total_screen_time);
+CREATE INDEX IF NOT EXISTS idx_co_appearances_b ON co_appearances(person_b);
+CREATE INDEX IF NOT EXISTS idx_co_appearance_overlaps_pair ON co_appearance_overlaps(person_a, person_b);
+CREATE INDEX IF NOT EXISTS idx_video_appearances_video_person ON video_appearances(video_id, person_id);
+CREATE INDEX IF NOT EXISTS idx_videos_uploaded ON videos(uploaded_at, id);
+CREATE INDEX IF NOT EXISTS idx_person_videos_recent ON person_videos(person_id, uploaded_at, video_id);
+CREATE INDEX IF NOT EXISTS idx_videos_appearance_count ON videos(appearance_count);
+CREATE INDEX IF NOT EXISTS idx_videos_unique_persons ON videos(unique_persons);
+CREATE INDEX IF NOT EXISTS idx_videos_uploaded_epoch ON videos(uploaded_epoch);
+CREATE INDEX IF NOT EXISTS idx_videos_upload_day ON videos(upload_day);
+CREATE INDEX IF NOT EXISTS idx_videos_upload_week ON videos(upload_week);
+CREATE INDEX IF NOT EXISTS idx_videos_upload_month ON videos(upload_month);
+CREATE INDEX IF NOT EXISTS idx_video_neighbors_neighbor ON video_neighbors(neighbor_id);
+
+-- Fecha de subida como epoch y claves de día/semana/mes, para filtrar y agrupar con índices
+CREATE TRIGGER IF NOT EXISTS videos_upload_buckets_insert AFTER INSERT ON videos
+BEGIN
+    UPDATE videos SET
+        uploaded_epoch = CAST(strftime('%s', new.uploaded_at) AS INTEGER),
+        upload_day = DATE(new.uploaded_at),
+        upload_week = strftime('%Y-%W', new.uploaded_at),
+        upload_month = strftime('%Y-%m', new.uploaded_at)
+    WHERE id = new.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS videos_upload_buckets_update AFTER UPDATE OF uploaded_at ON videos
+BEGIN
+    UPDATE videos SET
+        uploaded_epoch = CAST(strftime('%s', new.uploaded_at) AS INTEGER),
+        upload_day = DATE(new.uploaded_at),
+        upload_week = strftime('%Y-%W', new.uploaded_at),
+        upload_month = strftime('%Y-%m', new.uploaded_at)
+    WHERE id = new.id;
+END;
+
+-- Fecha de subida copiada en person_videos para paginar los videos de una persona
+CREATE TRIGGER IF NOT EXISTS videos_person_videos_uploaded AFTER UPDATE OF uploaded_at ON videos
+BEGIN
+    UPDATE person_videos SET uploaded_at = new.uploaded_at WHERE video_id = new.id;
+END;
+
+-- Videos subidos por día (las apariciones las suma DailyStats.apply_video)
+CREATE TRIGGER IF NOT EXISTS videos_daily_uploads_day AFTER UPDATE OF upload_day ON videos
+WHEN old.upload_day IS NOT new.upload_day
+BEGIN
+    UPDATE daily_uploads SET video_count = video_count - 1 WHERE day = old.upload_day;
+    DELETE FROM daily_uploads WHERE day = old.upload_day AND video_count <= 0 AND appearance_count <= 0;
+    INSERT INTO daily_uploads (day, video_count) SELECT new.upload_day, 1 WHERE new.upload_day IS NOT NULL
+    ON CONFLICT(day) DO UPDATE SET video_count = video_count + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS videos_daily_uploads_delete AFTER DELETE ON videos
+BEGIN
+    UPDATE daily_uploads SET video_count = video_count - 1 WHERE day = old.upload_day;
+    DELETE FROM daily_uploads WHERE day = old.upload_day AND video_count <= 0 AND appearance_count <= 0;
+END;
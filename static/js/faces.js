@@ -44,6 +44,33 @@ function renderFaces() {
     `).join('');
 }
 
+function renderPersonVideos(videos) {
+    return videos.map(video => `
+        <div class="bg-gray-700 p-4 rounded">
+            <h5 class="font-bold">${video.filename}</h5>
+            <p class="text-sm">Apariciones: ${video.total_appearances}</p>
+            <p class="text-sm">Tiempo total: ${video.total_duration_formatted}</p>
+            <div class="mt-2 text-sm">
+                ${video.appearances.map((a, i) => 
+                    `<div>${i+1}. ${a.start_formatted} - ${a.end_formatted}</div>`
+                ).join('')}
+            </div>
+        </div>
+    `).join('');
+}
+
+function updateLoadMoreButton(personId, nextAfter) {
+    const button = document.getElementById('loadMorePersonVideos');
+    if (!button) return;
+    
+    if (nextAfter) {
+        button.classList.remove('hidden');
+        button.onclick = () => loadMorePersonVideos(personId, nextAfter);
+    } else {
+        button.classList.add('hidden');
+    }
+}
+
 async function viewPersonStats(personId) {
     try {
         const response = await fetch(`/api/search/person/${personId}`);
@@ -53,33 +80,32 @@ async function viewPersonStats(personId) {
         html += `<p class="mb-2"><b>Total de videos:</b> ${data.total_videos}</p>`;
         
         if (data.videos.length > 0) {
-            html += '<div class="space-y-4 mt-4">';
-            data.videos.forEach(video => {
-                html += `
-                    <div class="bg-gray-700 p-4 rounded">
-                        <h5 class="font-bold">${video.filename}</h5>
-                        <p class="text-sm">Apariciones: ${video.total_appearances}</p>
-                        <p class="text-sm">Tiempo total: ${video.total_duration_formatted}</p>
-                        <div class="mt-2 text-sm">
-                            ${video.appearances.map((a, i) => 
-                                `<div>${i+1}. ${a.start_formatted} - ${a.end_formatted}</div>`
-                            ).join('')}
-                        </div>
-                    </div>
-                `;
-            });
-            html += '</div>';
+            html += `<div id="personVideosList" class="space-y-4 mt-4">${renderPersonVideos(data.videos)}</div>`;
+            html += '<button id="loadMorePersonVideos" class="hidden mt-4 px-4 py-2 bg-blue-600 hover:bg-blue-700 rounded text-sm transition w-full">Cargar más</button>';
         } else {
             html += '<p class="text-gray-400 mt-4">No aparece en ningún video procesado.</p>';
         }
         
         document.getElementById('statsContent').innerHTML = html;
+        updateLoadMoreButton(personId, data.next_after);
         document.getElementById('statsModal').classList.remove('hidden');
     } catch (error) {
         showMessage('Error al cargar estadísticas', 'error');
     }
 }
 
+async function loadMorePersonVideos(personId, after) {
+    try {
+        const response = await fetch(`/api/search/person/${personId}?after=${encodeURIComponent(after)}`);
+        const data = await response.json();
+        
+        document.getElementById('personVideosList').insertAdjacentHTML('beforeend', renderPersonVideos(data.videos));
+        updateLoadMoreButton(personId, data.next_after);
+    } catch (error) {
+        showMessage('Error al cargar más videos', 'error');
+    }
+}
+
 async function downloadPersonReport(personId) {
     try {
         window.location.href = `/api/reports/person/${personId}`;
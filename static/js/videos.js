@@ -17,7 +17,7 @@ function formatTime(seconds) {
 
 async function loadVideos() {
     try {
-        const response = await fetch('/api/videos/');
+        const response = await fetch('/api/videos/?include=analysis');
         videos = await response.json();
         renderVideos();
     } catch (error) {
@@ -0,0 +1,52 @@
+"""
+Respuestas JSON en streaming para los endpoints que devuelven listas.
+
+El arreglo se serializa elemento a elemento desde un iterador (normalmente
+filas leídas de un cursor con database.iter_query) y se envía en bloques,
+así la memoria no crece con el tamaño del resultado y el primer byte sale
+sin esperar a la última fila.
+"""
+from flask import Response
+import json
+
+CHUNK_SIZE = 64 * 1024
+
+def parse_fields(value):
+    """'id,filename' -> {'id', 'filename'}; None si no se indicó nada"""
+    if not value:
+        return None
+    fields = {field.strip() for field in value.split(',') if field.strip()}
+    return fields or None
+
+def stream_json_array(items, fields=None, omit=()):
+    """
+    Response con un arreglo JSON de los diccionarios de items
+    fields: si se indica, sólo se incluyen esas claves
+    omit: claves que se quitan cuando no se pidió una proyección
+    """
+    def generate():
+        chunk = ['[']
+        size = 1
+        first = True
+
+        for item in items:
+            if fields is not None:
+                item = {key: value for key, value in item.items() if key in fields}
+            elif omit:
+                item = {key: value for key, value in item.items() if key not in omit}
+
+            encoded = json.dumps(item, default=str)
+            if not first:
+                encoded = ',' + encoded
+            first = False
+
+            chunk.append(encoded)
+            size += len(encoded)
+            if size >= CHUNK_SIZE:
+                yield ''.join(chunk)
+                chunk, size = [], 0
+
+        chunk.append(']')
+        yield ''.join(chunk)
+
+    return Response(generate(), mimetype='application/json')
@@ -0,0 +1,213 @@
+"""
+Pruebas de la cola de tareas durable (services/task_store)
+Se ejecutan con pytest o directamente: python test_task_store.py
+
+Cada prueba usa una base de datos temporal con solo la tabla tasks.
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import database
+from services import task_store
+
+def _fresh_db():
+    database.DATABASE_PATH = os.path.join(tempfile.mkdtemp(), 'tasks.db')
+    task_store.ensure_task_table()
+
+def _dead_pid():
+    """Pid de un proceso que ya terminó"""
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+def _claim_all(worker, claimed):
+    while True:
+        task = task_store.claim(worker)
+        if task is None:
+            return
+        claimed.append(task[0])
+
+def test_claim_is_exclusive():
+    _fresh_db()
+    task_id = task_store.enqueue('cleanup', {'type': 'tasks'})
+    assert task_store.claim('host:1:a')[0] == task_id
+    assert task_store.claim('host:1:b') is None
+
+    # Varios workers en paralelo: cada tarea se reclama exactamente una vez
+    task_ids = [task_store.enqueue('cleanup', {'n': i}) for i in range(200)]
+    claimed = []
+    workers = [threading.Thread(target=_claim_all, args=(f'host:1:w{i}', claimed)) for i in range(8)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert sorted(claimed) == task_ids
+    assert task_store.counts()[task_store.RUNNING] == len(task_ids) + 1
+
+def test_claim_filters_task_types():
+    _fresh_db()
+    video = task_store.enqueue('process_video', {'video_id': 1})
+    cleanup = task_store.enqueue('cleanup', {'type': 'tasks'})
+    assert task_store.claim('host:1:a', exclude_types=('process_video',))[0] == cleanup
+    assert task_store.claim('host:1:b', exclude_types=('process_video',)) is None
+    assert task_store.claim('host:1:c', task_types=('process_video',))[0] == video
+
+def test_recover_dead_worker():
+    _fresh_db()
+    task_id = task_store.enqueue('process_video', {'video_id': 1})
+    task_store.claim(f'{task_store.HOSTNAME}:{_dead_pid()}:ProcessWorker-0')
+
+    # Con heartbeat reciente solo se recupera si se revisan los procesos
+    assert task_store.recover(task_store.STALE_AFTER) == 0
+    assert task_store.recover(task_store.STALE_AFTER, check_processes=True) == 1
+
+    task = task_store.get_task(task_store.task_key('process_video', task_id))
+    assert task['state'] == task_store.QUEUED
+    assert task['worker'] is None
+
+    row_id, _, payload = task_store.claim('host:1:a')
+    assert (row_id, payload) == (task_id, {'video_id': 1})
+    assert task_store.get_task(task_store.task_key('process_video', task_id))['attempts'] == 2
+
+def test_recover_stale_heartbeat_until_max_attempts():
+    _fresh_db()
+    task_id = task_store.enqueue('process_video', {'video_id': 1})
+    key = task_store.task_key('process_video', task_id)
+
+    for attempt in range(1, task_store.MAX_ATTEMPTS + 1):
+        task_store.claim(f'otro-equipo:1:w{attempt}')
+        # Un worker vivo que late no se toca
+        task_store.heartbeat([task_id])
+        assert task_store.recover(60) == 0
+        time.sleep(0.05)
+        assert task_store.recover(0.01) == 1
+
+    task = task_store.get_task(key)
+    assert task['state'] == task_store.FAILED
+    assert task['attempts'] == task_store.MAX_ATTEMPTS
+    assert task_store.claim('host:1:a') is None
+
+def test_stale_worker_cannot_finish_reclaimed_task():
+    _fresh_db()
+    task_id = task_store.enqueue('process_video', {'video_id': 1})
+    task_store.claim('otro-equipo:1:lento')
+    time.sleep(0.05)
+    assert task_store.recover(0.01) == 1
+    task_store.claim('otro-equipo:2:nuevo')
+
+    # El primer worker termina tarde: no puede cerrar el intento del segundo
+    assert task_store.complete(task_id, 'otro-equipo:1:lento', {'ok': True}) is False
+    assert task_store.fail(task_id, 'otro-equipo:1:lento', 'error') is False
+    task = task_store.get_task(task_store.task_key('process_video', task_id))
+    assert (task['state'], task['worker']) == (task_store.RUNNING, 'otro-equipo:2:nuevo')
+
+    assert task_store.complete(task_id, 'otro-equipo:2:nuevo', {'ok': True}) is True
+    assert task_store.get_task(task_store.task_key('process_video', task_id))['state'] == task_store.DONE
+
+def test_parent_closes_once():
+    _fresh_db()
+    closed = []
+    listener = closed.append
+    task_store.on_parent_closed(listener)
+    try:
+        parent = task_store.enqueue('batch_process', {'video_ids': list(range(40))})
+        task_store.claim('host:1:parent')
+        children = task_store.spawn_children(parent, 'batch_video', [{'video_id': i} for i in range(40)])
+        assert len(children) == 40
+
+        parent_key = task_store.task_key('batch_process', parent)
+        assert task_store.get_task(parent_key)['state'] == task_store.WAITING
+        # complete() del worker que repartió el lote no cierra la tarea padre
+        task_store.complete(parent, 'host:1:parent', {'total': 40})
+        assert task_store.get_task(parent_key)['state'] == task_store.WAITING
+        assert task_store.recover(0) == 0
+
+        def run(worker):
+            while True:
+                task = task_store.claim(worker, task_types=('batch_video',))
+                if task is None:
+                    return
+                row_id, _, payload = task
+                if payload['video_id'] % 4 == 0:
+                    task_store.fail(row_id, worker, 'sin rostros')
+                else:
+                    task_store.complete(row_id, worker, {'video_id': payload['video_id']})
+
+        workers = [threading.Thread(target=run, args=(f'host:1:w{i}',)) for i in range(6)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        assert len(closed) == 1
+        task = task_store.get_task(parent_key)
+        assert closed[0]['task_id'] == parent_key
+        assert task['state'] == task_store.DONE
+        assert task['children'] == {'total': 40, 'pending': 0, 'done': 30, 'failed': 10}
+        assert (task['result']['successful'], task['result']['failed']) == (30, 10)
+        assert [entry['video_id'] for entry in task['result']['results']] == list(range(40))
+    finally:
+        task_store._parent_listeners.remove(listener)
+
+def test_parent_closed_by_recover_and_empty_batch():
+    _fresh_db()
+    closed = []
+    listener = closed.append
+    task_store.on_parent_closed(listener)
+    try:
+        # Un lote vacío se cierra al repartirlo
+        empty = task_store.enqueue('batch_process', {'video_ids': []})
+        task_store.claim('host:1:parent')
+        assert task_store.spawn_children(empty, 'batch_video', []) == []
+        assert [task['task_id'] for task in closed] == [task_store.task_key('batch_process', empty)]
+
+        # La última hija agota sus intentos en recover(): también cierra el lote
+        parent = task_store.enqueue('batch_process', {'video_ids': [1]})
+        task_store.claim('host:1:parent')
+        task_store.spawn_children(parent, 'batch_video', [{'video_id': 1}])
+        for attempt in range(task_store.MAX_ATTEMPTS):
+            task_store.claim(f'otro-equipo:1:w{attempt}')
+            time.sleep(0.05)
+            task_store.recover(0.01)
+
+        assert len(closed) == 2
+        task = task_store.get_task(task_store.task_key('batch_process', parent))
+        assert task['state'] == task_store.DONE
+        assert task['result']['failed'] == 1
+    finally:
+        task_store._parent_listeners.remove(listener)
+
+def main():
+    print("🧪 Pruebas de la cola de tareas durable")
+    print("=" * 50)
+
+    tests = [
+        test_claim_is_exclusive,
+        test_claim_filters_task_types,
+        test_recover_dead_worker,
+        test_recover_stale_heartbeat_until_max_attempts,
+        test_stale_worker_cannot_finish_reclaimed_task,
+        test_parent_closes_once,
+        test_parent_closed_by_recover_and_empty_batch
+    ]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except AssertionError as e:
+            failed += 1
+            print(f"❌ {test.__name__}: {e}")
+
+    print("=" * 50)
+    print(f"{len(tests) - failed} de {len(tests)} pruebas correctas")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+import math
 import os
 
 def format_time(seconds):
@@ -6,6 +7,26 @@ def format_time(seconds):
     secs = int(seconds % 60)
     return f"{hours:02d}:{minutes:02d}:{secs:02d}"
 
+def parse_time(value):
+    """
+    Convierte 'HH:MM:SS', 'MM:SS' o segundos a segundos (float); None si no
+    es un tiempo válido (nan, inf o negativo tampoco lo son)
+    """
+    if value is None:
+        return None
+    
+    parts = str(value).strip().split(':')
+    try:
+        seconds = 0.0
+        for part in parts:
+            number = float(part)
+            if not math.isfinite(number) or number < 0:
+                return None
+            seconds = seconds * 60 + number
+        return seconds
+    except ValueError:
+        return None
+
 def ensure_instance_folders():
     folders = [
         os.path.join('instance', 'faces'),